@@ -1,41 +1,27 @@
 import re
 import sys
 import time
-from importlib import import_module
 
 from runcommands import arg, command
 from runcommands.util import abort
 
-from bycycle.core.model import get_engine, get_session_factory
-
 
 @command
-def bycycle(service: arg(choices=('lookup', 'route')), q):
+def bycycle(service: arg(choices=('autocomplete', 'lookup', 'route')), q):
     """Run a byCycle service."""
-    module_name = 'bycycle.core.service.{service}'.format(service=service)
-    module = import_module(module_name)
-    service_factory = getattr(module, 'Service')
-
     if service == 'route':
         q = re.split('\s+to\s+', q, re.I)
         if len(q) < 2:
             abort(1, 'Route must be specified as "A to B"')
 
-    engine = get_engine()
-    session_factory = get_session_factory(engine)
-    session = session_factory()
+    # Imported here so --help, etc don't pay for importing the services
+    from bycycle.core.app import App
 
-    start_time = time.time()
-    try:
-        service = service_factory(session)
-        response = service.query(q)
-    except Exception:
-        session.rollback()
-        raise
-    else:
-        session.close()
+    with App(pool_size=1, max_overflow=0) as app:
+        start_time = time.time()
+        response = app.query(service, q)
         print(response)
-    print('{:.2f} seconds'.format(time.time() - start_time))
+        print('{:.2f} seconds'.format(time.time() - start_time))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,231 @@
+"""Application container for byCycle services.
+
+An :class:`App` is intended to be created once per process and used for
+the life of the process (e.g., by a web server)::
+
+    app = App(mapbox_access_token='...', edge_store_path='edges.npz')
+    app.warm()
+
+    # Per request
+    route = app.query('route', ['NE 9th and Holladay', 'SE 21st and Clinton'])
+
+Threading model
+---------------
+
+An app can be used by many threads at once (e.g., by a threaded WSGI
+server):
+
+    - Each request gets its own session, scoped to the thread handling
+      the request (see :meth:`App.session`). Sessions, services, and the
+      ORM objects they load are never shared between threads, so the
+      cached properties on them don't need to be thread safe.
+
+    - Process-wide structures (edge store, autocomplete index, street
+      type map, geocoder) are read-only once they're published. They're
+      held in a :class:`Snapshot`, so they're read without locking and
+      replaced atomically by :meth:`App.reload`. Requests that are in
+      flight during a reload finish with the structures they started
+      with.
+
+"""
+import logging
+from contextlib import contextmanager
+
+from sqlalchemy.orm import scoped_session
+
+from bycycle.core.edgestore import EdgeStore
+from bycycle.core.model import (
+    USPSStreetSuffix,
+    get_engine,
+    get_replica_router,
+    get_session_factory,
+)
+from bycycle.core.service import AutocompleteService, LookupService, RouteService
+from bycycle.core.service.autocomplete import AutocompleteIndex
+from bycycle.core.service.lookup.service import GEOCODE_CACHE
+from bycycle.core.util import Snapshot
+
+
+log = logging.getLogger(__name__)
+
+
+class App:
+
+    """Long-lived container for byCycle services.
+
+    An app owns a pooled database engine and hands out short-lived
+    sessions. State that's expensive to set up is created once and
+    shared by all the services the app creates:
+
+        - the Mapbox geocoder (and its pool of HTTP connections)
+        - the in-process geocode cache
+        - the street type map used to normalize addresses
+        - the edge store used to make directions
+        - the autocomplete index
+
+    Args:
+        engine: Database engine; if not specified, one is created via
+            :func:`get_engine` using the pool settings below and
+            ``engine_args``
+        pool_size: Number of connections to keep in the pool
+        max_overflow: Number of connections that can be opened beyond
+            ``pool_size`` when the pool is exhausted
+        pool_pre_ping: Test connections when they're checked out of
+            the pool so stale connections are replaced transparently
+        pool_recycle: Replace connections after this many seconds
+            (-1 means never)
+        statement_timeout: Max time in milliseconds a statement can
+            run before the database cancels it (PostgreSQL only)
+        engine_args: Additional args for :func:`get_engine` (e.g.,
+            ``host``, ``database``, or read ``replicas``)
+        config: Config passed to every service (see the services for
+            available options)
+
+    """
+
+    service_types = {
+        'autocomplete': AutocompleteService,
+        'lookup': LookupService,
+        'route': RouteService,
+    }
+
+    def __init__(self, engine=None, *, pool_size=5, max_overflow=10, pool_pre_ping=True,
+                 pool_recycle=-1, statement_timeout=None, engine_args=None, **config):
+        if engine is None:
+            engine_args = dict(engine_args or {})
+            engine_args.setdefault('pool_size', pool_size)
+            engine_args.setdefault('max_overflow', max_overflow)
+            engine_args.setdefault('pool_pre_ping', pool_pre_ping)
+            engine_args.setdefault('pool_recycle', pool_recycle)
+            if statement_timeout is not None:
+                connect_args = engine_args.setdefault('connect_args', {})
+                connect_args['options'] = f'-c statement_timeout={int(statement_timeout)}'
+            engine = get_engine(**engine_args)
+        self.engine = engine
+        self.session_factory = get_session_factory(engine)
+        self.scoped_session = scoped_session(self.session_factory)
+        self.config = config
+        self.shared_config = Snapshot(loader=self.make_shared_config)
+
+    @contextmanager
+    def session(self):
+        """Get the session for the current request.
+
+        Sessions are scoped to the current thread. Nested uses of this
+        in the same thread (e.g., when a request handler queries several
+        services) get the same session; it's removed when the outermost
+        block exits.
+
+        The session is rolled back if an exception is raised and is
+        always closed on exit, returning its connection to the pool.
+
+        """
+        registry = self.scoped_session
+        if registry.registry.has():
+            yield registry()
+            return
+        session = registry()
+        try:
+            yield session
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            registry.remove()
+
+    def get_service_config(self):
+        """Get config for services, including shared state.
+
+        Shared state is created the first time this is called.
+
+        """
+        return self.shared_config.get()
+
+    def make_shared_config(self, full=False):
+        """Make service config with new shared state.
+
+        If ``full`` is set, the edge store (if configured) and the
+        autocomplete index are loaded too. Otherwise, they're loaded on
+        demand by the services.
+
+        """
+        config = self.config.copy()
+        access_token = config.get('mapbox_access_token')
+        if access_token and 'geocoder' not in config:
+            from bycycle.core.service.lookup.geocoder import MapboxGeocoder
+            config['geocoder'] = MapboxGeocoder(
+                access_token,
+                host=config.get('mapbox_host'),
+                max_connections=config.get('mapbox_max_connections', 4),
+            )
+        config.setdefault('geocode_cache', GEOCODE_CACHE)
+        with self.session() as session:
+            if 'street_type_map' not in config:
+                config['street_type_map'] = USPSStreetSuffix.get_street_type_map(session)
+            if full:
+                edge_store_path = config.get('edge_store_path')
+                if 'edge_store' not in config and edge_store_path:
+                    config['edge_store'] = EdgeStore.load(edge_store_path)
+                if 'autocomplete_index' not in config:
+                    config['autocomplete_index'] = AutocompleteIndex.from_session(session)
+        return config
+
+    def get_service(self, name, session):
+        """Create service ``name`` that uses ``session``.
+
+        Services are cheap to create since they use the app's shared
+        state.
+
+        """
+        service_type = self.service_types[name]
+        return service_type(session, **self.get_service_config())
+
+    def query(self, service, q, **kwargs):
+        """Query ``service`` in a new session."""
+        with self.session() as session:
+            return self.get_service(service, session).query(q, **kwargs)
+
+    def warm(self):
+        """Create all shared state up front.
+
+        Otherwise, it's created on demand, which makes the first
+        requests slow. The edge store and autocomplete index are loaded
+        if configured/available.
+
+        """
+        self.reload()
+        log.info('Warmed byCycle app')
+
+    def reload(self):
+        """Recreate all shared state and swap it in.
+
+        The new state is built completely before it's published, so
+        requests aren't blocked while reloading. This can be used to
+        pick up a rebuilt edge store or new streets, for example.
+
+        """
+        old_config = self.shared_config.swap(self.make_shared_config(full=True))
+        if old_config is not None:
+            geocoder = old_config.get('geocoder')
+            if geocoder is not None and geocoder is not self.config.get('geocoder'):
+                # In-flight requests might still be using the old
+                # geocoder, but closing it only closes idle connections
+                geocoder.close()
+
+    def dispose(self):
+        """Close all pooled connections."""
+        self.scoped_session.remove()
+        config = self.shared_config.value
+        geocoder = None if config is None else config.get('geocoder')
+        if geocoder is not None:
+            geocoder.close()
+        router = get_replica_router(self.engine)
+        if router is not None:
+            router.dispose()
+        self.engine.dispose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.dispose()
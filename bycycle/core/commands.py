@@ -1,6 +1,7 @@
 import code
 import csv
 import datetime
+import json
 import os.path
 import shutil
 import sys
@@ -17,14 +18,27 @@ from sqlalchemy.engine import create_engine as base_create_engine
 from sqlalchemy.engine.url import URL
 from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.orm import sessionmaker
-
-from bycycle.core.model import Base, MVTCache, USPSStreetSuffix
+from sqlalchemy.sql import func
+
+from bycycle.core.model import (
+    Base,
+    GeocodeCache,
+    Intersection,
+    MVTCache,
+    NodeEdge,
+    Street,
+    USPSStreetSuffix,
+)
 from bycycle.core.osm import OSMDataFetcher, OSMGraphBuilder, OSMImporter
 
 
 __all__ = [
+    'backfill_street_bearings',
+    'backfill_street_meters',
     'clean',
     'clear_mvt_cache',
+    'export_geocode_cache',
+    'purge_geocode_cache',
     'db',
     'create_db',
     'create_graph',
@@ -34,12 +48,14 @@ __all__ = [
     'fetch_osm_data',
     'init',
     'install',
+    'load_node_edges',
     'load_osm_data',
     'load_usps_street_suffixes',
     'make_dist',
     'reload_graph',
     'shell',
     'test',
+    'upgrade_db',
 ]
 
 
@@ -53,7 +69,7 @@ def init():
     - Create database
     - Create database schema
     - Load USPS street suffixes
-    - Fetch OSM data
+    - Fetch OSM data (highways, addresses, and places)
     - Load OSM data and create routing graph
 
     """
@@ -62,6 +78,8 @@ def init():
     create_schema()
     load_usps_street_suffixes()
     fetch_osm_data()
+    fetch_osm_data(query='addresses')
+    fetch_osm_data(query='places')
     load_osm_data()
 
 
@@ -255,6 +273,7 @@ def create_db(db, superuser='postgres', superuser_password='postgres',
     app_engine = create_engine(database=database, **common_engine_args)
 
     execute(app_engine, 'CREATE EXTENSION postgis')
+    execute(app_engine, 'CREATE EXTENSION pg_trgm')
 
     app_engine.dispose()
 
@@ -298,6 +317,174 @@ def clear_mvt_cache(db):
     printer.success(f'{count} MVT cache record{ess} deleted')
 
 
+@command
+def purge_geocode_cache(db, older_than: arg(type=int) = None):
+    """Purge the geocode cache.
+
+    By default, all entries are deleted. Pass --older-than N to delete
+    only entries that were created more than N days ago.
+
+    """
+    engine = create_engine(**db)
+    table = GeocodeCache.__table__
+    q = table.delete()
+    if older_than is not None:
+        cutoff = datetime.datetime.now(datetime.timezone.utc)
+        cutoff -= datetime.timedelta(days=older_than)
+        q = q.where(table.c.created_at < cutoff)
+    result = engine.execute(q)
+    count = result.rowcount
+    ess = '' if count == 1 else 's'
+    printer.success(f'{count} geocode cache record{ess} deleted')
+    engine.dispose()
+
+
+@command
+def export_geocode_cache(db, path='-'):
+    """Export the geocode cache as JSON lines.
+
+    Each line is a JSON object with the query, geocoder options, raw
+    geocoder data, and cache stats for one entry. If path is a single
+    dash, the entries are written to stdout.
+
+    """
+    engine = create_engine(**db)
+    table = GeocodeCache.__table__
+    q = table.select().order_by(table.c.query)
+    fp = sys.stdout if path == '-' else open(path, 'w')
+    count = 0
+    try:
+        for r in engine.execute(q):
+            entry = {
+                'key': r.key,
+                'query': r.query,
+                'options': r.options,
+                'data': r.data,
+                'created_at': r.created_at.isoformat(),
+                'accessed_at': r.accessed_at.isoformat() if r.accessed_at else None,
+                'hits': r.hits,
+            }
+            fp.write(json.dumps(entry))
+            fp.write('\n')
+            count += 1
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+    engine.dispose()
+    if path != '-':
+        ess = '' if count == 1 else 's'
+        printer.success(f'{count} geocode cache record{ess} exported to {path}')
+
+
+@command
+def backfill_street_bearings(db, rebuild_graph=True):
+    """Fill in street bearings on existing databases.
+
+    Adds the street.start_bearing and street.end_bearing columns if
+    they don't exist and sets them for streets that don't have them
+    yet. Bearings are computed the same way they are on import.
+
+    The graph and edge store are rebuilt afterwards unless
+    --no-rebuild-graph is passed.
+
+    """
+    engine = create_engine(**db)
+    table = Street.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            f'ALTER TABLE {table.name} '
+            f'ADD COLUMN IF NOT EXISTS start_bearing FLOAT, '
+            f'ADD COLUMN IF NOT EXISTS end_bearing FLOAT')
+        count = Street.update_bearings(conn)
+    engine.dispose()
+    ess = '' if count == 1 else 's'
+    printer.success(f'Bearings set for {count} street{ess}')
+    if rebuild_graph and count:
+        create_graph(db)
+
+
+@command
+def backfill_street_meters(db, rebuild_graph=True):
+    """Fill in street lengths on existing databases.
+
+    Adds the street.meters column if it doesn't exist and sets it for
+    streets that don't have it yet. Lengths are computed by PostGIS on
+    the WGS84 spheroid, which agrees with the lengths computed on
+    import to within millimeters.
+
+    The graph and edge store are rebuilt afterwards unless
+    --no-rebuild-graph is passed.
+
+    """
+    engine = create_engine(**db)
+    table = Street.__table__
+    with engine.begin() as conn:
+        conn.execute(f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS meters FLOAT')
+        result = conn.execute(
+            table.update()
+            .where(table.c.meters.is_(None))
+            .values(meters=func.ST_Length(func.Geography(table.c.geom))))
+        count = result.rowcount
+    engine.dispose()
+    ess = '' if count == 1 else 's'
+    printer.success(f'Length set for {count} street{ess}')
+    if rebuild_graph and count:
+        create_graph(db)
+
+
+@command
+def load_node_edges(db):
+    """Link intersections to streets and name intersections.
+
+    This is done on import. This command can be used to add the
+    node_edge table and intersection names to existing databases; it's
+    required for cross street lookups on databases imported by older
+    versions (see ``upgrade-db``).
+
+    """
+    engine = create_engine(**db)
+    with engine.begin() as conn:
+        conn.execute(
+            f'ALTER TABLE {Intersection.__tablename__} ADD COLUMN IF NOT EXISTS name VARCHAR')
+        NodeEdge.__table__.create(conn, checkfirst=True)
+        count = NodeEdge.populate(conn)
+        Intersection.update_names(conn)
+    engine.dispose()
+    printer.success(f'{count} intersection/street links created')
+
+
+@command
+def upgrade_db(db, rebuild_graph=True):
+    """Upgrade an existing database to the current schema.
+
+    Databases created by older versions need this before they're used
+    with this version. In particular, cross street lookups (and other
+    intersection queries) won't find anything until the node_edge table
+    has been loaded.
+
+    Steps:
+
+    - Create tables that don't exist yet
+    - Fill in street lengths and bearings
+    - Link intersections to streets and name intersections
+    - Rebuild the routing graph (unless --no-rebuild-graph is passed)
+
+    Each step only changes what's missing or out of date, so this can
+    be run more than once.
+
+    """
+    engine = create_engine(**db)
+    with engine.begin() as conn:
+        conn.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        Base.metadata.create_all(bind=conn)
+    engine.dispose()
+    backfill_street_meters(db, rebuild_graph=False)
+    backfill_street_bearings(db, rebuild_graph=False)
+    load_node_edges(db)
+    if rebuild_graph:
+        create_graph(db)
+
+
 @command
 def load_usps_street_suffixes(db):
     """Load USPS street suffixes into database."""
@@ -358,13 +545,20 @@ def load_osm_data(
     directory='../osm',
     graph_path='../graph.marshal',
     streets=True,
+    addresses=True,
     places=True,
     actions: arg(container=tuple, type=int) = (),
     show_actions: arg(short_option='-a') = False,
     log_to=None
 ):
-    """Read OSM data from file and load into database."""
-    importer = OSMImporter(bbox, directory, graph_path, db, streets, places, actions)
+    """Read OSM data from file and load into database.
+
+    Addresses are read from addresses.json and/or buildings.json and
+    places are read from places.json in the OSM data directory (see
+    fetch-osm-data --query).
+
+    """
+    importer = OSMImporter(bbox, directory, graph_path, db, streets, addresses, places, actions)
     if show_actions:
         printer.header('Available actions:')
         for action in importer.all_actions:
@@ -0,0 +1,259 @@
+from pathlib import Path
+
+import numpy as np
+
+from bycycle.core.geometry import LineString, lengths_in_meters
+from bycycle.core.model.edge import Edge
+
+
+__all__ = ['EdgeStore']
+
+
+class EdgeStore:
+
+    """Packed, read-only store of street edges.
+
+    Holds the geometries of all streets as a single flat array of
+    coordinates along with per-edge offsets into that array, and the
+    attributes needed to make directions (length, names, highway type,
+    and node IDs) as parallel arrays. Strings are interned in a single
+    table and referenced by index.
+
+    This lets the route service build directions without querying the
+    database or hydrating ORM objects.
+
+    Edges are sorted by ID so edges can be located by binary search.
+
+    """
+
+    array_names = (
+        'ids',
+        'offsets',
+        'coords',
+        'meters',
+        'start_node_ids',
+        'end_node_ids',
+        'name_ids',
+        'display_name_ids',
+        'highway_ids',
+        'strings',
+        'start_bearings',
+        'end_bearings',
+    )
+
+    def __init__(self, ids, offsets, coords, meters, start_node_ids, end_node_ids, name_ids,
+                 display_name_ids, highway_ids, strings, start_bearings=None,
+                 end_bearings=None):
+        if start_bearings is None or end_bearings is None:
+            start_bearings, end_bearings = self.compute_bearings(coords, offsets)
+        self.ids = ids
+        self.offsets = offsets
+        self.coords = coords
+        self.meters = meters
+        self.start_node_ids = start_node_ids
+        self.end_node_ids = end_node_ids
+        self.name_ids = name_ids
+        self.display_name_ids = display_name_ids
+        self.highway_ids = highway_ids
+        self.strings = strings
+        self.start_bearings = start_bearings
+        self.end_bearings = end_bearings
+        self._node_index = None
+        # Stores are shared by threads, so they're made read-only
+        for name in self.array_names:
+            array = getattr(self, name)
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+
+    @classmethod
+    def build(cls, rows):
+        """Build store from street rows.
+
+        Args:
+            rows: Iterable of street rows (or :class:`Street`s)
+
+        """
+        rows = sorted(rows, key=lambda r: r.id)
+        num_rows = len(rows)
+
+        strings = []
+        string_ids = {}
+
+        def intern(s):
+            if not s:
+                return -1
+            string_id = string_ids.get(s)
+            if string_id is None:
+                string_id = string_ids[s] = len(strings)
+                strings.append(s)
+            return string_id
+
+        ids = np.empty(num_rows, dtype=np.int64)
+        offsets = np.zeros(num_rows + 1, dtype=np.int64)
+        meters = np.empty(num_rows, dtype=np.float64)
+        start_node_ids = np.empty(num_rows, dtype=np.int64)
+        end_node_ids = np.empty(num_rows, dtype=np.int64)
+        name_ids = np.empty(num_rows, dtype=np.int32)
+        display_name_ids = np.empty(num_rows, dtype=np.int32)
+        highway_ids = np.empty(num_rows, dtype=np.int32)
+        coords = []
+
+        for i, r in enumerate(rows):
+            geom = r.geom
+            geom_coords = geom.coords
+            ids[i] = r.id
+            offsets[i + 1] = offsets[i] + len(geom_coords)
+            row_meters = getattr(r, 'meters', None)
+            meters[i] = np.nan if row_meters is None else row_meters
+            start_node_ids[i] = r.start_node_id
+            end_node_ids[i] = r.end_node_id
+            name_ids[i] = intern(r.name)
+            display_name_ids[i] = intern(r.name or r.description or f'[{r.highway}]')
+            highway_ids[i] = intern(r.highway)
+            coords.extend(geom_coords)
+
+        coords = np.array(coords, dtype=np.float64).reshape(-1, 2)
+        strings = np.array(strings, dtype=np.str_)
+
+        # Compute lengths that weren't stored in the database
+        missing = np.isnan(meters)
+        if missing.any():
+            meters[missing] = lengths_in_meters(coords, offsets)[missing]
+
+        return cls(
+            ids, offsets, coords, meters, start_node_ids, end_node_ids, name_ids,
+            display_name_ids, highway_ids, strings)
+
+    @classmethod
+    def compute_bearings(cls, coords, offsets):
+        """Compute forward start and end bearings for all edges.
+
+        Matches :func:`bycycle.core.geometry.get_bearing`.
+
+        Returns:
+            tuple: (start bearings, end bearings)
+
+        """
+        starts = offsets[:-1]
+        ends = offsets[1:]
+        start_deltas = coords[starts + 1] - coords[starts]
+        end_deltas = coords[ends - 1] - coords[ends - 2]
+        start_bearings = np.degrees(np.arctan2(start_deltas[:, 0], start_deltas[:, 1]))
+        end_bearings = np.degrees(np.arctan2(end_deltas[:, 0], end_deltas[:, 1]))
+        start_bearings[start_bearings < 0] += 360
+        end_bearings[end_bearings < 0] += 360
+        return start_bearings, end_bearings
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            # Stores saved before bearings were added don't have them;
+            # they'll be computed on load.
+            arrays = {name: data[name] for name in cls.array_names if name in data}
+        return cls(**arrays)
+
+    def save(self, path):
+        path = Path(path)
+        with path.open('wb') as fp:
+            np.savez(fp, **{name: getattr(self, name) for name in self.array_names})
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index_of(self, edge_ids):
+        """Get store indexes of ``edge_ids``.
+
+        Raises:
+            KeyError: If any of the edges isn't in the store
+
+        """
+        edge_ids = np.asarray(edge_ids, dtype=np.int64)
+        indexes = np.searchsorted(self.ids, edge_ids)
+        indexes[indexes == len(self.ids)] = 0
+        if len(self.ids) == 0 or not np.array_equal(self.ids[indexes], edge_ids):
+            missing = set(edge_ids.tolist()) - set(self.ids.tolist())
+            raise KeyError(f'Edges not in store: {sorted(missing)}')
+        return indexes
+
+    def get_string(self, string_id):
+        return None if string_id < 0 else str(self.strings[string_id])
+
+    def get_strings(self, string_ids):
+        """Get strings for ``string_ids`` as an object array.
+
+        Missing strings (ID -1) are ``None``.
+
+        """
+        strings = np.empty(len(string_ids), dtype=object)
+        present = string_ids >= 0
+        strings[present] = self.strings[string_ids[present]].tolist()
+        return strings
+
+    def get_coords(self, i):
+        """Get coordinates of edge at index ``i`` as an (N, 2) array."""
+        offsets = self.offsets
+        return self.coords[offsets[i]:offsets[i + 1]]
+
+    def get_edges(self, edge_ids):
+        """Get edges (:class:`Edge`) with IDs ``edge_ids`` (in the same order).
+
+        The store doesn't have base costs or one way flags, so those
+        are ``None``.
+
+        """
+        get_string = self.get_string
+        edges = []
+        for i in self.index_of(edge_ids).tolist():
+            edges.append(Edge(
+                int(self.ids[i]),
+                get_string(self.name_ids[i]),
+                get_string(self.display_name_ids[i]),
+                get_string(self.highway_ids[i]),
+                int(self.start_node_ids[i]),
+                int(self.end_node_ids[i]),
+                LineString(self.get_coords(i)),
+                float(self.meters[i]),
+                None,
+                float(self.start_bearings[i]),
+                float(self.end_bearings[i]),
+                None,
+            ))
+        return edges
+
+    def get_node_edges(self, node_id):
+        """Get store indexes of edges that start or end at node."""
+        node_ids, edge_indexes = self.node_index
+        start = np.searchsorted(node_ids, node_id, side='left')
+        end = np.searchsorted(node_ids, node_id, side='right')
+        return edge_indexes[start:end]
+
+    def get_street_names(self, node_id):
+        """Get names of streets that start or end at node."""
+        get_string = self.get_string
+        name_ids = self.name_ids
+        return [get_string(name_ids[i]) for i in self.get_node_edges(node_id).tolist()]
+
+    @property
+    def node_index(self):
+        """Node IDs (sorted) & corresponding edge indexes.
+
+        Sorted by node ID then edge ID, which is the same order
+        :meth:`NodeEdge.get_streets` uses, so toward streets are the
+        same with or without the store. Like the ``node_edge`` table,
+        there's only one entry for an edge that starts and ends at the
+        same node.
+
+        Built on first access. If several threads race to build it,
+        they'll build the same index and one of them wins, so this
+        doesn't need a lock.
+
+        """
+        if self._node_index is None:
+            num_edges = len(self.ids)
+            loops = self.start_node_ids == self.end_node_ids
+            node_ids = np.concatenate((self.start_node_ids, self.end_node_ids[~loops]))
+            edge_indexes = np.concatenate((np.arange(num_edges), np.flatnonzero(~loops)))
+            # Edges are sorted by ID, so edge index order is ID order
+            order = np.lexsort((edge_indexes, node_ids))
+            self._node_index = (node_ids[order], edge_indexes[order])
+        return self._node_index
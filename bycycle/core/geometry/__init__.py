@@ -1,3 +1,4 @@
+from .lazy import *
 from .linestring import LineString
 from .point import Point
 from .proj import *
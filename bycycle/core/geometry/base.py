@@ -1,4 +1,4 @@
-from shapely import wkb, wkt
+from shapely import get_coordinates, wkb, wkt
 from shapely.errors import ReadingError
 from shapely.geometry import mapping
 
@@ -60,4 +60,22 @@ class Base:
         return self.__str__()
 
     def __json__(self, request):
-        return mapping(self)
+        return geometry_mapping(self)
+
+
+def geometry_mapping(geom):
+    """Get GeoJSON-like mapping for ``geom``.
+
+    The same as :func:`shapely.geometry.mapping` but faster for points
+    and linestrings because coordinates are converted from an array in
+    one go instead of one coordinate at a time.
+
+    """
+    geom_type = geom.geom_type
+    if geom_type == 'LineString':
+        coords = get_coordinates(geom, include_z=geom.has_z).tolist()
+        return {'type': geom_type, 'coordinates': tuple(map(tuple, coords))}
+    if geom_type == 'Point' and not geom.is_empty:
+        coords = get_coordinates(geom, include_z=geom.has_z).tolist()
+        return {'type': geom_type, 'coordinates': tuple(coords[0])}
+    return mapping(geom)
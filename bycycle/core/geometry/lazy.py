@@ -0,0 +1,141 @@
+from types import MethodType
+
+from shapely import wkb
+
+from .base import geometry_mapping
+
+
+__all__ = [
+    'LazyGeometry',
+    'unwrap',
+]
+
+
+class LazyGeometry:
+
+    """Geometry that's parsed from WKB on first use.
+
+    The geometry attributes of ORM models are loaded as lazy geometries
+    so that WKB is only parsed for objects whose geometries are actually
+    used (many code paths only need names and IDs). Core selects that
+    need real geometries (e.g., the OSM importer and edge loading)
+    select them eagerly (see :class:`bycycle.core.geometry.sqltypes.Geometry`).
+
+    A lazy geometry stands in for the geometry it wraps: attributes and
+    methods (``coords``, ``project``, ``interpolate``, etc.) are
+    delegated to the parsed geometry, it compares equal to it, and it
+    reports ``geometry_type`` as its class, so ``isinstance`` checks
+    work without parsing the WKB.
+
+    Shapely's vectorized functions and the methods of real geometries
+    only accept real geometries though, so lazy geometries have to be
+    passed through :func:`unwrap` before being passed to them.
+
+    Args:
+        value: WKB as bytes, a memoryview, or a hex string
+        geometry_type: Geometry class (:class:`Point` or
+            :class:`LineString`)
+
+    """
+
+    __slots__ = ('_wkb', '_geometry_type', '_geom')
+
+    def __init__(self, value, geometry_type):
+        self._wkb = value
+        self._geometry_type = geometry_type
+        self._geom = None
+
+    @property
+    def __class__(self):
+        return self._geometry_type
+
+    @property
+    def is_loaded(self):
+        return self._geom is not None
+
+    def load(self):
+        """Parse WKB (once) and return the resulting geometry.
+
+        Lazy geometries can be shared between threads, so the WKB is
+        kept after it's parsed: a thread that sees the geometry hasn't
+        been loaded yet can always parse the WKB. If two threads load
+        the geometry at the same time, the WKB is parsed twice, which
+        is harmless.
+
+        """
+        geom = self._geom
+        if geom is None:
+            geom = self._geom = from_wkb(self._wkb, self._geometry_type)
+        return geom
+
+    def __getattr__(self, name):
+        value = getattr(self.load(), name)
+        if isinstance(value, MethodType):
+            return _unwrap_args(value)
+        return value
+
+    def __json__(self, request=None):
+        return geometry_mapping(self.load())
+
+    def __reduce__(self):
+        return self.load().__reduce__()
+
+    def __eq__(self, other):
+        return self.load() == unwrap(other)
+
+    def __ne__(self, other):
+        return self.load() != unwrap(other)
+
+    def __hash__(self):
+        return hash(self.load())
+
+    def __bool__(self):
+        return bool(self.load())
+
+    def __and__(self, other):
+        return self.load() & unwrap(other)
+
+    def __or__(self, other):
+        return self.load() | unwrap(other)
+
+    def __sub__(self, other):
+        return self.load() - unwrap(other)
+
+    def __xor__(self, other):
+        return self.load() ^ unwrap(other)
+
+    def __str__(self):
+        return str(self.load())
+
+    def __repr__(self):
+        return repr(self.load())
+
+
+def _unwrap_args(method):
+    def wrapper(*args, **kwargs):
+        args = [unwrap(arg) for arg in args]
+        kwargs = {name: unwrap(value) for name, value in kwargs.items()}
+        return method(*args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+def from_wkb(value, geometry_type):
+    """Parse WKB (bytes, a memoryview, or a hex string)."""
+    if isinstance(value, str):
+        geom = wkb.loads(value, hex=True)
+    else:
+        geom = wkb.loads(bytes(value))
+    return geometry_type(geom)
+
+
+def unwrap(geom):
+    """Get the real geometry for ``geom``, which might be lazy.
+
+    Objects that aren't lazy geometries are returned as is.
+
+    """
+    if type(geom) is LazyGeometry:
+        return geom.load()
+    return geom
@@ -1,7 +1,5 @@
 from functools import lru_cache
 
-import pyproj
-
 from shapely.ops import transform
 
 
@@ -19,17 +17,22 @@ WEB_SRID = 3857
 
 @lru_cache()
 def make_projector(input_srid=DEFAULT_SRID, output_srid=WEB_SRID):
+    # pyproj is slow to import and transformers are slow to create, so
+    # both are deferred until a projector is first needed
+    import pyproj
     from_proj = pyproj.Proj(init='epsg:{}'.format(input_srid))
     to_proj = pyproj.Proj(init='epsg:{}'.format(output_srid))
     transformer = pyproj.Transformer.from_proj(from_proj, to_proj)
     return transformer.transform
 
 
-def reproject(geom, projector=make_projector()):
+def reproject(geom, projector=None):
     """Reproject geometry.
 
     By default, the geometry will be transformed from lat/long (4326) to
     web mercator (3857).
 
     """
+    if projector is None:
+        projector = make_projector()
     return transform(projector, geom)
@@ -1,48 +1,129 @@
-from sqlalchemy.types import UserDefinedType
+import numpy as np
 
+import shapely
 from shapely import wkb
 
-from bycycle.core.geometry import LineString, Point
+from sqlalchemy.sql import func, type_coerce
+from sqlalchemy.types import UserDefinedType
+
+from bycycle.core.geometry import LazyGeometry, LineString, Point, unwrap
+from bycycle.core.geometry.lazy import from_wkb
+
+
+def to_ewkb(geoms, srid):
+    """Encode ``geoms`` as EWKB with ``srid`` in one vectorized call.
+
+    The results can be used as values for :class:`Geometry` columns,
+    which is much faster than encoding geometries one at a time when
+    inserting many rows.
+
+    Returns:
+        list: EWKB bytes for each geometry
+
+    """
+    geoms = np.array(list(geoms), dtype=object)
+    return shapely.to_wkb(shapely.set_srid(geoms, srid), include_srid=True).tolist()
 
 
 class Geometry(UserDefinedType):
 
-    """PostGIS Geometry Type."""
+    """PostGIS Geometry Type.
+
+    Geometries are sent to the database as binary EWKB and selected as
+    binary WKB, which avoids formatting and parsing WKT on the way in
+    and hex-encoding WKB on the way out.
+
+    If ``lazy`` is set, selected geometries are :class:`LazyGeometry`\s
+    that aren't parsed until they're used. This is intended for ORM
+    model attributes. Lazy geometries can't be passed directly to
+    Shapely, so Core selects that need real geometries should select
+    geometry columns via :func:`eager` (or :func:`eager_columns`).
 
-    def __init__(self, srid, type_=None):
+    """
+
+    # The type's state (SRID, laziness, and geometry type, which is
+    # determined by the class) is hashable, so statements that use it
+    # can be cached. SQLAlchemy checks this on each class, so it's set
+    # on the subclasses below too.
+    cache_ok = True
+
+    def __init__(self, srid, type_=None, lazy=False):
         self.type = type_ or self.__class__.__name__
         self.srid = srid
+        self.lazy = lazy
 
     def get_col_spec(self):
         return 'GEOMETRY({0.type}, {0.srid})'.format(self)
 
+    def bind_expression(self, bindvalue):
+        return func.ST_GeomFromEWKB(bindvalue, type_=self)
+
     def bind_processor(self, dialect):
         """Convert from Python type to database type."""
+        srid = self.srid
+
         def process(value):
-            """``value`` is a Shapely geometry object."""
+            """``value`` is a Shapely geometry object or EWKB.
+
+            EWKB is passed through as is (see :func:`to_ewkb`).
+
+            """
             if value is not None:
-                return 'SRID={};{}'.format(self.srid, value.wkt)
+                if isinstance(value, bytes):
+                    return value
+                return wkb.dumps(unwrap(value), srid=srid)
         return process
 
+    def column_expression(self, col):
+        return func.ST_AsBinary(col, type_=self)
+
     def result_processor(self, dialect, coltype):
         """Convert from database type to Python type."""
+        geometry_type = self.geometry_type
+        load = LazyGeometry if self.lazy else from_wkb
+
         def process(value):
-            """``value`` is a hex-encoded WKB string."""
+            """``value`` is WKB.
+
+            It will normally be binary (bytes or a memoryview, depending
+            on the driver), but hex-encoded WKB is handled too (e.g.,
+            when a geometry is selected in a text query).
+
+            """
             if value is not None:
-                return self.geometry_type(wkb.loads(value, hex=True))
+                return load(value, geometry_type)
         return process
 
 
+def eager(column):
+    """Select geometry ``column`` as real geometries.
+
+    For when the column's type is lazy.
+
+    """
+    type_ = column.type
+    eager_type = type_.__class__(type_.srid, type_.type, lazy=False)
+    return type_coerce(column, eager_type).label(column.name)
+
+
+def eager_columns(table):
+    """Get ``table``'s columns with geometry columns made eager."""
+    return [eager(c) if isinstance(c.type, Geometry) else c for c in table.c]
+
+
 class POINT(Geometry):
 
+    cache_ok = True
     geometry_type = Point
 
 
 class LINESTRING(Geometry):
 
+    cache_ok = True
     geometry_type = LineString
 
 
 class MULTILINESTRING(Geometry):
 
+    cache_ok = True
     geometry_type = LineString
@@ -1,11 +1,30 @@
 import re
+from functools import lru_cache
+from math import atan2, degrees
 
-import pyproj
+import numpy as np
 
 from bycycle.core.geometry import Point, LineString
 
+from .lazy import unwrap
 
-__all__ = ['is_coord', 'length_in_meters', 'split_line', 'trim_line']
+
+__all__ = [
+    'decode_polyline',
+    'encode_polyline',
+    'get_bearing',
+    'get_cumulative_distances',
+    'get_end_bearings',
+    'get_geod',
+    'is_coord',
+    'length_in_meters',
+    'lengths_in_meters',
+    'pack_coords',
+    'reverse_bearing',
+    'simplify_line',
+    'split_line',
+    'trim_line',
+]
 
 
 def is_coord(value):
@@ -21,12 +40,52 @@ def is_coord(value):
     return re.fullmatch(r'\d+(\.\d+)?', value) is not None
 
 
-def length_in_meters(geom, geod=pyproj.Geod(ellps='WGS84')):
+def get_bearing(p1, p2):
+    """Get bearing from ``p1`` to ``p2``.
+
+    The bearing is in degrees clockwise from north in [0, 360]. It's
+    calculated in the plane from lat/long coordinates, which is good
+    enough for determining turn directions.
+
+    """
+    dx = p2[0] - p1[0]
+    dy = p2[1] - p1[1]
+    deg = degrees(atan2(dx, dy))
+    while deg < 0:
+        deg += 360
+    return deg
+
+
+def get_end_bearings(geom):
+    """Get bearings at the start and end of linestring ``geom``.
+
+    Returns:
+        tuple: (start bearing, end bearing)
+
+    """
+    coords = geom.coords
+    return get_bearing(coords[0], coords[1]), get_bearing(coords[-2], coords[-1])
+
+
+def reverse_bearing(bearing):
+    """Get bearing in the opposite direction."""
+    return (bearing + 180) % 360
+
+
+@lru_cache()
+def get_geod(ellps='WGS84'):
+    import pyproj
+    return pyproj.Geod(ellps=ellps)
+
+
+def length_in_meters(geom, geod=None):
     """Get length of geometry in meters.
 
     Assumes ``geom`` is lat/long (4326).
 
     """
+    if geod is None:
+        geod = get_geod()
     distance = 0
     for c, d in zip(geom.coords[:-1], geom.coords[1:]):
         *azimuths, segment_distance = geod.inv(c[0], c[1], d[0], d[1])
@@ -34,23 +93,159 @@ def length_in_meters(geom, geod=pyproj.Geod(ellps='WGS84')):
     return distance
 
 
-def split_line(line, point):
-    """Split linestring at point."""
+# Mean radius of the earth in meters
+EARTH_RADIUS = 6371008.8
+
+
+def lengths_in_meters(coords, offsets, approximate=False, geod=None):
+    """Get lengths of many linestrings in meters.
+
+    Assumes coordinates are lat/long (4326). All the segments are
+    measured in a single vectorized call.
+
+    Args:
+        coords: (N, 2) array of the coordinates of all the linestrings
+            (see :func:`pack_coords`)
+        offsets: Array of offsets into ``coords``; linestring ``i``
+            is ``coords[offsets[i]:offsets[i + 1]]``
+        approximate: Use an equirectangular approximation instead of
+            geodesic distances; this is much faster and is accurate to
+            within a fraction of a percent for short segments away from
+            the poles (e.g., the streets in a city's bbox)
+
+    Returns:
+        array: The length of each linestring; linestrings with fewer
+            than two coordinates have length 0
+
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    num_lines = max(len(offsets) - 1, 0)
+    if len(coords) < 2:
+        return np.zeros(num_lines, dtype=np.float64)
+    coords = np.asarray(coords, dtype=np.float64)
+    starts = coords[:-1]
+    ends = coords[1:]
+
+    if approximate:
+        lons = np.radians(starts[:, 0]), np.radians(ends[:, 0])
+        lats = np.radians(starts[:, 1]), np.radians(ends[:, 1])
+        dx = (lons[1] - lons[0]) * np.cos((lats[0] + lats[1]) / 2)
+        dy = lats[1] - lats[0]
+        distances = np.hypot(dx, dy) * EARTH_RADIUS
+    else:
+        if geod is None:
+            geod = get_geod()
+        *azimuths, distances = geod.inv(starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1])
+
+    # Segments that span two linestrings don't count
+    distances = np.asarray(distances, dtype=np.float64)
+    boundaries = offsets[1:-1]
+    boundaries = boundaries[(boundaries > 0) & (boundaries < len(coords))]
+    distances[boundaries - 1] = 0
+
+    # Segment k is from coordinate k to k + 1, so linestring i's
+    # segments are offsets[i] up to (not including) offsets[i + 1] - 1;
+    # that's none if it has fewer than two coordinates
+    cumulative = np.zeros(len(distances) + 1, dtype=np.float64)
+    np.cumsum(distances, out=cumulative[1:])
+    line_starts = offsets[:-1]
+    line_ends = np.maximum(offsets[1:] - 1, line_starts)
+    return cumulative[line_ends] - cumulative[line_starts]
+
+
+def pack_coords(geoms):
+    """Pack the coordinates of ``geoms`` into a single array.
+
+    Returns:
+        tuple: (N, 2) array of coordinates and array of offsets (see
+            :func:`lengths_in_meters`)
+
+    """
+    coords = [np.asarray(geom.coords, dtype=np.float64) for geom in geoms]
+    offsets = np.zeros(len(coords) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in coords], out=offsets[1:])
+    return np.concatenate(coords), offsets
+
+
+def get_cumulative_distances(line):
+    """Get the distance along ``line`` to each of its vertices.
+
+    Distances are planar, in the units of ``line``'s coordinates (i.e.,
+    the same as :meth:`LineString.project`). These can be computed once
+    per line and passed to :func:`split_line` and :func:`trim_line`.
+
+    Returns:
+        array: Cumulative distances
+        None: If ``line`` isn't simple or is closed, in which case the
+            distances along it don't necessarily match the projected
+            distances of its vertices
+
+    """
+    if line.is_closed or not line.is_simple:
+        return None
+    coords = np.asarray(line.coords, dtype=np.float64)[:, :2]
+    deltas = np.diff(coords, axis=0)
+    distances = np.zeros(len(coords), dtype=np.float64)
+    np.cumsum(np.sqrt(deltas[:, 0] * deltas[:, 0] + deltas[:, 1] * deltas[:, 1]), out=distances[1:])
+    return distances
+
+
+def _find_vertices_near(distances, distance):
+    """Find range of vertices that are about ``distance`` along a line.
+
+    Vertices before the range are definitely before ``distance`` and
+    vertices after it are definitely after. Vertices in the range have
+    to be checked with :meth:`LineString.project` because cumulative
+    distances can differ from projected distances by rounding.
+
+    """
+    tolerance = distances[-1] * 1e-9
+    i = int(np.searchsorted(distances, distance - tolerance, side='left'))
+    j = int(np.searchsorted(distances, distance + tolerance, side='right'))
+    return i, j
+
+
+def split_line(line, point, distances=None):
+    """Split linestring at point.
+
+    ``distances`` are the cumulative distances of ``line``'s vertices
+    (see :func:`get_cumulative_distances`). They're computed if not
+    passed. Using them, only vertices very close to ``point`` have to be
+    projected onto ``line``.
+
+    """
+    line, point = unwrap(line), unwrap(point)
     distance = line.project(point)
     coords = line.coords
     shared_coords = list(point.coords)
+    last = len(coords) - 1
+
+    if distances is None:
+        distances = get_cumulative_distances(line)
+
+    if distances is None:
+        coords1 = [coords[0]]
+        near = range(1, last)
+    else:
+        i, j = _find_vertices_near(distances, distance)
+        i = max(i, 1)
+        j = max(min(j, last), i)
+        coords1 = coords[:i]
+        near = range(i, j)
 
-    coords1 = [coords[0]]
     coords2 = []
 
-    for c in coords[1:-1]:
-        p = Point(c)
-        p_distance = line.project(p)
+    for k in near:
+        c = coords[k]
+        p_distance = line.project(Point(c))
         if p_distance < distance:
             coords1.append(c)
         elif p_distance > distance:
             coords2.append(c)
 
+    if distances is not None:
+        coords2.extend(coords[j:last])
+
     coords2.append(coords[-1])
 
     coords1 = coords1 + shared_coords
@@ -59,17 +254,107 @@ def split_line(line, point):
     return LineString(coords1), LineString(coords2)
 
 
-def trim_line(line, point1, point2):
+def trim_line(line, point1, point2, distances=None):
+    """Trim linestring to the part between two points.
+
+    See :func:`split_line` regarding ``distances``.
+
+    """
+    line, point1, point2 = unwrap(line), unwrap(point1), unwrap(point2)
     distance1 = line.project(point1)
     distance2 = line.project(point2)
     if distance1 > distance2:
         point1, point2 = point2, point1
         distance1, distance2 = distance2, distance1
     coords = [point1]
-    for c in line.coords:
-        p = Point(c)
-        p_distance = line.project(p)
-        if distance1 <= p_distance <= distance2:
-            coords.append(c)
+    line_coords = line.coords
+
+    def add_if_between(indexes):
+        for k in indexes:
+            c = line_coords[k]
+            p_distance = line.project(Point(c))
+            if distance1 <= p_distance <= distance2:
+                coords.append(c)
+
+    if distances is None:
+        distances = get_cumulative_distances(line)
+
+    if distances is None:
+        add_if_between(range(len(line_coords)))
+    else:
+        i1, j1 = _find_vertices_near(distances, distance1)
+        i2, j2 = _find_vertices_near(distances, distance2)
+        middle_end = max(i2, j1)
+        add_if_between(range(i1, j1))
+        coords.extend(line_coords[j1:middle_end])
+        add_if_between(range(middle_end, j2))
+
     coords.append(point2)
     return LineString(coords)
+
+
+# Approximate length of a degree of latitude in meters
+METERS_PER_DEGREE = 111320
+
+
+def simplify_line(line, tolerance):
+    """Simplify ``line``, preserving topology.
+
+    Args:
+        line: Lat/long (4326) linestring
+        tolerance: Max distance in meters a simplified line may deviate
+            from ``line``; this is converted to degrees using the length
+            of a degree of latitude, so it's approximate
+
+    """
+    simplified = line.simplify(tolerance / METERS_PER_DEGREE, preserve_topology=True)
+    return LineString(simplified.coords)
+
+
+def encode_polyline(coords, precision=5):
+    """Encode coordinates as a Google-style encoded polyline.
+
+    Args:
+        coords: Sequence of (x, y), i.e. (longitude, latitude), pairs
+        precision: Number of decimal places to keep; 5 is the standard
+            precision, but some clients use 6
+
+    Returns:
+        str: Encoded polyline (with latitude first in each pair, per
+            the format)
+
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if not len(coords):
+        return ''
+    values = np.round(coords[:, 1::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    deltas = np.where(deltas < 0, ~(deltas << 1), deltas << 1).tolist()
+    chars = []
+    for value in deltas:
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return ''.join(chars)
+
+
+def decode_polyline(polyline, precision=5):
+    """Decode Google-style encoded polyline.
+
+    Returns:
+        list: (x, y), i.e. (longitude, latitude), pairs
+
+    """
+    values = []
+    value = shift = 0
+    for char in polyline:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    factor = 10 ** precision
+    coords = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / factor
+    return [(x, y) for (y, x) in coords.tolist()]
@@ -2,28 +2,91 @@ import inspect
 
 from sqlalchemy.engine import create_engine
 from sqlalchemy.engine.url import URL
-from sqlalchemy.orm import configure_mappers, sessionmaker
+from sqlalchemy.orm import sessionmaker
 
 from .base import Base, Entity
+from .address import Address
+from .edge import Edge
+from .geocode import GeocodeCache
 from .intersection import Intersection
 from .lookup import LookupResult
 from .mvt import MVTCache
+from .nodeedge import NodeEdge
+from .place import Place
 from .route import Route
 from .street import Street
+from .replica import ReplicaRouter, RoutingSession, get_replica_router, set_replica_router
 from .suffix import USPSStreetSuffix
+from .util import StatementCacheStats, get_statement_cache_stats
 
 
-configure_mappers()
+# NOTE: Mappers aren't configured here since that's slow. SQLAlchemy
+#       configures them automatically when they're first used (e.g.,
+#       on the first query).
 
 
-def get_engine(**kwargs):
+def get_engine(replicas=None, max_replica_lag=30, replica_check_interval=5,
+               replica_check_timeout=2, **kwargs):
+    """Get engine for primary database.
+
+    If ``replicas`` are specified, sessions created by
+    :func:`get_session_factory` send reads to the replicas (see
+    :class:`RoutingSession`).
+
+    Args:
+        replicas: Read replica URLs or dicts of :func:`make_url` args;
+            args that aren't specified in a dict default to the
+            primary's (e.g., ``{'host': 'replica-1'}``)
+        max_replica_lag: Max replication lag in seconds before reads
+            fall back to the primary
+        replica_check_interval: How often to check replica lag and
+            availability in seconds
+        replica_check_timeout: Max time in seconds a replica check can
+            take before the replica is considered unavailable
+        kwargs: :func:`make_url` args plus args for
+            :func:`sqlalchemy.create_engine`; engine args apply to
+            replicas too
+
+    """
     url_kwargs = {}
     url_params = make_url.signature.parameters
     for name in tuple(kwargs):
         if name in url_params:
             url_kwargs[name] = kwargs.pop(name)
     url = make_url(**url_kwargs)
-    return create_engine(url, **kwargs)
+    engine = create_engine(url, **kwargs)
+    get_statement_cache_stats(engine)
+    if replicas:
+        replica_engines = []
+        for replica in replicas:
+            if isinstance(replica, dict):
+                replica = make_url(**{**url_kwargs, **replica})
+            replica_engine = create_engine(replica, **kwargs)
+            get_statement_cache_stats(replica_engine)
+            replica_engines.append(replica_engine)
+        router = ReplicaRouter(
+            engine, replica_engines, max_lag=max_replica_lag,
+            check_interval=replica_check_interval, check_timeout=replica_check_timeout)
+        set_replica_router(engine, router)
+    return engine
+
+
+def get_async_engine(driver='postgresql+asyncpg', **kwargs):
+    """Get asyncio engine (requires the ``async`` extra).
+
+    Takes the same args as :func:`get_engine`.
+
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+    url_kwargs = {'driver': driver}
+    url_params = make_url.signature.parameters
+    for name in tuple(kwargs):
+        if name in url_params:
+            url_kwargs[name] = kwargs.pop(name)
+    url = make_url(**url_kwargs)
+    engine = create_async_engine(url, **kwargs)
+    get_statement_cache_stats(engine.sync_engine)
+    return engine
 
 
 def make_url(driver='postgresql', user='bycycle', password='bycycle', host='localhost', port=None,
@@ -37,11 +100,19 @@ make_url.signature = inspect.signature(make_url)
 
 
 def get_session_factory(engine):
+    router = get_replica_router(engine)
+    if router is not None:
+        return sessionmaker(bind=engine, class_=RoutingSession, router=router)
     factory = sessionmaker()
     factory.configure(bind=engine)
     return factory
 
 
+def get_async_session_factory(engine):
+    from sqlalchemy.ext.asyncio import AsyncSession
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
 __all__ = [
     name for (name, obj) in globals().items()
     if (
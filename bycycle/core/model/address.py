@@ -0,0 +1,49 @@
+from sqlalchemy.schema import Column, Index
+from sqlalchemy.sql import func
+from sqlalchemy.types import BigInteger, Integer, String
+
+from bycycle.core.geometry import DEFAULT_SRID
+from bycycle.core.geometry.sqltypes import POINT
+from bycycle.core.model import Base
+
+
+class Address(Base):
+
+    """Street address imported from OSM ``addr:*`` tags.
+
+    Addresses come from nodes and from buildings (ways) that are tagged
+    with a house number and street. For buildings, the location is the
+    centroid of the building outline.
+
+    """
+
+    __tablename__ = 'address'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    osm_id = Column(BigInteger)
+    osm_type = Column(String)
+
+    # House number as tagged (e.g., "123" or "123A")
+    house_number = Column(String, nullable=False)
+
+    # Numeric part of house number, used for interpolation
+    number = Column(Integer, nullable=True)
+
+    # Normalized street name
+    street = Column(String, nullable=False)
+
+    unit = Column(String)
+    city = Column(String)
+    postcode = Column(String)
+
+    geom = Column(POINT(DEFAULT_SRID, lazy=True))
+
+    @property
+    def name(self):
+        return f'{self.house_number} {self.street}'
+
+    def __str__(self):
+        return self.name
+
+
+Index('ix_address_street_number', func.lower(Address.street), Address.number)
@@ -1,4 +1,5 @@
 from collections.abc import Mapping, Sequence
+from operator import attrgetter
 
 from sqlalchemy.schema import MetaData
 from sqlalchemy.ext.declarative import declarative_base
@@ -39,40 +40,83 @@ class Entity(object):
 
     def __json__(self, request=None):
         data = {}
-
-        fields = self.json_fields
-        default_include = (k for k in self.__dict__ if not k.startswith('_'))
-        default_exclude = ('json_fields',)
-
-        if fields == '*':
-            # Include all public attributes by default
-            include = default_include
-            exclude = default_exclude
-        elif isinstance(fields, Sequence) and not isinstance(fields, str):
-            # Include the specified fields
-            include = fields
-            exclude = ()
-        elif isinstance(fields, Mapping):
-            include = fields.get('include', default_include)
-            exclude = fields.get('exclude', default_exclude)
-        else:
-            raise ValueError('Bad JSON field spec: {}'.format(fields))
-
-        fields = set(include)
-        if '*' in fields:
-            fields.remove('*')
-            fields |= set(default_include)
-        fields -= set(exclude)
-
-        for field in fields:
-            v = self
-            for name in field.split('.'):
-                v = getattr(v, name)
-            if hasattr(v, '__json__'):
+        for field, get_value in get_json_plan(self):
+            v = get_value(self)
+            if has_json_method(type(v)):
                 v = v.__json__(request)
             data[field] = v
         return data
 
 
+# Plans are keyed on class and JSON fields spec. When the spec depends
+# on an instance's public attributes, the instance's attribute names
+# are part of the key too.
+JSON_PLANS = {}
+
+# Type => whether type has a __json__ method
+JSON_TYPES = {}
+
+
+def get_json_plan(obj):
+    """Get JSON plan for ``obj`` (an :class:`Entity`).
+
+    A plan is a tuple of (field, getter) pairs, where the getter
+    retrieves the field's value (including dotted fields) from the
+    object. A plan is computed once per class and fields spec (see
+    :attr:`Entity.json_fields`).
+
+    Fields are ordered the same as when the plan is computed on every
+    call, so the resulting data is the same.
+
+    """
+    fields = obj.json_fields
+    if isinstance(fields, Mapping):
+        uses_attrs = 'include' not in fields or '*' in fields['include']
+    else:
+        uses_attrs = '*' in fields
+    key = (obj.__class__, id(fields), tuple(obj.__dict__) if uses_attrs else None)
+    entry = JSON_PLANS.get(key)
+    if entry is not None and entry[0] is fields:
+        return entry[1]
+    plan = tuple((field, attrgetter(field)) for field in get_json_field_names(obj, fields))
+    # The spec is kept so its ID can't be reused by another spec
+    JSON_PLANS[key] = (fields, plan)
+    return plan
+
+
+def get_json_field_names(obj, fields):
+    """Get names of JSON fields for ``obj`` according to ``fields``."""
+    default_include = (k for k in obj.__dict__ if not k.startswith('_'))
+    default_exclude = ('json_fields',)
+
+    if fields == '*':
+        # Include all public attributes by default
+        include = default_include
+        exclude = default_exclude
+    elif isinstance(fields, Sequence) and not isinstance(fields, str):
+        # Include the specified fields
+        include = fields
+        exclude = ()
+    elif isinstance(fields, Mapping):
+        include = fields.get('include', default_include)
+        exclude = fields.get('exclude', default_exclude)
+    else:
+        raise ValueError('Bad JSON field spec: {}'.format(fields))
+
+    fields = set(include)
+    if '*' in fields:
+        fields.remove('*')
+        fields |= set(default_include)
+    fields -= set(exclude)
+    return fields
+
+
+def has_json_method(type_):
+    result = JSON_TYPES.get(type_)
+    if result is None:
+        result = JSON_TYPES[type_] = hasattr(type_, '__json__')
+    return result
+
+
 metadata = MetaData(naming_convention=NAMING_CONVENTION)
 Base = declarative_base(metadata=metadata, cls=Entity)
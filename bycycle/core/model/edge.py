@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+from bycycle.core.geometry import get_end_bearings, length_in_meters, reverse_bearing
+
+
+class Edge(namedtuple('Edge', (
+        'id',
+        'name',
+        'display_name',
+        'highway',
+        'start_node_id',
+        'end_node_id',
+        'geom',
+        'meters',
+        'base_cost',
+        'start_bearing',
+        'end_bearing',
+        'oneway_bicycle',
+))):
+
+    """Lightweight, immutable street edge.
+
+    Holds the attributes of a :class:`Street` that are needed for
+    routing and directions. Used for temporary edges created by
+    splitting streets, for edges loaded from an :class:`EdgeStore`, and
+    for streets loaded from the database as Core rows, so no ORM
+    instances need to be created for them.
+
+    Bearings are in the forward direction (start node => end node).
+
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_street(cls, street, **attrs):
+        """Make edge from a :class:`Street` or street row.
+
+        Missing lengths and bearings are computed from the street's
+        geometry. ``attrs`` override the street's attributes.
+
+        """
+        geom = street.geom
+        meters = street.meters
+        if meters is None:
+            meters = length_in_meters(geom)
+        start_bearing, end_bearing = street.start_bearing, street.end_bearing
+        if start_bearing is None or end_bearing is None:
+            start_bearing, end_bearing = get_end_bearings(geom)
+        edge = cls(
+            street.id,
+            street.name,
+            street.name or street.description or f'[{street.highway}]',
+            street.highway,
+            street.start_node_id,
+            street.end_node_id,
+            geom,
+            meters,
+            street.base_cost,
+            start_bearing,
+            end_bearing,
+            street.oneway_bicycle,
+        )
+        return edge._replace(**attrs) if attrs else edge
+
+    def get_bearings(self, reverse=False):
+        """Get start and end bearings.
+
+        If ``reverse`` is set, the bearings are for traversing the edge
+        in reverse (end node => start node).
+
+        """
+        if reverse:
+            return reverse_bearing(self.end_bearing), reverse_bearing(self.start_bearing)
+        return self.start_bearing, self.end_bearing
+
+    def __str__(self):
+        return self.display_name
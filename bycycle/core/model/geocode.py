@@ -0,0 +1,133 @@
+import hashlib
+import json
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import Column
+from sqlalchemy.sql import bindparam, func, select
+from sqlalchemy.types import DateTime, Integer, JSON, String
+
+from bycycle.core.model import Base
+
+
+@contextmanager
+def begin(bind):
+    """Begin a transaction on engine or connection ``bind``.
+
+    Yields a connection to execute statements with. (A connection's
+    :meth:`begin` yields a transaction rather than a connection.)
+
+    """
+    if isinstance(bind, Connection):
+        with bind.begin():
+            yield bind
+    else:
+        with bind.begin() as connection:
+            yield connection
+
+class GeocodeCache(Base):
+
+    """Persistent cache of raw geocoder results.
+
+    Entries are keyed by the normalized query string *and* the options
+    that affect the geocoder's results (bounding box, center, etc), so
+    changing the configured region won't return stale results.
+
+    """
+
+    __tablename__ = 'geocode_cache'
+
+    key = Column(String, primary_key=True)
+    query = Column(String, nullable=False)
+    options = Column(JSON)
+    data = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    accessed_at = Column(DateTime(timezone=True), nullable=True)
+    hits = Column(Integer, nullable=False, server_default='0')
+
+    @classmethod
+    def normalize_query(cls, query):
+        return ' '.join(query.lower().split())
+
+    @classmethod
+    def make_key(cls, query, **options):
+        """Make cache key for ``query`` and geocoder ``options``."""
+        query = cls.normalize_query(query)
+        key = json.dumps([query, options], sort_keys=True)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get_data(cls, bind, key, ttl=None):
+        """Get cached data for ``key``.
+
+        This only reads from the database, so ``bind`` can be a read
+        replica. Hits are recorded separately (see :meth:`record_hits`).
+
+        Args:
+            bind: Engine or connection
+            key: Cache key (see :meth:`make_key`)
+            ttl: If specified, entries older than this (in seconds)
+                are ignored
+
+        Returns:
+            object: Cached data or ``None`` if there's no entry for
+                ``key`` (or the entry has expired)
+
+        """
+        table = cls.__table__
+        c = table.c
+        q = select([c.data]).where(c.key == key)
+        if ttl is not None:
+            q = q.where(c.created_at > func.now() - timedelta(seconds=ttl))
+        return bind.execute(q).scalar()
+
+    @classmethod
+    def record_hits(cls, bind, keys):
+        """Record cache hits for ``keys`` in a single batch.
+
+        Args:
+            bind: Engine or connection for the primary database
+            keys: Cache keys, once per hit
+
+        """
+        counts = Counter(keys)
+        if not counts:
+            return
+        c = cls.__table__.c
+        q = (
+            cls.__table__.update()
+            .where(c.key == bindparam('hit_key'))
+            .values(hits=c.hits + bindparam('hit_count'), accessed_at=func.now())
+        )
+        rows = [{'hit_key': key, 'hit_count': count} for key, count in counts.items()]
+        with begin(bind) as connection:
+            connection.execute(q, rows)
+
+    @classmethod
+    def set_data(cls, bind, key, query, data, **options):
+        """Add or replace cache entry for ``key``.
+
+        ``bind`` is an engine or connection for the primary database.
+
+        """
+        table = cls.__table__
+        q = pg_insert(table).values(
+            key=key,
+            query=cls.normalize_query(query),
+            options=options,
+            data=data,
+        )
+        q = q.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={
+                'data': q.excluded.data,
+                'created_at': func.now(),
+                'accessed_at': None,
+                'hits': 0,
+            },
+        )
+        with begin(bind) as connection:
+            connection.execute(q)
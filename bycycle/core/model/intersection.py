@@ -1,6 +1,9 @@
+from itertools import groupby
+
 from sqlalchemy.orm import relationship
 from sqlalchemy.schema import Column
-from sqlalchemy.types import BigInteger, Integer
+from sqlalchemy.sql import bindparam, select
+from sqlalchemy.types import BigInteger, String
 
 from bycycle.core.geometry import DEFAULT_SRID
 from bycycle.core.geometry.sqltypes import POINT
@@ -12,7 +15,10 @@ class Intersection(Base):
     __tablename__ = 'intersection'
 
     id = Column(BigInteger, primary_key=True)
-    geom = Column(POINT(DEFAULT_SRID))
+    geom = Column(POINT(DEFAULT_SRID, lazy=True))
+
+    # Cross street name; see :meth:`update_names`
+    _name = Column('name', String)
 
     json_fields = {
         'include': ['*', 'name'],
@@ -33,19 +39,52 @@ class Intersection(Base):
         names = sorted(names.values())
         return ' & '.join(names[:2])
 
+    @classmethod
+    def update_names(cls, bind, batch_size=1000):
+        """Precompute cross street names of all intersections.
+
+        Requires the ``node_edge`` table to be populated (see
+        :meth:`NodeEdge.populate`).
+
+        """
+        table = cls.__table__
+        node_edge_table = NodeEdge.__table__
+        street_table = Street.__table__
+        q = (
+            select([table.c.id, street_table.c.name])
+            .select_from(
+                table
+                .outerjoin(node_edge_table, node_edge_table.c.node_id == table.c.id)
+                .outerjoin(street_table, street_table.c.id == node_edge_table.c.edge_id))
+            .order_by(table.c.id, street_table.c.id)
+        )
+        update = (
+            table.update()
+            .where(table.c.id == bindparam('node_id'))
+            .values(name=bindparam('node_name'))
+        )
+        rows = []
+        for node_id, group in groupby(bind.execute(q).fetchall(), key=lambda r: r.id):
+            rows.append({'node_id': node_id, 'node_name': cls.name_for_cross_streets(group)})
+            if len(rows) >= batch_size:
+                bind.execute(update, rows)
+                rows.clear()
+        if rows:
+            bind.execute(update, rows)
+
     @property
     def name(self):
-        return self.name_for_cross_streets(self.streets)
+        name = self._name
+        if name is None:
+            # Not precomputed (e.g., a synthetic intersection)
+            name = self.name_for_cross_streets(self.streets)
+        return name
 
 
 from .street import Street
+from .nodeedge import NodeEdge
 
 
+# Same order as NodeEdge.get_streets() and EdgeStore.get_street_names()
 Intersection.streets = relationship(
-    Street,
-    primaryjoin=(
-        (Intersection.id == Street.start_node_id) |
-        (Intersection.id == Street.end_node_id)
-    ),
-    viewonly=True,
-)
+    Street, secondary=NodeEdge.__table__, order_by=Street.id, viewonly=True)
@@ -1,4 +1,8 @@
-from . import Entity
+import copy
+
+from bycycle.core.geometry import unwrap
+
+from . import Base, Entity
 
 
 class LookupResult(Entity):
@@ -45,8 +49,43 @@ class LookupResult(Entity):
         self.attribution = attribution
         self.data = data
 
+    def detach(self):
+        """Copy result without references to database objects.
+
+        The closest object (and normalized input, if it's a database
+        object) are replaced with plain copies of their JSON data and
+        geometries are parsed, so the copy doesn't depend on the
+        session it was loaded in and can be shared with other threads
+        and processes.
+
+        """
+        result = copy.copy(self)
+        result.normalized_input = detach(self.normalized_input)
+        result.geom = unwrap(self.geom)
+        result.closest_object = detach(self.closest_object)
+        return result
+
     def __str__(self):
         return '\n'.join(str(attr) for attr in (self.name, self.geom))
 
     def __eq__(self, other):
         return self.id == other.id
+
+
+class DetachedObject(Entity):
+
+    """Plain copy of a database object's JSON data."""
+
+    def __init__(self, obj):
+        self.__dict__.update(obj.__json__())
+
+
+def detach(obj):
+    """Replace database object with a :class:`DetachedObject`.
+
+    Other objects are returned as is (geometries are parsed).
+
+    """
+    if isinstance(obj, Base):
+        return DetachedObject(obj)
+    return unwrap(obj)
@@ -0,0 +1,86 @@
+from sqlalchemy.schema import Column, ForeignKey, Index
+from sqlalchemy.sql import lambda_stmt, select, union
+from sqlalchemy.types import BigInteger
+
+from bycycle.core.model import Base
+
+from .intersection import Intersection
+from .street import Street
+
+
+class NodeEdge(Base):
+
+    """Adjacency of intersections (nodes) and streets (edges).
+
+    There's a row for each end of each street. This replaces joining
+    intersections to streets on either of the street's node IDs, which
+    can't use a single index.
+
+    """
+
+    __tablename__ = 'node_edge'
+
+    node_id = Column(BigInteger, ForeignKey(Intersection.id), primary_key=True)
+    edge_id = Column(BigInteger, ForeignKey(Street.id), primary_key=True)
+
+    __table_args__ = (
+        Index('ix_node_edge_edge_id', 'edge_id'),
+    )
+
+    @classmethod
+    def populate(cls, bind):
+        """Replace all rows using the node IDs of all streets.
+
+        Returns:
+            int: Number of rows inserted
+
+        """
+        table = cls.__table__
+        street_table = Street.__table__
+        c = street_table.c
+        q = union(
+            select([c.start_node_id, c.id]).where(c.start_node_id.isnot(None)),
+            select([c.end_node_id, c.id]).where(c.end_node_id.isnot(None)),
+        )
+        bind.execute(table.delete())
+        result = bind.execute(table.insert().from_select(['node_id', 'edge_id'], q))
+        return result.rowcount
+
+    @classmethod
+    def get_streets(cls, bind, node_ids):
+        """Get streets at intersections without loading full streets.
+
+        Only the street ID, name, and node IDs are selected, so no
+        geometries are decoded and no ORM objects are created.
+
+        Args:
+            bind: Session, engine, or connection
+            node_ids: Intersection IDs
+
+        Streets are ordered by ID at each intersection (the same order
+        as :meth:`EdgeStore.get_street_names`).
+
+        Returns:
+            dict: Intersection ID => list of street rows, each with
+                ``node_id``, ``id``, ``name``, ``start_node_id``, and
+                ``end_node_id`` attributes
+
+        """
+        table = cls.__table__
+        street_table = Street.__table__
+        q = lambda_stmt(lambda: (
+            select([
+                table.c.node_id,
+                street_table.c.id,
+                street_table.c.name,
+                street_table.c.start_node_id,
+                street_table.c.end_node_id,
+            ])
+            .select_from(table.join(street_table, street_table.c.id == table.c.edge_id))
+            .where(table.c.node_id.in_(node_ids))
+            .order_by(table.c.node_id, street_table.c.id)
+        ))
+        streets = {node_id: [] for node_id in node_ids}
+        for row in bind.execute(q):
+            streets[row.node_id].append(row)
+        return streets
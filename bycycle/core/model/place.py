@@ -0,0 +1,56 @@
+from sqlalchemy.schema import Column, Index
+from sqlalchemy.types import BigInteger, String
+
+from bycycle.core.geometry import DEFAULT_SRID
+from bycycle.core.geometry.sqltypes import POINT
+from bycycle.core.model import Base
+
+
+class Place(Base):
+
+    """Place/point of interest imported from OSM.
+
+    Places are named nodes and ways tagged as amenities, shops, etc.
+    For ways, the location is the centroid of the way.
+
+    .. note:: The name index requires the ``pg_trgm`` extension.
+
+    """
+
+    __tablename__ = 'place'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    osm_id = Column(BigInteger)
+    osm_type = Column(String)
+    name = Column(String, nullable=False)
+
+    # The OSM tag that makes this a place (e.g., "amenity") and its
+    # value (e.g., "cafe")
+    category = Column(String)
+    type = Column(String)
+
+    address = Column(String)
+    geom = Column(POINT(DEFAULT_SRID, lazy=True))
+
+    # Keys of OSM tags that identify places, in order of precedence
+    category_keys = (
+        'amenity',
+        'shop',
+        'tourism',
+        'leisure',
+        'office',
+        'craft',
+        'historic',
+    )
+
+    def __str__(self):
+        return self.name
+
+
+Index(
+    'ix_place_name_trgm',
+    Place.name,
+    postgresql_using='gin',
+    postgresql_ops={'name': 'gin_trgm_ops'},
+)
+Index('ix_place_geom', Place.geom, postgresql_using='gist')
@@ -0,0 +1,190 @@
+"""Read replica routing.
+
+Services only read from the database, so their queries can be sent to
+read replicas, leaving the primary for imports (e.g., ``load_osm_data``)
+and other writes. See :func:`bycycle.core.model.get_engine`.
+
+Reads are sent to a replica only if the replica is reachable and isn't
+lagging too far behind the primary; otherwise, they fall back to the
+primary. Replica health is checked periodically in the background, not
+on every query.
+
+"""
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from weakref import WeakKeyDictionary
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import text
+
+
+log = logging.getLogger(__name__)
+
+
+REPLICA_LAG_QUERY = text("""\
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+""")
+
+# Applies to the current transaction only
+STATEMENT_TIMEOUT_QUERY = text("SELECT set_config('statement_timeout', :timeout, true)")
+
+
+class ReplicaRouter:
+
+    """Chooses the engine reads are sent to.
+
+    Args:
+        primary: Primary engine
+        replicas: Replica engines
+        max_lag: Max replication lag in seconds; replicas that are
+            further behind than this aren't used until they catch up
+        check_interval: How often to check each replica's lag and
+            availability in seconds
+        check_timeout: Max time in seconds the lag query can run
+            before the check fails
+
+    """
+
+    def __init__(self, primary, replicas, max_lag=30, check_interval=5, check_timeout=2):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.status = {}
+        self.checks = {}
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(
+            max(len(self.replicas), 1), thread_name_prefix='replica-check')
+        self._next = itertools.cycle(range(len(self.replicas))).__next__
+
+    def get_read_engine(self):
+        """Get a healthy replica or, if there isn't one, the primary.
+
+        Replicas are used in round robin order.
+
+        """
+        for _ in range(len(self.replicas)):
+            with self.lock:
+                replica = self.replicas[self._next()]
+            if self.is_healthy(replica):
+                return replica
+        return self.primary
+
+    def is_healthy(self, replica):
+        """Check whether ``replica`` can be read from.
+
+        The first time a replica is checked, the check is done right
+        away since there's no previous result. After that, when the
+        result is more than ``check_interval`` seconds old, a check is
+        started in the background and the previous result is returned
+        until it finishes, so queries don't wait on checks.
+
+        """
+        status = self.status.get(replica)
+        if status is None:
+            return self.update_status(replica)
+        if time.monotonic() - status[0] >= self.check_interval:
+            with self.lock:
+                future = self.checks.get(replica)
+                if future is None or future.done():
+                    self.checks[replica] = self.executor.submit(self.update_status, replica)
+        return status[1]
+
+    def update_status(self, replica):
+        """Check ``replica`` and save the result."""
+        healthy = self.check(replica)
+        self.status[replica] = (time.monotonic(), healthy)
+        return healthy
+
+    def check(self, replica):
+        try:
+            lag = self.get_lag(replica)
+        except DBAPIError as exc:
+            log.warning('Replica %s is unavailable: %s', replica.url, exc.orig)
+            return False
+        if self.max_lag is not None and lag > self.max_lag:
+            log.warning(
+                'Replica %s is %.1fs behind the primary (max: %ss)',
+                replica.url, lag, self.max_lag)
+            return False
+        return True
+
+    def get_lag(self, replica):
+        """Get replication lag of ``replica`` in seconds.
+
+        Lag is measured for PostgreSQL only; other databases are assumed
+        to be current.
+
+        """
+        if replica.dialect.name != 'postgresql':
+            return 0.0
+        with replica.begin() as connection:
+            if self.check_timeout is not None:
+                timeout = str(int(self.check_timeout * 1000))
+                connection.execute(STATEMENT_TIMEOUT_QUERY, {'timeout': timeout})
+            return float(connection.execute(REPLICA_LAG_QUERY).scalar())
+
+    def dispose(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for replica in self.replicas:
+            replica.dispose()
+
+
+class RoutingSession(Session):
+
+    """Session that sends reads to replicas.
+
+    Flushes, DML, text statements, and ``SELECT ... FOR UPDATE`` are
+    sent to the primary. So that a session sees its own writes, all its
+    queries are sent to the primary after anything other than a select
+    is executed.
+
+    All the reads in a session are sent to the same engine, which is
+    chosen on the first read.
+
+    Calling :meth:`get_bind` without a statement returns the primary.
+
+    """
+
+    def __init__(self, *args, router=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.router = router
+        self.read_bind = None
+        self.has_written = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = super().get_bind(mapper, clause, **kwargs)
+        if self.router is None or primary is not self.router.primary:
+            return primary
+        if self.has_written or clause is None:
+            return primary
+        if self._flushing or not getattr(clause, 'is_select', False):
+            # Text statements might write too
+            self.has_written = True
+            return primary
+        if getattr(clause, '_for_update_arg', None) is not None:
+            return primary
+        if self.read_bind is None:
+            self.read_bind = self.router.get_read_engine()
+        return self.read_bind
+
+
+_replica_routers = WeakKeyDictionary()
+
+
+def get_replica_router(engine):
+    """Get replica router for primary ``engine`` (``None`` if none)."""
+    return _replica_routers.get(engine)
+
+
+def set_replica_router(engine, router):
+    _replica_routers[engine] = router
@@ -1,17 +1,55 @@
+import copy
+
+from bycycle.core.geometry import encode_polyline, unwrap
+
 from . import Entity
 
 
 class Route(Entity):
 
-    def __init__(self, start, end, directions, linestring, distance):
+    """Route from ``start`` to ``end``.
+
+    ``bounds`` defaults to the bounds of ``linestring``; it should be
+    passed when ``linestring`` has been simplified so the bounds cover
+    the entire route.
+
+    If ``polyline_precision`` is specified, the route's geometry is
+    also encoded as a polyline with that precision and, in JSON data,
+    the ``polyline`` replaces the ``linestring``.
+
+    """
+
+    def __init__(self, start, end, directions, linestring, distance, bounds=None,
+                 polyline_precision=None):
         self.id = ';'.join((start.id, end.id))
         self.name = ' to '.join(name for name in (start.name, end.name) if name)
         self.start = start
         self.end = end
         self.directions = directions
         self.distance = distance
-        self.bounds = linestring.bounds
+        self.bounds = linestring.bounds if bounds is None else bounds
         self.linestring = linestring
+        if polyline_precision is not None:
+            self.polyline = encode_polyline(linestring.coords, polyline_precision)
+            self.polyline_precision = polyline_precision
+
+    def detach(self):
+        """Copy route without references to database objects.
+
+        See :meth:`LookupResult.detach`.
+
+        """
+        route = copy.copy(self)
+        route.start = self.start.detach()
+        route.end = self.end.detach()
+        route.linestring = unwrap(self.linestring)
+        return route
+
+    def __json__(self, request=None):
+        data = super().__json__(request)
+        if 'polyline' in data:
+            del data['linestring']
+        return data
 
     def __str__(self):
         start = self.start
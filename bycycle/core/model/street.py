@@ -2,12 +2,20 @@ from functools import cached_property
 
 from sqlalchemy.orm import relationship
 from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.sql import bindparam, or_, select
 from sqlalchemy.types import BigInteger, Boolean, Float, Integer, String
 
-from bycycle.core.geometry import DEFAULT_SRID, length_in_meters
-from bycycle.core.geometry.sqltypes import LINESTRING
+from bycycle.core.geometry import (
+    DEFAULT_SRID,
+    get_cumulative_distances,
+    get_end_bearings,
+    length_in_meters,
+    reverse_bearing,
+)
+from bycycle.core.geometry.sqltypes import LINESTRING, eager
 from bycycle.core.model import Base
 
+from .compass import directions_ftoa
 from .intersection import Intersection
 
 
@@ -18,13 +26,21 @@ class Street(Base):
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     osm_id = Column(BigInteger)
     osm_seq = Column(Integer)
-    geom = Column(LINESTRING(DEFAULT_SRID))
+    geom = Column(LINESTRING(DEFAULT_SRID, lazy=True))
 
     start_node_id = Column(BigInteger, ForeignKey(Intersection.id), nullable=True)
     end_node_id = Column(BigInteger, ForeignKey(Intersection.id), nullable=True)
 
     base_cost = Column(Float, nullable=True)
 
+    # Length in meters; see :attr:`meters`
+    _meters = Column('meters', Float, nullable=True)
+
+    # Bearings at the start and end of the street in the forward
+    # direction (start node => end node); see :meth:`update_bearings`
+    start_bearing = Column(Float, nullable=True)
+    end_bearing = Column(Float, nullable=True)
+
     # Tags
     name = Column(String)
     description = Column(String)
@@ -69,13 +85,63 @@ class Street(Base):
         'yes',
     )
 
+    @classmethod
+    def update_bearings(cls, bind, batch_size=1000):
+        """Set bearings for streets that don't have them yet.
+
+        Bearings are computed on import. This is for databases imported
+        before they were added.
+
+        Returns:
+            int: Number of streets updated
+
+        """
+        table = cls.__table__
+        q = (
+            select([table.c.id, eager(table.c.geom)])
+            .where(or_(table.c.start_bearing.is_(None), table.c.end_bearing.is_(None)))
+            .order_by(table.c.id)
+        )
+        update = (
+            table.update()
+            .where(table.c.id == bindparam('street_id'))
+            .values(start_bearing=bindparam('start'), end_bearing=bindparam('end'))
+        )
+        count = 0
+        rows = []
+        for street_id, geom in bind.execute(q).fetchall():
+            start_bearing, end_bearing = get_end_bearings(geom)
+            rows.append({'street_id': street_id, 'start': start_bearing, 'end': end_bearing})
+            if len(rows) >= batch_size:
+                bind.execute(update, rows)
+                count += len(rows)
+                rows.clear()
+        if rows:
+            bind.execute(update, rows)
+            count += len(rows)
+        return count
+
     @cached_property
     def is_routable(self):
         return self.bicycle in self.bicycle_allowed_types or self.highway in self.routable_types
 
     @cached_property
     def meters(self):
-        return length_in_meters(self.geom)
+        # This is computed on import but might not be set on databases
+        # that haven't been backfilled.
+        meters = self._meters
+        if meters is None:
+            meters = length_in_meters(self.geom)
+        return meters
+
+    @cached_property
+    def cumulative_distances(self):
+        """Cumulative distances of vertices for splitting/trimming.
+
+        See :func:`bycycle.core.geometry.get_cumulative_distances`.
+
+        """
+        return get_cumulative_distances(self.geom)
 
     @cached_property
     def kilometers(self):
@@ -93,19 +159,29 @@ class Street(Base):
     def display_name(self):
         return self.name or self.description or f'[{self.highway}]'
 
-    def clone(self, **override_attrs):
-        keys = [c.key for c in self.__mapper__.columns]
-        keys += [r.key for r in self.__mapper__.relationships]
-        attrs = {k: getattr(self, k) for k in keys}
-        attrs.update(override_attrs)
-        return self.__class__(**attrs)
+    def get_bearings(self, reverse=False):
+        """Get start and end bearings.
+
+        If ``reverse`` is set, the bearings are for traversing the
+        street in reverse (end node => start node).
+
+        Returns:
+            tuple: (start bearing, end bearing)
+
+        """
+        start_bearing, end_bearing = self.start_bearing, self.end_bearing
+        if start_bearing is None or end_bearing is None:
+            start_bearing, end_bearing = get_end_bearings(self.geom)
+        if reverse:
+            return reverse_bearing(end_bearing), reverse_bearing(start_bearing)
+        return start_bearing, end_bearing
 
     def __str__(self):
         return self.display_name
 
 
-def base_cost(geom, highway, bicycle, cycleway, **attrs):
-    cost = length_in_meters(geom)
+def base_cost(geom, highway, bicycle, cycleway, meters=None, **attrs):
+    cost = length_in_meters(geom) if meters is None else meters
 
     if bicycle == 'no':
         return None
@@ -151,3 +227,74 @@ def base_cost(geom, highway, bicycle, cycleway, **attrs):
             cost *= 0.95
 
     return cost
+
+
+def normalize_street_name(name, street_type_map):
+    """Normalize street name.
+
+    Directional prefixes and suffixes are abbreviated (e.g., "North" =>
+    "N") and street types are converted to their standard USPS
+    abbreviations (e.g., "Street" => "St").
+
+    Args:
+        name (str): Street name
+        street_type_map (dict): Map of USPS street type names and
+            aliases to abbreviations (see
+            :meth:`USPSStreetSuffix.get_street_type_map`)
+
+    Returns:
+        str: Normalized street name
+        None: If ``name`` is blank
+
+    """
+    name = name.strip()
+
+    if not name:
+        return None
+
+    parts = name.split()
+
+    if len(parts) == 1:
+        return parts[0]
+
+    prefix, *rest = parts
+    normalized_parts = []
+
+    prefix_lower = prefix.lower()
+    if prefix_lower in directions_ftoa:
+        # Abbreviate prefix
+        prefix = directions_ftoa[prefix_lower].upper()
+        normalized_parts.append(prefix)
+    else:
+        rest = parts
+
+    if len(rest) == 1:
+        name = rest[0]
+        normalized_parts.append(name)
+    else:
+        *name, suffix = rest
+        suffix_lower = suffix.lower()
+
+        if suffix_lower in directions_ftoa:
+            # Ends with a direction
+            suffix = directions_ftoa[suffix_lower].upper()
+
+            # Check for street type before direction
+            if len(name) > 1:
+                *name, street_type = name
+                street_type_lower = street_type.lower()
+                if street_type_lower in street_type_map:
+                    street_type = street_type_map[street_type_lower]
+                    street_type = street_type.capitalize()
+                    suffix = ' '.join((street_type, suffix))
+                else:
+                    name = name + [street_type]
+        elif suffix_lower in street_type_map:
+            # Ends with a street type
+            suffix = street_type_map[suffix_lower].capitalize()
+
+        normalized_parts.extend(name)
+        normalized_parts.append(suffix)
+
+    name = ' '.join(normalized_parts)
+    return name
@@ -11,3 +11,12 @@ class USPSStreetSuffix(Base):
     name = Column(String, primary_key=True)
     alias = Column(String, primary_key=True)
     abbreviation = Column(String, primary_key=True)
+
+    @classmethod
+    def get_street_type_map(cls, session):
+        """Get map of street type names & aliases => abbreviations."""
+        street_type_map = {}
+        for r in session.execute(cls.__table__.select()):
+            street_type_map[r.name] = r.abbreviation
+            street_type_map[r.alias] = r.abbreviation
+        return street_type_map
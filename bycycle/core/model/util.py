@@ -1,7 +1,10 @@
-from collections import namedtuple
+from collections import Counter, namedtuple
+from weakref import WeakKeyDictionary
 
 from shapely import wkb
 
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
 from sqlalchemy.sql import func
 
 
@@ -25,3 +28,68 @@ def get_extent(session, model, field='geom'):
     extent = q.scalar()
     extent = wkb.loads(extent, hex=True)
     return ExtentInfo(extent.bounds, list(extent.exterior.coords), extent.centroid.coords[0])
+
+
+class StatementCacheStats:
+
+    """Tracks statement compilation cache hits for an engine.
+
+    SQLAlchemy caches compiled statements per engine. For each executed
+    statement, the execution context records whether its compiled form
+    came from the cache (see :meth:`track`).
+
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+
+    @property
+    def hits(self):
+        return self.counts[CACHE_HIT]
+
+    @property
+    def misses(self):
+        return self.counts[CACHE_MISS]
+
+    @property
+    def hit_rate(self):
+        """Fraction of cacheable statements that were cache hits.
+
+        Returns ``None`` if no cacheable statements have been executed.
+
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+    def track(self, engine):
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            self.counts[context.cache_hit] += 1
+
+    def __str__(self):
+        hit_rate = self.hit_rate
+        hit_rate = 'N/A' if hit_rate is None else f'{hit_rate:.1%}'
+        return f'Statement cache: {self.hits} hits, {self.misses} misses ({hit_rate})'
+
+
+_statement_cache_stats = WeakKeyDictionary()
+
+
+def get_statement_cache_stats(engine):
+    """Get statement cache stats for ``engine``.
+
+    Tracking starts the first time this is called for a given engine
+    (engines created via :func:`get_engine` are tracked from the
+    start).
+
+    Returns:
+        StatementCacheStats
+
+    """
+    stats = _statement_cache_stats.get(engine)
+    if stats is None:
+        stats = _statement_cache_stats[engine] = StatementCacheStats()
+        stats.track(engine)
+    return stats
@@ -20,13 +20,18 @@ class OSMDataFetcher:
         bbox (tuple): Bounding box
         path: Path to save data to
         query: Overpass API query or query type; pass a preset query
-            type (highway or place) or a query
+            type (highways, buildings, addresses, or places) or a query
 
     """
 
     query_types = {
         'highways': '(way[highway]({bbox});>;)',
         'buildings': '(way[building]({bbox});>;)',
+        'addresses': '(node["addr:housenumber"]({bbox});way["addr:housenumber"]({bbox});>;)',
+        'places': (
+            '(node[name][~"^(amenity|shop|tourism|leisure|office|craft|historic)$"~"."]({bbox});'
+            'way[name][~"^(amenity|shop|tourism|leisure|office|craft|historic)$"~"."]({bbox});>;)'
+        ),
     }
 
     def __init__(self, bbox, path, query, url=DEFAULT_URL):
@@ -2,6 +2,11 @@ from pathlib import Path
 
 import dijkstar
 
+from sqlalchemy.sql import select
+
+from bycycle.core.edgestore import EdgeStore
+from bycycle.core.geometry import get_end_bearings, reverse_bearing
+from bycycle.core.geometry.sqltypes import eager_columns
 from bycycle.core.model import get_engine, get_session_factory, Street
 from bycycle.core.util import Timer
 
@@ -10,16 +15,25 @@ class OSMGraphBuilder:
 
     """Build graph and save to disk.
 
+    An :class:`EdgeStore` is built along with the graph and saved next
+    to it.
+
     Args:
         path: Path to save graph to
         connection_args: A dictionary containing SQLAlchemy connection
             arguments (can be omitted if a ``session`` is passed)
         session: An existing SQLAlchemy session to use
+        edge_store_path: Path to save edge store to; defaults to the
+            graph path with an .edges.npz extension
 
     """
 
-    def __init__(self, path, connection_args=None, session=None, quiet=False):
+    def __init__(self, path, connection_args=None, session=None, quiet=False,
+                 edge_store_path=None):
         self.path = Path(path).resolve()
+        self.edge_store_path = (
+            Path(edge_store_path).resolve() if edge_store_path else
+            self.get_edge_store_path(self.path))
         self.quiet = quiet
 
         if session:
@@ -31,10 +45,15 @@ class OSMGraphBuilder:
 
         self.engine = self.session.bind
 
+    @classmethod
+    def get_edge_store_path(cls, graph_path):
+        """Get default edge store path for graph path."""
+        return Path(graph_path).with_suffix('.edges.npz')
+
     def run(self):
         quiet = self.quiet
         graph = dijkstar.Graph()
-        q = Street.__table__.select()
+        q = select(eager_columns(Street.__table__))
         result = self.session.execute(q)
         num_rows = result.rowcount
 
@@ -45,10 +64,24 @@ class OSMGraphBuilder:
             template = template.format(num_rows)
             print(template.format(0), end='')
 
+        rows = []
+
+        # Edges are (ID, cost, name, start bearing, end bearing). The
+        # bearings are oriented in the direction of travel, so edges in
+        # the reverse direction get reversed bearings.
         for i, r in enumerate(result):
-            edge = (r.id, r.base_cost, r.name or r.description)
+            rows.append(r)
+            name = r.name or r.description
+            if r.start_bearing is None or r.end_bearing is None:
+                start_bearing, end_bearing = get_end_bearings(r.geom)
+            else:
+                start_bearing, end_bearing = r.start_bearing, r.end_bearing
+            edge = (r.id, r.base_cost, name, start_bearing, end_bearing)
             graph.add_edge(r.start_node_id, r.end_node_id, edge)
             if not r.oneway_bicycle:
+                edge = (
+                    r.id, r.base_cost, name,
+                    reverse_bearing(end_bearing), reverse_bearing(start_bearing))
                 graph.add_edge(r.end_node_id, r.start_node_id, edge)
             if not quiet:
                 print(template.format(i / num_rows), end='')
@@ -63,6 +96,13 @@ class OSMGraphBuilder:
 
         graph.marshal(str(self.path))
 
+        if not quiet:
+            print('Done', timer)
+            print(f'Saving edge store to {self.edge_store_path}... ', end='', flush=True)
+
+        edge_store = EdgeStore.build(rows)
+        edge_store.save(self.edge_store_path)
+
         if not quiet:
             print('Done', timer)
             timer.stop()
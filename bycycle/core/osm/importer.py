@@ -1,28 +1,31 @@
+import re
 from functools import cached_property
 from itertools import chain
 from pathlib import Path
 
 import ijson
 
-from shapely.geometry import LineString, Point, Polygon
+from shapely.geometry import LineString, MultiPoint, Point, Polygon
 
 from sqlalchemy.schema import Column
 from sqlalchemy.sql import select
 from sqlalchemy.types import BigInteger, Boolean
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from bycycle.core.geometry import DEFAULT_SRID
-from bycycle.core.geometry.sqltypes import POINT
+from bycycle.core.geometry import DEFAULT_SRID, get_end_bearings, lengths_in_meters, pack_coords
+from bycycle.core.geometry.sqltypes import POINT, to_ewkb
 from bycycle.core.model import (
     get_engine,
     get_session_factory,
+    Address,
     Base,
     Intersection,
+    NodeEdge,
+    Place,
     Street,
     USPSStreetSuffix,
 )
-from bycycle.core.model.compass import directions_ftoa
-from bycycle.core.model.street import base_cost
+from bycycle.core.model.street import base_cost, normalize_street_name
 from bycycle.core.util import PeriodicRunner, Timer
 
 from .graph import OSMGraphBuilder
@@ -37,15 +40,19 @@ class Node(Base):
     geom = Column(POINT(DEFAULT_SRID))
 
 
+ADDRESS_NUMBER_RE = re.compile(r'\d+')
+
+ADDRESS_TABLE = Address.__table__
 INTERSECTION_TABLE = Intersection.__table__
 NODE_TABLE = Node.__table__
+NODE_EDGE_TABLE = NodeEdge.__table__
+PLACE_TABLE = Place.__table__
 STREET_TABLE = Street.__table__
-SUFFIX_TABLE = USPSStreetSuffix.__table__
 
 
-def action(description=None):
+def action(description=None, group='streets'):
     def wrapper(meth):
-        meth.__action__ = Action(meth, action.order, description)
+        meth.__action__ = Action(meth, action.order, description, group)
         return meth
     action.order += 1
     return wrapper
@@ -56,9 +63,10 @@ action.order = 0
 
 class Action:
 
-    def __init__(self, meth, order, description=None):
+    def __init__(self, meth, order, description=None, group='streets'):
         self.meth = meth
         self.order = order
+        self.group = group
         if description is not None:
             self.description = description
         elif meth.__doc__:
@@ -67,7 +75,7 @@ class Action:
             self.description = meth.__name__.replace('_', ' ').capitalize()
 
     def __str__(self):
-        return f'{self.order}: {self.description}'
+        return f'{self.order}: {self.description} [{self.group}]'
 
 
 class OSMImporter:
@@ -88,13 +96,16 @@ class OSMImporter:
         graph_path: Path to save graph to
         connection_args: A dictionary containing SQLAlchemy connection
             arguments
+        streets: Whether to perform street actions
+        addresses: Whether to perform address actions
+        places: Whether to perform place actions
         actions: A list of actions to perform. By default all actions
-            will be performed
+            in the groups selected above will be performed
 
     """
 
     def __init__(self, bbox, data_directory, graph_path, connection_args, streets=True,
-                 places=True, actions=None):
+                 addresses=True, places=True, actions=None):
         engine = get_engine(**connection_args)
         session_factory = get_session_factory(engine)
         self.bbox = bbox
@@ -107,11 +118,17 @@ class OSMImporter:
         if actions:
             self.actions = [self.all_actions[i - 1] for i in actions]
         else:
-            self.actions = []
-            if streets:
-                self.actions.extend(self.all_actions[:7])
-            if places:
-                self.actions.extend(self.all_actions[7:])
+            groups = {
+                group for (group, include) in (
+                    ('streets', streets),
+                    ('addresses', addresses),
+                    ('places', places),
+                ) if include
+            }
+            self.actions = [act for act in self.all_actions if act.group in groups]
+
+    def has_data_file(self, file_name):
+        return (self.data_directory / file_name).is_file()
 
     def iter_nodes(self, file_name):
         path = self.data_directory / file_name
@@ -129,6 +146,49 @@ class OSMImporter:
                 if item['type'] == 'way':
                     yield item
 
+    def iter_located_elements(self, file_name, predicate):
+        """Find nodes and ways with tags matching ``predicate``.
+
+        The file is streamed twice: first to find matching ways and
+        the nodes they reference and then to find matching nodes and
+        get the coordinates of the referenced nodes. A matching way is
+        located at its centroid.
+
+        Yields:
+            tuple: (OSM type, OSM ID, tags, Point)
+
+        """
+        ways = []
+        way_node_ids = set()
+        for el in self.iter_ways(file_name):
+            tags = el.get('tags')
+            if tags and predicate(tags):
+                ways.append((el['id'], tags, el['nodes']))
+                way_node_ids.update(el['nodes'])
+
+        bounds = self.bounds
+        coords = {}
+        for el in self.iter_nodes(file_name):
+            osm_id = el['id']
+            point = (float(el['lon']), float(el['lat']))
+            if osm_id in way_node_ids:
+                coords[osm_id] = point
+            tags = el.get('tags')
+            if tags and predicate(tags):
+                geom = Point(point)
+                if bounds.contains(geom):
+                    yield 'node', osm_id, tags, geom
+
+        for osm_id, tags, node_ids in ways:
+            way_coords = [coords[i] for i in node_ids if i in coords]
+            if not way_coords:
+                continue
+            geom = Polygon(way_coords).centroid if len(way_coords) > 2 else None
+            if geom is None or geom.is_empty:
+                geom = MultiPoint(way_coords).centroid
+            if bounds.contains(geom):
+                yield 'way', osm_id, tags, geom
+
     @cached_property
     def all_actions(self):
         actions = [
@@ -141,11 +201,7 @@ class OSMImporter:
 
     @cached_property
     def street_type_map(self):
-        street_type_map = {}
-        for r in self.session.execute(SUFFIX_TABLE.select()):
-            street_type_map[r.name] = r.abbreviation
-            street_type_map[r.alias] = r.abbreviation
-        return street_type_map
+        return USPSStreetSuffix.get_street_type_map(self.session)
 
     def run(self):
         session = self.session
@@ -190,18 +246,27 @@ class OSMImporter:
         finally:
             session.close()
 
-        print('Vacuuming tables...', end=' ', flush=True)
-        self.vacuum(INTERSECTION_TABLE, STREET_TABLE)
-        print('Done')
+        tables = []
+        groups = {act.group for act in self.actions}
+        if 'streets' in groups:
+            tables.extend((INTERSECTION_TABLE, STREET_TABLE, NODE_EDGE_TABLE))
+        if 'addresses' in groups:
+            tables.append(ADDRESS_TABLE)
+        if 'places' in groups:
+            tables.append(PLACE_TABLE)
+        if tables:
+            print('Vacuuming tables...', end=' ', flush=True)
+            self.vacuum(*tables)
+            print('Done')
 
     @action()
     def drop_street_tables(self):
-        tables = (NODE_TABLE, INTERSECTION_TABLE, STREET_TABLE)
+        tables = (NODE_TABLE, INTERSECTION_TABLE, STREET_TABLE, NODE_EDGE_TABLE)
         Base.metadata.drop_all(self.session.connection(), tables=tables)
 
     @action()
     def create_street_tables(self):
-        tables = (NODE_TABLE, INTERSECTION_TABLE, STREET_TABLE)
+        tables = (NODE_TABLE, INTERSECTION_TABLE, STREET_TABLE, NODE_EDGE_TABLE)
         Base.metadata.create_all(self.session.connection(), tables=tables)
 
     @action()
@@ -246,10 +311,13 @@ class OSMImporter:
         append_row = rows.append
 
         def insert():
+            for row, geom in zip(rows, to_ewkb((row['geom'] for row in rows), DEFAULT_SRID)):
+                row['geom'] = geom
             execute(NODE_TABLE.insert(), rows)
             rows.clear()
 
         execute(NODE_TABLE.delete())
+        execute(NODE_EDGE_TABLE.delete())
         execute(INTERSECTION_TABLE.delete())
 
         for el in self.iter_nodes('highways.json'):
@@ -279,6 +347,14 @@ class OSMImporter:
     @action()
     def process_ways(self):
         def insert():
+            # Lengths are computed for a batch of rows at a time so the
+            # base cost doesn't have to compute them again.
+            coords, offsets = pack_coords(row['geom'] for row in rows)
+            for row, meters in zip(rows, lengths_in_meters(coords, offsets).tolist()):
+                row['meters'] = meters
+                row['base_cost'] = base_cost(**row)
+            for row, geom in zip(rows, to_ewkb((row['geom'] for row in rows), DEFAULT_SRID)):
+                row['geom'] = geom
             self.session.execute(STREET_TABLE.insert(), rows)
             rows.clear()
 
@@ -411,11 +487,14 @@ class OSMImporter:
                 start_node_id = way[0].id
                 end_node_id = way[-1].id
                 geom = LineString((n.geom.coords[0] for n in way))
+                start_bearing, end_bearing = get_end_bearings(geom)
                 attrs = {
                     'id': way_id,
                     'osm_id': osm_id,
                     'osm_seq': i,
                     'geom': geom,
+                    'start_bearing': start_bearing,
+                    'end_bearing': end_bearing,
                     'start_node_id': start_node_id,
                     'end_node_id': end_node_id,
                     'name': name,
@@ -426,7 +505,6 @@ class OSMImporter:
                     'oneway': oneway,
                     'oneway_bicycle': oneway_bicycle,
                 }
-                attrs['base_cost'] = base_cost(**attrs)
                 rows.append(attrs)
 
             if len(rows) > 500:
@@ -446,77 +524,139 @@ class OSMImporter:
         builder = OSMGraphBuilder(self.graph_path, session=self.session, quiet=True)
         builder.run()
 
-    @action()
+    @action(group='places')
     def drop_place_tables(self):
-        # TODO:
-        # tables = ()
-        # Base.metadata.drop_all(self.session.connection(), tables=tables)
-        pass
+        tables = (PLACE_TABLE,)
+        Base.metadata.drop_all(self.session.connection(), tables=tables)
 
-    @action()
+    @action(group='places')
     def create_place_tables(self):
-        # TODO:
-        # tables = ()
-        # Base.metadata.create_all(self.session.connection(), tables=tables)
-        pass
+        connection = self.session.connection()
+        connection.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        tables = (PLACE_TABLE,)
+        Base.metadata.create_all(connection, tables=tables)
 
-    @action
+    @action(group='places')
     def process_places(self):
-        # TODO:
-        pass
+        """Process places from places file"""
+        if not self.has_data_file('places.json'):
+            return
 
-    def normalize_street_name(self, name):
-        name = name.strip()
+        rows = []
+        connection = self.session.connection()
+        execute = connection.execute
+        category_keys = Place.category_keys
+        normalize_street_name = self.normalize_street_name
 
-        if not name:
-            return None
+        def insert():
+            execute(PLACE_TABLE.insert(), rows)
+            rows.clear()
 
-        parts = name.split()
+        def is_place(tags):
+            return 'name' in tags and any(k in tags for k in category_keys)
 
-        if len(parts) == 1:
-            return parts[0]
+        # Loading is much faster without indexes; they're rebuilt below.
+        for index in PLACE_TABLE.indexes:
+            index.drop(connection, checkfirst=True)
 
-        prefix, *rest = parts
-        normalized_parts = []
+        execute(PLACE_TABLE.delete())
 
-        prefix_lower = prefix.lower()
-        if prefix_lower in directions_ftoa:
-            # Abbreviate prefix
-            prefix = directions_ftoa[prefix_lower].upper()
-            normalized_parts.append(prefix)
-        else:
-            rest = parts
+        for osm_type, osm_id, tags, geom in self.iter_located_elements('places.json', is_place):
+            name = ' '.join(tags['name'].split())
+            if not name:
+                continue
+            category = next(k for k in category_keys if k in tags)
+            house_number = tags.get('addr:housenumber')
+            street = tags.get('addr:street')
+            if house_number and street:
+                address = f'{house_number.strip()} {normalize_street_name(street)}'
+            else:
+                address = None
+            rows.append({
+                'osm_id': osm_id,
+                'osm_type': osm_type,
+                'name': name,
+                'category': category,
+                'type': tags[category],
+                'address': address,
+                'geom': geom,
+            })
+            if len(rows) > 500:
+                insert()
 
-        if len(rest) == 1:
-            name = rest[0]
-            normalized_parts.append(name)
-        else:
-            *name, suffix = rest
-            suffix_lower = suffix.lower()
-
-            if suffix_lower in directions_ftoa:
-                # Ends with a direction
-                suffix = directions_ftoa[suffix_lower].upper()
-
-                # Check for street type before direction
-                if len(name) > 1:
-                    *name, street_type = name
-                    street_type_lower = street_type.lower()
-                    if street_type_lower in self.street_type_map:
-                        street_type = self.street_type_map[street_type_lower]
-                        street_type = street_type.capitalize()
-                        suffix = ' '.join((street_type, suffix))
-                    else:
-                        name = name + [street_type]
-            elif suffix_lower in self.street_type_map:
-                # Ends with a street type
-                suffix = self.street_type_map[suffix_lower].capitalize()
+        if rows:
+            insert()
+
+        for index in PLACE_TABLE.indexes:
+            index.create(connection)
+
+    # Actions are numbered in the order they're defined and can be
+    # selected by number (see the ``actions`` arg), so new actions are
+    # added here at the end to keep existing action numbers stable.
+
+    @action(group='addresses')
+    def drop_address_tables(self):
+        tables = (ADDRESS_TABLE,)
+        Base.metadata.drop_all(self.session.connection(), tables=tables)
+
+    @action(group='addresses')
+    def create_address_tables(self):
+        tables = (ADDRESS_TABLE,)
+        Base.metadata.create_all(self.session.connection(), tables=tables)
+
+    @action(group='addresses')
+    def process_addresses(self):
+        """Process addresses from address nodes and buildings"""
+        rows = []
+        execute = self.session.execute
+        normalize_street_name = self.normalize_street_name
+        file_names = [f for f in ('addresses.json', 'buildings.json') if self.has_data_file(f)]
+        encountered = set()
 
-            normalized_parts.extend(name)
-            normalized_parts.append(suffix)
+        def insert():
+            execute(ADDRESS_TABLE.insert(), rows)
+            rows.clear()
+
+        def has_address(tags):
+            return 'addr:housenumber' in tags and 'addr:street' in tags
+
+        for file_name in file_names:
+            for osm_type, osm_id, tags, geom in self.iter_located_elements(file_name, has_address):
+                key = (osm_type, osm_id)
+                if key in encountered:
+                    continue
+                encountered.add(key)
+                house_number = tags['addr:housenumber'].strip()
+                street = normalize_street_name(tags['addr:street'])
+                if not (house_number and street):
+                    continue
+                number = ADDRESS_NUMBER_RE.match(house_number)
+                rows.append({
+                    'osm_id': osm_id,
+                    'osm_type': osm_type,
+                    'house_number': house_number,
+                    'number': int(number.group()) if number else None,
+                    'street': street,
+                    'unit': tags.get('addr:unit'),
+                    'city': tags.get('addr:city'),
+                    'postcode': tags.get('addr:postcode'),
+                    'geom': geom,
+                })
+                if len(rows) > 500:
+                    insert()
 
-        name = ' '.join(normalized_parts)
-        return name
+        if rows:
+            insert()
+
+    @action()
+    def process_node_edges(self):
+        """Link intersections to streets and name intersections"""
+        connection = self.session.connection()
+        NodeEdge.populate(connection)
+        Intersection.update_names(connection)
+
+    def normalize_street_name(self, name):
+        return normalize_street_name(name, self.street_type_map)
 
     def vacuum(self, *tables):
         """Vacuum ``tables`` or all tables if ``tables`` aren't specified."""
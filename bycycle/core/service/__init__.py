@@ -1,3 +1,4 @@
 from .base  import AService
+from .autocomplete import AutocompleteService
 from .lookup import LookupService
 from .route import RouteService
@@ -0,0 +1,3 @@
+from .index import AutocompleteIndex
+from .service import AutocompleteService
+Service = AutocompleteService
@@ -0,0 +1,166 @@
+from bisect import bisect_left
+from collections import defaultdict
+from heapq import nlargest
+from itertools import combinations
+
+from sqlalchemy.sql import select
+
+from bycycle.core.model import Street, USPSStreetSuffix
+from bycycle.core.model.compass import directions_ftoa
+from bycycle.core.model.street import normalize_street_name
+
+
+DIRECTIONS = frozenset(v.upper() for v in directions_ftoa.values())
+
+
+class AutocompleteIndex:
+
+    """In-memory prefix index over normalized street names.
+
+    Each street name is indexed by its lower case normalized form and,
+    if it has a directional prefix, by the rest of the name too (so
+    "holl" completes to "NE Holladay St"). The keys are kept in a single
+    sorted list, so finding the keys that start with a prefix is a pair
+    of binary searches.
+
+    Completions are ranked by the number of street segments that have
+    the name, which favors longer/more prominent streets. To keep short
+    prefixes (which match a large fraction of all keys) fast, the top
+    completions for all one and two character prefixes are computed up
+    front.
+
+    The index also records which streets cross which other streets so
+    cross street completions can be limited to streets that actually
+    intersect the first street.
+
+    Args:
+        rows: Iterable of (name, start node ID, end node ID) for each
+            street segment
+        street_type_map: Map of USPS street types to abbreviations used
+            to normalize input
+
+    """
+
+    precomputed_prefix_length = 2
+    precomputed_limit = 20
+
+    def __init__(self, rows, street_type_map):
+        self.street_type_map = street_type_map
+
+        name_ids = {}
+        weights = []
+        node_name_ids = defaultdict(set)
+
+        for name, start_node_id, end_node_id in rows:
+            if not name:
+                continue
+            name_id = name_ids.get(name)
+            if name_id is None:
+                name_id = name_ids[name] = len(weights)
+                weights.append(0)
+            weights[name_id] += 1
+            node_name_ids[start_node_id].add(name_id)
+            node_name_ids[end_node_id].add(name_id)
+
+        names = [None] * len(name_ids)
+        for name, name_id in name_ids.items():
+            names[name_id] = name
+
+        cross_name_ids = defaultdict(set)
+        for ids in node_name_ids.values():
+            for a, b in combinations(ids, 2):
+                cross_name_ids[a].add(b)
+                cross_name_ids[b].add(a)
+
+        entries = []
+        for name_id, name in enumerate(names):
+            for key in self.make_keys(name):
+                entries.append((key, name_id))
+        entries.sort()
+
+        self.names = tuple(names)
+        self.weights = tuple(weights)
+        self.name_ids = {name.lower(): name_id for name, name_id in name_ids.items()}
+        self.keys = [key for key, _ in entries]
+        self.key_name_ids = [name_id for _, name_id in entries]
+        self.cross_name_ids = {k: frozenset(v) for k, v in cross_name_ids.items()}
+
+        top = defaultdict(set)
+        for key, name_id in entries:
+            for i in range(1, self.precomputed_prefix_length + 1):
+                top[key[:i]].add(name_id)
+        self.top = {
+            prefix: self._rank(ids, self.precomputed_limit)
+            for prefix, ids in top.items()
+        }
+
+    @classmethod
+    def from_session(cls, session):
+        """Build index from the streets in the database."""
+        q = select([Street.name, Street.start_node_id, Street.end_node_id])
+        q = q.where(Street.name.isnot(None) & Street.highway.in_(Street.road_types))
+        rows = session.execute(q)
+        street_type_map = USPSStreetSuffix.get_street_type_map(session)
+        return cls(rows, street_type_map)
+
+    @classmethod
+    def make_keys(cls, name):
+        key = name.lower()
+        keys = [key]
+        parts = name.split(None, 1)
+        if len(parts) == 2 and parts[0].upper() in DIRECTIONS:
+            keys.append(parts[1].lower())
+        return keys
+
+    def normalize(self, s):
+        """Normalize (partial) input the same way street names are."""
+        name = normalize_street_name(s, self.street_type_map)
+        return name.lower() if name else ''
+
+    def complete(self, prefix, limit=10, within=None):
+        """Get top ``limit`` street names that start with ``prefix``.
+
+        Args:
+            prefix: Partial street name (will be normalized)
+            limit: Max number of completions to return
+            within: If specified, only names with these IDs are
+                considered
+
+        Returns:
+            list: Name IDs
+
+        """
+        prefix = self.normalize(prefix)
+
+        if within is not None:
+            make_keys = self.make_keys
+            names = self.names
+            ids = [
+                name_id for name_id in within
+                if any(key.startswith(prefix) for key in make_keys(names[name_id]))
+            ]
+            return self._rank(ids, limit)
+
+        if not prefix:
+            return []
+
+        if len(prefix) <= self.precomputed_prefix_length and limit <= self.precomputed_limit:
+            return self.top.get(prefix, [])[:limit]
+
+        keys = self.keys
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + '\uffff', start)
+        ids = set(self.key_name_ids[start:end])
+        return self._rank(ids, limit)
+
+    def get_name_id(self, name):
+        """Get ID for (normalized) ``name`` or ``None``."""
+        return self.name_ids.get(self.normalize(name))
+
+    def get_cross_name_ids(self, name_id):
+        return self.cross_name_ids.get(name_id, frozenset())
+
+    def _rank(self, ids, limit):
+        weights = self.weights
+        names = self.names
+        return nlargest(limit, ids, key=lambda i: (weights[i], names[i]))
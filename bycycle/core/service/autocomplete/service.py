@@ -0,0 +1,74 @@
+"""Autocomplete service.
+
+The autocomplete service suggests street names for partial input. If
+the input looks like a partial intersection (e.g., 'NE 9th Ave & Ho'),
+cross streets that intersect the first street are suggested instead.
+
+All suggestions come from an in-memory :class:`AutocompleteIndex`, so
+queries don't touch the database (other than to build the index the
+first time it's needed).
+
+"""
+import re
+from functools import cached_property
+
+from bycycle.core.service import AService
+
+from .index import AutocompleteIndex
+
+
+# "and" and "at" have to be followed by whitespace so that partial street
+# names starting with them (e.g., "N At" for "N Atlantic St") aren't
+# taken as cross streets
+PARTIAL_CROSS_STREETS_RE = re.compile(
+    r'^\s*(?P<street>.+?)\s+(?:(?:and|at)\s|&)\s*(?P<cross_street>.*)$', re.I)
+
+# Indexes are shared by all service instances, keyed by database URL
+INDEXES = {}
+
+
+class AutocompleteService(AService):
+
+    name = 'autocomplete'
+
+    def query(self, q, limit=10):
+        """Get up to ``limit`` suggestions for ``q``.
+
+        Returns:
+            list: Suggestions (e.g., 'NE Holladay St' or
+                'NE 9th Ave & NE Holladay St')
+
+        """
+        index = self.index
+        names = index.names
+        match = PARTIAL_CROSS_STREETS_RE.search(q)
+
+        if match is not None:
+            street = match.group('street')
+            cross_street = match.group('cross_street') or ''
+            name_id = index.get_name_id(street)
+            if name_id is None:
+                # Use best completion for first street if it's not
+                # a complete street name.
+                name_ids = index.complete(street, 1)
+                name_id = name_ids[0] if name_ids else None
+            if name_id is not None:
+                within = index.get_cross_name_ids(name_id)
+                name_ids = index.complete(cross_street, limit, within=within)
+                street = names[name_id]
+                return [f'{street} & {names[i]}' for i in name_ids]
+
+        return [names[i] for i in index.complete(q, limit)]
+
+    @cached_property
+    def index(self):
+        index = self.config.get('autocomplete_index')
+        if index is None:
+            key = str(self.session.get_bind().url)
+            index = INDEXES.get(key)
+            if index is None:
+                index = INDEXES[key] = AutocompleteIndex.from_session(self.session)
+        return index
+
+
+Service = AutocompleteService
@@ -3,7 +3,13 @@ from abc import ABCMeta, abstractmethod
 
 class AService(metaclass=ABCMeta):
 
-    """Base class for byCycle services."""
+    """Base class for byCycle services.
+
+    A service and its session belong to a single request (and therefore
+    a single thread). Values in ``config`` may be shared by all threads
+    (see :class:`bycycle.core.app.App`) and must be treated as read-only.
+
+    """
 
     def __init__(self, session, **config):
         """Initialize service.
@@ -0,0 +1,244 @@
+"""asyncio lookup service.
+
+Requires the ``async`` extra (asyncpg and httpx).
+
+Database access goes through an :class:`AsyncSession`. The matching
+logic is shared with :class:`LookupService`: it runs against the async
+session's sync facade via :meth:`AsyncSession.run_sync`, so queries are
+issued by the async driver without blocking the event loop. Mapbox is
+queried with an async HTTP client.
+
+"""
+import logging
+from functools import cached_property, partial
+from urllib.parse import quote
+
+import httpx
+import mapbox
+
+from bycycle.core.model import GeocodeCache
+from bycycle.core.service import AService
+
+from .exc import LookupError, NoResultError
+from .service import GEOCODE_CACHE, GEOCODE_CACHE_TTL, LookupService
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncMapboxGeocoder:
+
+    """asyncio Mapbox geocoder (forward geocoding only).
+
+    The counterpart of :class:`MapboxGeocoder`. Requests are sent with
+    an :class:`httpx.AsyncClient`, which pools connections, so a single
+    instance should be kept around and reused.
+
+    Args:
+        access_token: Mapbox access token
+        host: Mapbox API host or base URL (see :class:`MapboxGeocoder`)
+        max_connections: Max number of pooled connections
+        http_client: HTTP client to use instead of creating one
+
+    """
+
+    name = 'mapbox.places'
+
+    def __init__(self, access_token, host=None, max_connections=4, http_client=None):
+        self.access_token = access_token
+        self.host = host or mapbox.Geocoder.default_host
+        if http_client is None:
+            limits = httpx.Limits(max_connections=max_connections)
+            http_client = httpx.AsyncClient(limits=limits)
+        self.http_client = http_client
+
+    @property
+    def baseuri(self):
+        host = self.host.rstrip('/')
+        if '://' not in host:
+            host = f'https://{host}'
+        return f'{host}/{mapbox.Geocoder.api_name}/{mapbox.Geocoder.api_version}'
+
+    async def forward(self, address, types=None, lon=None, lat=None, country=None, bbox=None,
+                      limit=None):
+        """Same as :meth:`mapbox.Geocoder.forward`.
+
+        Returns:
+            httpx.Response
+
+        """
+        url = f'{self.baseuri}/{self.name}/{quote(address, safe="")}.json'
+        params = {'access_token': self.access_token}
+        if country:
+            params['country'] = ','.join(country)
+        if types:
+            params['types'] = ','.join(types)
+        if lon is not None and lat is not None:
+            params['proximity'] = f'{round(float(lon), 3)},{round(float(lat), 3)}'
+        if bbox is not None:
+            params['bbox'] = '{0},{1},{2},{3}'.format(*bbox)
+        if limit is not None:
+            params['limit'] = str(limit)
+        return await self.http_client.get(url, params=params)
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+class AsyncLookupService(AService):
+
+    """asyncio variant of :class:`LookupService`.
+
+    Returns the same results and raises the same exceptions.
+
+    Args:
+        session: :class:`AsyncSession`
+        config: Same as :class:`LookupService`; an
+            :class:`AsyncMapboxGeocoder` can be passed as
+            ``async_geocoder``
+
+    Matching goes through the service's session, so lookups gathered on
+    one service run one at a time. Use a service (with its own session)
+    for each lookup that should run concurrently.
+
+    """
+
+    name = 'lookup'
+
+    def get_sync_service(self, sync_session):
+        return LookupService(sync_session, **self.config)
+
+    async def run_sync(self, method_name, *args):
+        """Call :class:`LookupService` method in the session's context."""
+        def call(sync_session):
+            return getattr(self.get_sync_service(sync_session), method_name)(*args)
+        return await self.session.run_sync(call)
+
+    async def run_with_connection(self, fn, *args):
+        """Call ``fn(connection, *args)`` on a connection of its own.
+
+        An :class:`AsyncSession` runs one operation at a time, so
+        concurrent calls that go through :meth:`run_sync` wait on each
+        other. This checks out a separate connection from the session's
+        engine instead, for calls that are gathered.
+
+        """
+        async with self.session.bind.connect() as connection:
+            return await connection.run_sync(fn, *args)
+
+    async def query(self, s, point_hint=None):
+        result = await self.match_locally(s, point_hint)
+        if result is not None:
+            return result
+
+        result = await self.match_via_mapbox(s)
+        if result is not None:
+            return result
+
+        raise NoResultError(s)
+
+    async def match_locally(self, s, point_hint=None):
+        """See :meth:`LookupService.match_locally`."""
+        return await self.run_sync('match_locally', s, point_hint)
+
+    async def match_via_mapbox(self, s, relevance_threshold=0.75):
+        features = await self.geocode_via_mapbox(s)
+        if features is None:
+            return None
+        return await self.mapbox_features_to_result(s, features, relevance_threshold)
+
+    async def mapbox_features_to_result(self, s, all_features, relevance_threshold=0.75):
+        """See :meth:`LookupService.mapbox_features_to_result`."""
+        return await self.run_sync(
+            'mapbox_features_to_result', s, all_features, relevance_threshold)
+
+    @cached_property
+    def geocoder(self):
+        geocoder = self.config.get('async_geocoder')
+        if geocoder is not None:
+            return geocoder
+        access_token = self.config.get('mapbox_access_token')
+        if not access_token:
+            return None
+        return AsyncMapboxGeocoder(
+            access_token,
+            host=self.config.get('mapbox_host'),
+            max_connections=self.config.get('mapbox_max_connections', 4),
+        )
+
+    @cached_property
+    def geocode_cache(self):
+        return self.config.get('geocode_cache', GEOCODE_CACHE)
+
+    async def geocode_via_mapbox(self, s):
+        """See :meth:`LookupService.geocode_via_mapbox`.
+
+        Several waypoints can be geocoded concurrently by gathering
+        calls to this method. The persistent cache is accessed on a
+        separate connection for each call (see
+        :meth:`run_with_connection`).
+
+        """
+        if self.geocoder is None:
+            log.warning(
+                'AsyncLookupService must be configured with a mapbox_access_token to enable '
+                'geocoding via Mapbox')
+            return None
+
+        options = {
+            'bbox': self.config.get('bbox'),
+            'center': self.config.get('center'),
+        }
+
+        key = GeocodeCache.make_key(s, **options)
+        features = self.geocode_cache.get(key)
+
+        if features is None:
+            if self.config.get('persistent_geocode_cache', True):
+                ttl = self.config.get('geocode_cache_ttl', GEOCODE_CACHE_TTL)
+                features = await self.run_with_connection(GeocodeCache.get_data, key, ttl)
+                if features is None:
+                    features = await self._fetch_from_mapbox(s, **options)
+                    await self.run_with_connection(
+                        partial(GeocodeCache.set_data, **options), key, s, features)
+                elif self.config.get('record_geocode_cache_hits', False):
+                    await self.run_with_connection(GeocodeCache.record_hits, [key])
+            else:
+                features = await self._fetch_from_mapbox(s, **options)
+            self.geocode_cache.set(key, features)
+
+        return features
+
+    async def _fetch_from_mapbox(self, s, bbox=None, center=None):
+        longitude, latitude = center if center else (None, None)
+
+        try:
+            # XXX: Hard coded country and place types (same as
+            #      LookupService)
+            response = await self.geocoder.forward(
+                s,
+                bbox=bbox,
+                country=['us'],
+                lat=latitude,
+                lon=longitude,
+                limit=3,
+                types=['address', 'poi'],
+            )
+        except httpx.HTTPError as exc:
+            raise LookupError('Unable to geocode via Mapbox geocoder', str(exc))
+
+        log.info('Mapbox geocoder service response status code: %d', response.status_code)
+
+        data = response.json()
+
+        if response.status_code != 200:
+            error_message = data.get('message', 'Unknown Error')
+            raise LookupError('Unable to geocode via Mapbox geocoder', error_message)
+
+        return data['features']
+
+    async def aclose(self):
+        """Close the geocoder if it was created by this service."""
+        if 'async_geocoder' not in self.config and self.__dict__.get('geocoder') is not None:
+            await self.geocoder.aclose()
+
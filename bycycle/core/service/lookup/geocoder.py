@@ -0,0 +1,40 @@
+import mapbox
+
+from requests.adapters import HTTPAdapter
+
+
+class MapboxGeocoder(mapbox.Geocoder):
+
+    """Mapbox geocoder that keeps its HTTP connections alive.
+
+    A single instance is intended to be kept around and reused for many
+    lookups. Its underlying :class:`requests.Session` pools connections
+    to the Mapbox API so that the TCP/TLS handshake isn't repeated for
+    every request.
+
+    Args:
+        access_token: Mapbox access token
+        host: Mapbox API host; this can also be a base URL including
+            a scheme, such as ``http://localhost:8080``, which is useful
+            for pointing the geocoder at a local stub server
+        max_connections: Max number of pooled connections to keep open;
+            this should be at least the number of threads that will
+            use the geocoder concurrently
+
+    """
+
+    def __init__(self, access_token, host=None, max_connections=4):
+        super().__init__(access_token=access_token, host=host)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def baseuri(self):
+        if '://' in self.host:
+            host = self.host.rstrip('/')
+            return '{0}/{1}/{2}'.format(host, self.api_name, self.api_version)
+        return super().baseuri
+
+    def close(self):
+        self.session.close()
@@ -8,11 +8,16 @@ input string, which can have one of the following forms:
     - An intersection (e.g. '1st & Main'); the cross streets will be
       normalized and then geocoded
 
-These forms will be supported soon:
+    - A street address (e.g. '123 Main St'); the address will be
+      normalized and then located using imported OSM addresses,
+      interpolating between known house numbers if necessary
 
-    - A street address (e.g. '123 Main St); the address will be
-      normalized and geocoded
-    - A point of interest (e.g. a business or park)
+    - A point of interest (e.g. a business or park); imported OSM
+      places are searched by name similarity and ranked by similarity
+      and distance from the configured center
+
+Inputs that can't be located locally are geocoded via Mapbox (if it's
+configured).
 
 The lookup service will return a :class:`LookupResult` if a matching
 object is found. Otherwise it will raise :class:`NoResultError`.
@@ -20,17 +25,27 @@ object is found. Otherwise it will raise :class:`NoResultError`.
 """
 import logging
 import re
+from functools import cached_property
 
-import mapbox
-import mapbox.errors
+from shapely.ops import linemerge
 
-from sqlalchemy.orm import joinedload
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, lambda_stmt, literal, select
 
 from bycycle.core.exc import InputError
-from bycycle.core.geometry import DEFAULT_SRID, Point
-from bycycle.core.model import LookupResult, Intersection, Street
+from bycycle.core.geometry import DEFAULT_SRID, Point, unwrap
+from bycycle.core.model import (
+    Address,
+    GeocodeCache,
+    Intersection,
+    LookupResult,
+    Place,
+    Street,
+    USPSStreetSuffix,
+    get_replica_router,
+)
+from bycycle.core.model.street import normalize_street_name
 from bycycle.core.service import AService
+from bycycle.core.util import LRUCache
 
 from .exc import LookupError, MultipleLookupResultsError, NoResultError
 
@@ -40,39 +55,61 @@ log = logging.getLogger(__name__)
 
 ID_RE = re.compile(r'^(?P<type>[a-z]+):(?P<id>\d+)$')
 CROSS_STREETS_RE = re.compile(r'^\s*(?P<street>.+)\s+(?:and|at|&)\s+(?P<cross_street>.+)\s*$')
+ADDRESS_RE = re.compile(
+    r'^\s*(?P<house_number>(?P<number>\d+)[a-z]?)\s+(?P<street>[^,]+?)\s*(?:,.*)?$', re.I)
 TYPE_MAP = {
     'intersection': Intersection,
     'street': Street,
 }
 
+# In-process geocode cache shared by all lookup service instances. This
+# sits in front of the persistent geocode cache table.
+GEOCODE_CACHE = LRUCache(max_size=4096, ttl=60 * 60)
+
+# Default TTL for persistent geocode cache entries (30 days)
+GEOCODE_CACHE_TTL = 30 * 24 * 60 * 60
+
 
 class LookupService(AService):
 
     name = 'lookup'
 
     def query(self, s, point_hint=None):
-        matchers = (
-            self.match_id,
-            self.match_point,
-            self.match_cross_streets,
-        )
+        result = self.match_locally(s, point_hint)
+        if result is not None:
+            return result
+
+        result = self.match_via_mapbox(s)
+        if result is not None:
+            return result
+
+        raise NoResultError(s)
+
+    def match_locally(self, s, point_hint=None):
+        """Try to match ``s`` without using any external services.
+
+        Returns ``None`` if ``s`` can't be matched locally.
 
-        for matcher in matchers:
+        """
+        for matcher in (self.match_id, self.match_point, self.match_cross_streets):
             result = matcher(s)
             if result is not None:
                 return result
 
+        # A point hint is more specific than a fuzzy address or place
+        # match, so it's used first
         if point_hint:
             result = self.match_point(point_hint)
             result.original_input = s
             result.normalized_input = result.name
             return result
 
-        result = self.match_via_mapbox(s)
-        if result is not None:
-            return result
+        for matcher in (self.match_address, self.match_place):
+            result = matcher(s)
+            if result is not None:
+                return result
 
-        raise NoResultError(s)
+        return None
 
     def is_lat_long(self, point):
         return abs(point.x) <= 180 and abs(point.y) <= 90
@@ -102,21 +139,31 @@ class LookupService(AService):
                 return None
 
         normalized_point = point
-        geom = func.ST_GeomFromText(point.wkt, DEFAULT_SRID)
-        distance = func.ST_Distance(
-            func.ST_GeogFromWKB(geom),
-            func.ST_GeogFromWKB(Intersection.geom))
-        distance = distance.label('distance')
+        wkt = point.wkt
 
         # Distance threshold in meters
         # TODO: Should this be scale-dependent?
         distance_threshold = self.config.get('distance_threshold', 10)
 
+        # NOTE: The queries here and in other hot paths are lambda
+        #       statements. They're constructed and compiled only once;
+        #       on subsequent calls, the values of the closure variables
+        #       (wkt, etc) are extracted as bound parameters. Because of
+        #       that, all values have to be passed in via closure
+        #       variables--values computed in helper functions would be
+        #       cached along with the statement.
+
         # Try to get an Intersection first
-        q = self.session.query(Intersection, distance)
-        q = q.filter(distance < distance_threshold)
-        q = q.order_by(distance)
-        result = q.first()
+        q = lambda_stmt(lambda: select(
+            Intersection,
+            func.ST_Distance(
+                func.ST_GeogFromWKB(func.ST_GeomFromText(wkt, DEFAULT_SRID)),
+                func.ST_GeogFromWKB(Intersection.geom),
+            ).label('distance'),
+        ))
+        q += lambda s: s.where(s.selected_columns.distance < distance_threshold)
+        q += lambda s: s.order_by(s.selected_columns.distance).limit(1)
+        result = self.session.execute(q).first()
 
         if result is not None:
             closest_object = result.Intersection
@@ -124,20 +171,20 @@ class LookupService(AService):
             name = closest_object.name
         else:
             # Otherwise, get a Street
-            distance = func.ST_Distance(geom, Street.geom).label('distance')
-            q = self.session.query(Street, distance)
-            q = q.filter(
+            q = lambda_stmt(lambda: select(Street).where(
                 Street.highway.in_(Street.routable_types) |
                 Street.bicycle.in_(Street.bicycle_allowed_types)
-            )
-            q = q.order_by(distance)
-            closest_object = q.first().Street
+            ))
+            q += lambda s: s.order_by(
+                func.ST_Distance(func.ST_GeomFromText(wkt, DEFAULT_SRID), Street.geom)
+            ).limit(1)
+            closest_object = self.session.execute(q).scalar()
             # Get point on Street closest to input point
-            closest_point = func.ST_ClosestPoint(Street.geom, geom)
-            closest_point = closest_point.label('closest_point')
-            q = self.session.query(closest_point).select_from(Street)
-            q = q.filter_by(id=closest_object.id)
-            closest_point = q.scalar()
+            street_id = closest_object.id
+            q = lambda_stmt(lambda: select(
+                func.ST_ClosestPoint(Street.geom, func.ST_GeomFromText(wkt, DEFAULT_SRID))
+            ).where(Street.id == street_id))
+            closest_point = self.session.execute(q).scalar()
             closest_point = Point.from_wkb(closest_point)
             name = closest_object.display_name
 
@@ -151,22 +198,23 @@ class LookupService(AService):
 
         data = match.groupdict()
 
-        # Case-insensitive regex operator
-        regex_op = Street.name.op('~*')
+        street_re = r'\m{street}\M'.format(**data)
+        cross_street_re = r'\m{cross_street}\M'.format(**data)
 
-        q = self.session.query(Intersection)
-        q = q.filter(Intersection.streets.any(
-            regex_op(r'\m{street}\M'.format(**data)) &
-            Street.highway.in_(Street.road_types)
-        ))
-        q = q.filter(Intersection.streets.any(
-            regex_op(r'\m{cross_street}\M'.format(**data)) &
-            Street.highway.in_(Street.road_types)
-        ))
-        q = q.distinct()
-        q = q.options(joinedload(Intersection.streets))
+        # Case-insensitive regex operator is ~*
+        q = lambda_stmt(lambda: select(Intersection).where(
+            Intersection.streets.any(
+                Street.name.op('~*')(street_re) &
+                Street.highway.in_(Street.road_types)
+            ),
+            Intersection.streets.any(
+                Street.name.op('~*')(cross_street_re) &
+                Street.highway.in_(Street.road_types)
+            ),
+        ).distinct())
 
-        intersections = sorted(q, key=lambda i: i.name)
+        # Intersection names are precomputed, so streets aren't loaded
+        intersections = sorted(self.session.execute(q).scalars(), key=lambda i: i.name)
 
         if not intersections:
             return None
@@ -183,25 +231,290 @@ class LookupService(AService):
 
         raise MultipleLookupResultsError(choices=results)
 
-    def match_via_mapbox(self, s, relevance_threshold=0.75):
+    @cached_property
+    def street_type_map(self):
+        street_type_map = self.config.get('street_type_map')
+        if street_type_map is None:
+            street_type_map = USPSStreetSuffix.get_street_type_map(self.session)
+        return street_type_map
+
+    def match_address(self, s):
+        """Locate street address using imported OSM addresses.
+
+        If the exact address isn't known, its location is interpolated
+        along the street between the nearest known addresses on either
+        side of it (preferring addresses on the same side of the
+        street--i.e., with the same parity).
+
+        Returns ``None`` if the address can't be located, in which case
+        it will be geocoded via Mapbox instead.
+
+        """
+        match = ADDRESS_RE.search(s)
+
+        if match is None:
+            return None
+
+        house_number = match.group('house_number').upper()
+        number = int(match.group('number'))
+        street_name = normalize_street_name(match.group('street'), self.street_type_map)
+        name = f'{house_number} {street_name}'
+
+        q = self.session.query(Address)
+        q = q.filter(func.lower(Address.street) == street_name.lower())
+
+        # Exact match (prefer an exact house number match like 123A)
+        exact_q = q.filter(Address.number == number)
+        exact_q = exact_q.order_by(Address.house_number != house_number)
+        address = exact_q.first()
+
+        if address is not None:
+            geom = address.geom
+            closest_object = self.match_point(f'{geom.y},{geom.x}').closest_object
+            return LookupResult(s, name, geom, closest_object, name, 'byCycle address')
+
+        # Interpolate between nearest known addresses
+        lower, upper = self._find_address_neighbors(q, number)
+
+        if lower is None or upper is None:
+            return None
+
+        max_distance = self.config.get('address_interpolation_max_distance', 1000)
+        neighbor_line = func.ST_MakeLine(
+            func.ST_GeomFromText(lower.geom.wkt, DEFAULT_SRID),
+            func.ST_GeomFromText(upper.geom.wkt, DEFAULT_SRID),
+        )
+        streets = self.session.query(Street).filter(
+            (func.lower(Street.name) == street_name.lower()) &
+            func.ST_DWithin(
+                func.ST_GeogFromWKB(Street.geom),
+                func.ST_GeogFromWKB(neighbor_line),
+                max_distance,
+            )
+        ).all()
+
+        if not streets:
+            return None
+
+        lower_geom, upper_geom = unwrap(lower.geom), unwrap(upper.geom)
+        merged = linemerge([street.geom for street in streets])
+        lines = getattr(merged, 'geoms', [merged])
+        line = min(lines, key=lambda l: l.distance(lower_geom) + l.distance(upper_geom))
+
+        d1 = line.project(lower_geom)
+        d2 = line.project(upper_geom)
+        fraction = (number - lower.number) / (upper.number - lower.number)
+        geom = Point(line.interpolate(d1 + fraction * (d2 - d1)))
+        closest_object = min(streets, key=lambda street: street.geom.distance(geom))
+
+        return LookupResult(s, name, geom, closest_object, name, 'byCycle address')
+
+    def _find_address_neighbors(self, q, number):
+        """Find nearest known addresses below and above ``number``."""
+        q = q.filter(Address.number.isnot(None))
+        for parity_q in (q.filter(Address.number % 2 == number % 2), q):
+            lower = parity_q.filter(Address.number < number)
+            lower = lower.order_by(Address.number.desc()).first()
+            upper = parity_q.filter(Address.number > number)
+            upper = upper.order_by(Address.number.asc()).first()
+            if lower is not None and upper is not None:
+                return lower, upper
+        return None, None
+
+    def match_place(self, s, limit=3):
+        """Find place (AKA point of interest) by name.
+
+        Places are matched by trigram similarity to their names and
+        ranked by similarity and then by distance from the configured
+        ``center``. A single result is returned if only one place
+        matches or the best match is a (near) exact match. Otherwise,
+        :class:`MultipleLookupResultsError` is raised.
+
+        Inputs that look like street addresses are skipped.
+
+        """
+        if ADDRESS_RE.search(s):
+            return None
+
+        name = ' '.join(s.split())
+        similarity_threshold = self.config.get('place_similarity_threshold', 0.5)
+        similarity = func.similarity(Place.name, name)
+
+        center = self.config.get('center')
+        if center:
+            center = func.ST_GeomFromText(Point(center).wkt, DEFAULT_SRID)
+            distance = func.ST_Distance(
+                func.ST_GeogFromWKB(Place.geom),
+                func.ST_GeogFromWKB(center))
+        else:
+            distance = literal(0)
+
+        # Similarity is in [0, 1]; penalize places by up to 0.25 for
+        # distance from center (maxing out at 10km).
+        rank = similarity - 0.25 * func.least(distance / 10_000, 1)
+
+        q = self.session.query(Place, similarity.label('similarity'), distance.label('distance'))
+        q = q.filter(Place.name.op('%')(name))
+        q = q.filter(similarity >= similarity_threshold)
+        q = q.order_by(rank.desc())
+        q = q.limit(limit)
+        rows = q.all()
+
+        if not rows:
+            return None
+
+        if len(rows) > 1 and rows[0].similarity >= 0.9 > rows[1].similarity:
+            rows = rows[:1]
+
+        results = []
+        for place, place_similarity, place_distance in rows:
+            geom = place.geom
+            closest_object = self.match_point(f'{geom.y},{geom.x}').closest_object
+            data = {
+                'category': place.category,
+                'type': place.type,
+                'address': place.address,
+                'similarity': place_similarity,
+            }
+            results.append(
+                LookupResult(s, place.name, geom, closest_object, place.name, 'byCycle place', data))
+
+        if len(results) == 1:
+            return results[0]
+
+        raise MultipleLookupResultsError(choices=results)
+
+    @cached_property
+    def geocoder(self):
+        """Mapbox geocoder (``None`` if no access token is configured).
+
+        The geocoder is created on first access and then reused for the
+        life of this service so that its connections are kept alive. A
+        longer-lived geocoder can be passed via the ``geocoder`` config
+        option (see :class:`bycycle.core.app.App`).
+
+        """
+        geocoder = self.config.get('geocoder')
+        if geocoder is not None:
+            return geocoder
         access_token = self.config.get('mapbox_access_token')
         if not access_token:
+            return None
+        # mapbox (and requests) are only imported if geocoding is used
+        from .geocoder import MapboxGeocoder
+        return MapboxGeocoder(
+            access_token,
+            host=self.config.get('mapbox_host'),
+            max_connections=self.config.get('mapbox_max_connections', 4),
+        )
+
+    def match_via_mapbox(self, s, relevance_threshold=0.75):
+        features = self.geocode_via_mapbox(s)
+        if features is None:
+            return None
+        return self.mapbox_features_to_result(s, features, relevance_threshold)
+
+    @cached_property
+    def geocode_cache(self):
+        return self.config.get('geocode_cache', GEOCODE_CACHE)
+
+    def get_geocode_cache_binds(self):
+        """Get binds for reading from and writing to the geocode cache.
+
+        Reads go to a read replica if one is configured (see
+        :func:`bycycle.core.model.get_engine`); writes go to the
+        primary. This uses the service's session, so it should be
+        called in the thread that owns the session. The binds can then
+        be used from other threads.
+
+        Returns:
+            tuple: Read bind and write bind
+            None: If the geocode cache table is disabled via the
+                ``persistent_geocode_cache`` config option
+
+        """
+        if not self.config.get('persistent_geocode_cache', True):
+            return None
+        primary = self.session.get_bind()
+        router = get_replica_router(primary)
+        replica = primary if router is None else router.get_read_engine()
+        return replica, primary
+
+    def geocode_via_mapbox(self, s, cache_binds=None, hits=None):
+        """Get features matching ``s`` from the Mapbox geocoder.
+
+        Results are cached in process and in the geocode cache table;
+        both are checked (in that order) before calling out to Mapbox.
+        Set the ``persistent_geocode_cache`` config option to ``False``
+        to skip the geocode cache table.
+
+        Hits on the geocode cache table are only recorded if the
+        ``record_geocode_cache_hits`` config option is set, since that
+        requires a write to the primary database.
+
+        If ``cache_binds`` are passed (see
+        :meth:`get_geocode_cache_binds`), the service's session isn't
+        used, so it's safe to call this from multiple threads at once
+        (e.g., to geocode several waypoints concurrently).
+
+        Args:
+            s: Query
+            cache_binds: Geocode cache binds
+            hits: If passed, the keys of geocode cache table hits are
+                appended to this list instead of being recorded, so
+                the caller can record them in a batch (see
+                :meth:`GeocodeCache.record_hits`)
+
+        Returns:
+            list: Mapbox features, which may be empty
+            None: If geocoding via Mapbox isn't configured
+
+        """
+        if self.geocoder is None:
             log.warning(
                 'LookupService must be configured with a mapbox_access_token to enable geocoding '
                 'via Mapbox')
             return None
 
-        bbox = self.config.get('bbox')
-        center = self.config.get('center')
+        options = {
+            'bbox': self.config.get('bbox'),
+            'center': self.config.get('center'),
+        }
+
+        key = GeocodeCache.make_key(s, **options)
+        features = self.geocode_cache.get(key)
+
+        if features is None:
+            if cache_binds is None:
+                cache_binds = self.get_geocode_cache_binds()
+            if cache_binds is not None:
+                read_bind, write_bind = cache_binds
+                ttl = self.config.get('geocode_cache_ttl', GEOCODE_CACHE_TTL)
+                features = GeocodeCache.get_data(read_bind, key, ttl)
+                if features is None:
+                    features = self._fetch_from_mapbox(s, **options)
+                    GeocodeCache.set_data(write_bind, key, s, features, **options)
+                elif self.config.get('record_geocode_cache_hits', False):
+                    if hits is None:
+                        GeocodeCache.record_hits(write_bind, [key])
+                    else:
+                        hits.append(key)
+            else:
+                features = self._fetch_from_mapbox(s, **options)
+            self.geocode_cache.set(key, features)
+
+        return features
+
+    def _fetch_from_mapbox(self, s, bbox=None, center=None):
+        from mapbox.errors import ValidationError
+
         longitude, latitude = center if center else (None, None)
 
         try:
             # REF: https://docs.mapbox.com/api/search/#geocoding
-            geocoder = mapbox.Geocoder(access_token=access_token)
-
             # XXX: Hard coded country
             # XXX: Hard coded place types
-            response = geocoder.forward(
+            response = self.geocoder.forward(
                 s,
                 bbox=bbox,
                 country=['us'],
@@ -210,7 +523,7 @@ class LookupService(AService):
                 limit=3,
                 types=['address', 'poi'],
             )
-        except mapbox.errors.ValidationError as mapbox_exc:
+        except ValidationError as mapbox_exc:
             raise LookupError('Unable to geocode via Mapbox geocoder', str(mapbox_exc))
 
         log.info('Mapbox geocoder service response status code: %d', response.status_code)
@@ -221,8 +534,16 @@ class LookupService(AService):
             error_message = data.get('message', 'Unknown Error')
             raise LookupError('Unable to geocode via Mapbox geocoder', error_message)
 
-        all_features = data['features']
+        return data['features']
+
+    def mapbox_features_to_result(self, s, all_features, relevance_threshold=0.75):
+        """Convert Mapbox features to a lookup result.
+
+        Returns ``None`` if there are no features. Raises
+        :class:`MultipleLookupResultsError` if there are multiple
+        relevant features.
 
+        """
         # Filter out less-relevant features
         relevant_features = [f for f in all_features if f['relevance'] > relevance_threshold]
 
@@ -0,0 +1,172 @@
+"""asyncio route service.
+
+Requires the ``async`` extra (asyncpg and httpx).
+
+The route-finding logic is shared with :class:`RouteService`. Steps that
+use the database run against the async session's sync facade via
+:meth:`AsyncSession.run_sync`, the routing server is queried in a thread
+pool using dijkstar's client, and directions are built in an executor so
+that CPU-bound work doesn't block the event loop.
+
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, partial
+
+from dijkstar.server.client import Client, ClientError
+
+from bycycle.core.service import AService
+from bycycle.core.service.lookup.aio import AsyncLookupService
+
+from .directions import build_directions
+from .exc import MultipleRouteLookupResultsError
+from .service import RouteService
+
+
+class AsyncDijkstarClient:
+
+    """Dijkstar client for use with asyncio.
+
+    Wraps dijkstar's (blocking) :class:`Client` and calls its public
+    :meth:`find_path` in a thread pool, so up to ``max_workers`` paths
+    can be found concurrently without blocking the event loop. Errors
+    are raised as :class:`ClientError`, the same as :class:`Client`.
+
+    Args:
+        base_url: Routing server base URL
+        max_workers: Max number of concurrent requests
+        kwargs: Passed through to :class:`Client`
+
+    """
+
+    def __init__(self, base_url='http://localhost:8000', max_workers=4, **kwargs):
+        self.client = Client(base_url, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='dijkstar-client')
+
+    async def find_path(self, *args, **kwargs):
+        """See :meth:`Client.find_path`."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(self.client.find_path, *args, **kwargs))
+
+    async def aclose(self):
+        self.executor.shutdown(wait=False)
+
+
+class AsyncRouteService(AService):
+
+    """asyncio variant of :class:`RouteService`.
+
+    Returns the same results and raises the same exceptions.
+
+    Matching waypoints, loading edges, and the other database steps go
+    through the service's session, and an :class:`AsyncSession` runs
+    one operation at a time, so those steps aren't concurrent even if
+    several queries are gathered. To run queries concurrently, create a
+    service (with its own session) for each one. Geocoding and routing
+    requests don't use the session.
+
+    Args:
+        session: :class:`AsyncSession`
+        config: Same as :class:`RouteService` plus:
+            - ``dijkstar_client``: :class:`AsyncDijkstarClient` to use
+              instead of creating one
+            - ``directions_executor``: Executor directions are built in
+              (the event loop's default executor by default)
+
+    """
+
+    name = 'route'
+
+    def get_sync_service(self, sync_session=None):
+        return RouteService(sync_session, **self.config)
+
+    async def run_sync(self, method_name, *args):
+        """Call :class:`RouteService` method in the session's context."""
+        def call(sync_session):
+            return getattr(self.get_sync_service(sync_session), method_name)(*args)
+        return await self.session.run_sync(call)
+
+    @cached_property
+    def lookup_service(self):
+        return AsyncLookupService(self.session, **self.config)
+
+    @cached_property
+    def dijkstar_client(self):
+        client = self.config.get('dijkstar_client')
+        if client is None:
+            client = AsyncDijkstarClient()
+        return client
+
+    async def query(self, q, points=None, simplify=None, polyline_precision=None):
+        """See :meth:`RouteService.query`."""
+        sync_service = self.get_sync_service()
+        waypoints = await self.get_waypoints(q, points)
+        starts = waypoints[:-1]
+        ends = waypoints[1:]
+        routes = []
+        for start, end in zip(starts, ends):
+            if start.geom == end.geom:
+                directions, linestring, distance = sync_service.make_empty_directions(start)
+            else:
+                path = await self.find_path(start, end)
+                directions, linestring, distance = await self.make_directions(*path)
+            route = sync_service.make_route(
+                start, end, directions, linestring, distance, simplify, polyline_precision)
+            routes.append(route)
+        return routes[0] if len(routes) == 1 else routes
+
+    async def get_waypoints(self, q, points=None):
+        """See :meth:`RouteService.get_waypoints`.
+
+        Waypoints that can't be matched locally are geocoded
+        concurrently.
+
+        """
+        waypoints, points = self.get_sync_service().validate_waypoints(q, points)
+        results, pending, raise_multi = await self.run_sync(
+            'match_waypoints_locally', waypoints, points)
+        if pending:
+            geocode = self.lookup_service.geocode_via_mapbox
+            all_features = await asyncio.gather(*(geocode(waypoints[i]) for i in pending))
+            if await self.run_sync(
+                    'add_geocoded_waypoints', results, waypoints, pending, all_features):
+                raise_multi = True
+        if raise_multi:
+            raise MultipleRouteLookupResultsError(choices=results)
+        return results
+
+    async def find_path(self, start_result, end_result, cost_func=None, heuristic_func=None):
+        """See :meth:`RouteService.find_path`."""
+        start, end, annex_edges, split_ways = await self.run_sync(
+            'prepare_path', start_result, end_result)
+        sync_service = self.get_sync_service()
+        try:
+            result = await self.dijkstar_client.find_path(
+                start.id,
+                end.id,
+                annex_edges=annex_edges,
+                cost_func=cost_func,
+                heuristic_func=heuristic_func,
+                fields=('nodes', 'edges')
+            )
+        except ClientError as exc:
+            sync_service.handle_client_error(exc, start_result, end_result)
+        return sync_service.process_path(result, start, end, split_ways)
+
+    async def make_directions(self, node_ids, edge_ids, split_edges):
+        """See :meth:`RouteService.make_directions`."""
+        edges, edge_store = await self.run_sync('load_route_edges', edge_ids, split_edges)
+        loop = asyncio.get_running_loop()
+        executor = self.config.get('directions_executor')
+        directions, linestring_coords, total_distance = await loop.run_in_executor(
+            executor, partial(build_directions, edges, node_ids))
+        return await self.run_sync(
+            'finish_directions', directions, linestring_coords, total_distance, edge_store)
+
+    async def aclose(self):
+        """Close HTTP clients created by this service."""
+        if 'dijkstar_client' not in self.config and 'dijkstar_client' in self.__dict__:
+            await self.dijkstar_client.aclose()
+        if 'lookup_service' in self.__dict__:
+            await self.lookup_service.aclose()
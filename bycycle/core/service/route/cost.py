@@ -2,7 +2,8 @@ import sys
 
 
 def cost_func(u, v, edge, prev_edge):
-    _, cost, name = edge
+    # Edges are (ID, cost, name, start bearing, end bearing)
+    cost, name = edge[1], edge[2]
     if cost is None:
         return sys.maxsize
     if prev_edge:
@@ -0,0 +1,209 @@
+"""Vectorized directions builder.
+
+A route's edges are packed into a :class:`RouteEdges` (parallel arrays
+of edge attributes plus a flat coordinate array with per-edge offsets).
+:func:`build_directions` then finds stretches (runs of edges with the
+same name), turns, cardinal directions, and the route's linestring
+using array operations rather than looping over edges in Python.
+
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from bycycle.core.geometry import Point, pack_coords
+
+
+TURNS = ('straight', 'right', 'back', 'left', 'straight')
+CARDINAL_DIRECTIONS = np.array((
+    'north',
+    'northeast',
+    'east',
+    'southeast',
+    'south',
+    'southwest',
+    'west',
+    'northwest',
+))
+
+
+class RouteEdges(namedtuple('RouteEdges', (
+        'ids',
+        'names',
+        'display_names',
+        'highways',
+        'start_node_ids',
+        'meters',
+        'start_bearings',
+        'end_bearings',
+        'coords',
+        'offsets',
+))):
+
+    """Attributes of a route's edges packed into arrays.
+
+    ``names`` is a string array with blanks for unnamed edges;
+    ``display_names`` and ``highways`` are object arrays. Bearings are
+    in the forward direction (start node => end node) of each edge.
+
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_edges(cls, edges):
+        """Pack edge objects (:class:`Street`\\s, etc)."""
+        coords, offsets = pack_coords(edge.geom for edge in edges)
+        bearings = np.array([edge.get_bearings() for edge in edges], dtype=np.float64)
+        return cls(
+            np.array([edge.id for edge in edges], dtype=np.int64),
+            np.array([edge.name or '' for edge in edges], dtype=np.str_),
+            np.array([edge.display_name for edge in edges], dtype=object),
+            np.array([edge.highway for edge in edges], dtype=object),
+            np.array([edge.start_node_id for edge in edges], dtype=np.int64),
+            np.array([edge.meters for edge in edges], dtype=np.float64),
+            bearings[:, 0],
+            bearings[:, 1],
+            coords,
+            offsets,
+        )
+
+    @classmethod
+    def from_store(cls, store, indexes):
+        """Pack edges at ``indexes`` in :class:`EdgeStore` ``store``."""
+        store_offsets = store.offsets
+        starts = store_offsets[indexes]
+        counts = store_offsets[indexes + 1] - starts
+        offsets = np.zeros(len(indexes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        positions = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+        coords = store.coords[np.repeat(starts, counts) + positions]
+        names = store.get_strings(store.name_ids[indexes])
+        return cls(
+            store.ids[indexes],
+            np.array([name or '' for name in names], dtype=np.str_),
+            store.get_strings(store.display_name_ids[indexes]),
+            store.get_strings(store.highway_ids[indexes]),
+            store.start_node_ids[indexes],
+            store.meters[indexes],
+            store.start_bearings[indexes],
+            store.end_bearings[indexes],
+            coords,
+            offsets,
+        )
+
+    @classmethod
+    def concat(cls, parts):
+        if len(parts) == 1:
+            return parts[0]
+        offsets = [parts[0].offsets]
+        for part in parts[1:]:
+            offsets.append(part.offsets[1:] + offsets[-1][-1])
+        fields = {
+            name: np.concatenate([getattr(part, name) for part in parts])
+            for name in cls._fields if name != 'offsets'
+        }
+        return cls(offsets=np.concatenate(offsets), **fields)
+
+
+def calculate_ways_to_turn(old_bearings, new_bearings):
+    """Get turns (e.g., "right" or "straight") between bearings.
+
+    Bearings are in [0, 360].
+
+    """
+    diff = new_bearings - old_bearings
+    diff = np.where(diff < 0, diff + 360, diff)
+    conditions = (diff < 10, diff <= 170, diff < 190, diff <= 350, diff <= 360)
+    ways = np.select(conditions, TURNS, default='')
+    if (ways == '').any():
+        i = np.flatnonzero(ways == '')[0]
+        raise ValueError(
+            'Could not calculate way to turn from {} and {}'
+            .format(new_bearings[i], old_bearings[i]))
+    return ways
+
+
+def get_directions_from_bearings(bearings):
+    """Translate ``bearings`` to cardinal directions."""
+    buckets = ((bearings + 22.5) / 45).astype(np.int64) % 8
+    return CARDINAL_DIRECTIONS[buckets]
+
+
+def build_directions(edges, node_ids):
+    """Build directions for a route.
+
+    Args:
+        edges (RouteEdges): The route's edges (in order)
+        node_ids: The IDs of the nodes on the route
+
+    Returns:
+        tuple: A list of directions (see
+            :meth:`RouteService.make_directions`) with the ``toward``
+            key set to the ID of the node to get the toward street
+            from (or ``None``), an array of coordinates for the route's
+            linestring, and the route's total length in meters
+
+    """
+    num_edges = len(edges.ids)
+    next_node_ids = np.asarray(node_ids[1:num_edges + 1], dtype=np.int64)
+
+    # Orient bearings in the direction of travel
+    reverse = edges.start_node_ids == next_node_ids
+    start_bearings = np.where(reverse, (edges.end_bearings + 180) % 360, edges.start_bearings)
+    end_bearings = np.where(reverse, (edges.start_bearings + 180) % 360, edges.end_bearings)
+
+    # Concatenate edge coordinates in the direction of travel, dropping
+    # the last coordinate of each edge (it's the same as the first
+    # coordinate of the next edge) except for the last edge.
+    offsets = edges.offsets
+    counts = np.diff(offsets)
+    out_counts = counts - 1
+    out_counts[-1] += 1
+    out_offsets = np.zeros(num_edges + 1, dtype=np.int64)
+    np.cumsum(out_counts, out=out_offsets[1:])
+    positions = np.arange(out_offsets[-1]) - np.repeat(out_offsets[:-1], out_counts)
+    coords_index = np.where(
+        np.repeat(reverse, out_counts),
+        np.repeat(offsets[1:] - 1, out_counts) - positions,
+        np.repeat(offsets[:-1], out_counts) + positions,
+    )
+    coords = edges.coords[coords_index]
+
+    # A new stretch starts at the first edge, at edges without a name,
+    # and wherever the name changes.
+    names = edges.names
+    is_stretch_start = np.ones(num_edges, dtype=bool)
+    is_stretch_start[1:] = (names[1:] == '') | (names[1:] != names[:-1])
+    starts = np.flatnonzero(is_stretch_start)
+    ends = np.append(starts[1:], num_edges)
+
+    turns = np.empty(len(starts), dtype=object)
+    turns[0] = get_directions_from_bearings(start_bearings[starts[:1]])[0]
+    turns[1:] = calculate_ways_to_turn(end_bearings[ends[:-1] - 1], start_bearings[starts[1:]])
+
+    # Lengths are summed sequentially to match summing in a loop
+    meters = edges.meters
+    lengths = [np.cumsum(meters[start:end])[-1] for start, end in zip(starts, ends)]
+    total_distance = float(np.cumsum(meters)[-1])
+
+    edge_ids = edges.ids.tolist()
+    toward_node_ids = next_node_ids[starts].tolist()
+    points = coords[out_offsets[starts]].tolist()
+    display_names = edges.display_names
+    highways = edges.highways
+    directions = []
+
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        toward_node_id = toward_node_ids[i]
+        directions.append({
+            'turn': str(turns[i]),
+            'name': display_names[start],
+            'type': highways[start],
+            'toward': toward_node_id if toward_node_id > -1 else None,
+            'distance': float(lengths[i]),
+            'point': Point(*points[i]),
+            'edge_ids': edge_ids[start:end],
+        })
+
+    return directions, coords, total_distance
@@ -1,46 +1,187 @@
 import logging
-from itertools import chain
-from math import atan2, degrees
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, partial
 
-from dijkstar.server.client import Client, ClientError
+import numpy as np
 
-from sqlalchemy.orm import joinedload
+from sqlalchemy.sql import lambda_stmt, select
 
+from bycycle.core.edgestore import EdgeStore
 from bycycle.core.exc import InputError
-from bycycle.core.geometry import length_in_meters, split_line, trim_line, LineString, Point
-from bycycle.core.model import Intersection, LookupResult, Route, Street
+from bycycle.core.geometry import (
+    get_bearing,
+    get_end_bearings,
+    length_in_meters,
+    simplify_line,
+    split_line,
+    trim_line,
+    LineString,
+)
+from bycycle.core.geometry.sqltypes import eager_columns
+from bycycle.core.model import (
+    Edge,
+    GeocodeCache,
+    Intersection,
+    LookupResult,
+    NodeEdge,
+    Route,
+    Street,
+)
 from bycycle.core.service import AService, LookupService
 from bycycle.core.service.lookup import MultipleLookupResultsError
-
+from bycycle.core.service.lookup.exc import NoResultError
+
+from .directions import (
+    RouteEdges,
+    build_directions,
+    calculate_ways_to_turn,
+    get_directions_from_bearings,
+)
 from .exc import MultipleRouteLookupResultsError, NoRouteError
 
 
 log = logging.getLogger(__name__)
 
 
+# Edge stores are shared by all service instances, keyed by path
+EDGE_STORES = {}
+
+
 class RouteService(AService):
 
-    """Route-finding Service."""
+    """Route-finding Service.
+
+    Concurrent identical queries (e.g., when lots of people request the
+    same route at the same time) can be coalesced by passing a shared
+    :class:`bycycle.core.util.SingleFlight` via the ``single_flight``
+    config option. Queries with the same normalized waypoints, points,
+    and options then share a single computation and its result. Shared
+    results are detached from the database session they were computed
+    in (see :meth:`Route.detach`), since they're handed to other threads
+    and processes.
+
+    """
 
     name = 'route'
 
-    def query(self, q, points=None):
+    def query(self, q, points=None, simplify=None, polyline_precision=None):
+        """Find route(s) between waypoints.
+
+        Args:
+            q: Waypoints (at least two)
+            points: Points corresponding to waypoints (used as hints)
+            simplify: Simplify route geometries with this tolerance in
+                meters (see :func:`simplify_line`); bounds are still
+                computed from the full geometry
+            polyline_precision: Encode route geometries as polylines
+                with this precision (see :class:`Route`)
+
+        Returns:
+            Route: If there are two waypoints
+            list: Routes between consecutive waypoints otherwise
+
+        """
+        single_flight = self.config.get('single_flight')
+        if single_flight is None:
+            return self.find_routes(q, points, simplify, polyline_precision)
+        waypoints, points = self.validate_waypoints(q, points)
+        key = self.make_query_key(waypoints, points, simplify, polyline_precision)
+        return single_flight.do(
+            key, self.find_detached_routes, waypoints, points, simplify, polyline_precision)
+
+    def make_query_key(self, waypoints, points, simplify=None, polyline_precision=None):
+        """Make key for query used to coalesce identical queries.
+
+        Waypoints are normalized by collapsing whitespace and ignoring
+        case.
+
+        """
+        waypoints = tuple(' '.join(w.split()).lower() for w in waypoints)
+        points = tuple(
+            tuple(p.coords[0]) if hasattr(p, 'coords') else
+            tuple(p) if isinstance(p, list) else p
+            for p in points)
+        return self.name, waypoints, points, simplify, polyline_precision
+
+    def find_routes(self, q, points=None, simplify=None, polyline_precision=None):
+        """Find route(s) between waypoints; see :meth:`query`."""
         waypoints = self.get_waypoints(q, points)
         starts = waypoints[:-1]
         ends = waypoints[1:]
         routes = []
         for start, end in zip(starts, ends):
             if start.geom == end.geom:
-                coords = start.geom.coords[0]
-                route = Route(start, end, [], LineString([coords, coords]), self.distance_dict(0))
+                directions, linestring, distance = self.make_empty_directions(start)
             else:
                 path = self.find_path(start, end)
                 directions, linestring, distance = self.make_directions(*path)
-                route = Route(start, end, directions, linestring, distance)
+            route = self.make_route(
+                start, end, directions, linestring, distance, simplify, polyline_precision)
             routes.append(route)
         return routes[0] if len(routes) == 1 else routes
 
+    def find_detached_routes(self, q, points=None, simplify=None, polyline_precision=None):
+        """Find route(s) that don't reference database objects.
+
+        Results referenced by errors are detached too.
+
+        """
+        try:
+            routes = self.find_routes(q, points, simplify, polyline_precision)
+        except NoRouteError as exc:
+            exc.start, exc.end = exc.start.detach(), exc.end.detach()
+            raise
+        except MultipleRouteLookupResultsError as exc:
+            choices = []
+            for choice in exc.choices:
+                if isinstance(choice, LookupResult):
+                    choice = choice.detach()
+                elif choice is not None:
+                    # Multiple matches for a waypoint
+                    choice = [c.detach() for c in choice]
+                choices.append(choice)
+            exc.choices = choices
+            raise
+        if isinstance(routes, Route):
+            return routes.detach()
+        return [route.detach() for route in routes]
+
+    def make_empty_directions(self, start):
+        """Make directions for a route that starts and ends at ``start``."""
+        coords = start.geom.coords[0]
+        return [], LineString([coords, coords]), self.distance_dict(0)
+
+    def make_route(self, start, end, directions, linestring, distance, simplify=None,
+                   polyline_precision=None):
+        bounds = linestring.bounds
+        if simplify:
+            linestring = simplify_line(linestring, simplify)
+        return Route(
+            start, end, directions, linestring, distance, bounds=bounds,
+            polyline_precision=polyline_precision)
+
     def get_waypoints(self, q, points=None):
+        waypoints, points = self.validate_waypoints(q, points)
+        results, pending, raise_multi = self.match_waypoints_locally(waypoints, points)
+        if pending:
+            all_features = self.geocode_waypoints([waypoints[i] for i in pending])
+            if self.add_geocoded_waypoints(results, waypoints, pending, all_features):
+                raise_multi = True
+        if raise_multi:
+            raise MultipleRouteLookupResultsError(choices=results)
+        return results
+
+    def validate_waypoints(self, q, points=None):
+        """Check waypoints and point hints.
+
+        Returns:
+            tuple: Stripped waypoints and point hints (one per waypoint)
+
+        Raises:
+            InputError: If there aren't enough waypoints, a waypoint is
+                blank, etc
+
+        """
         errors = []
         waypoints = [w.strip() for w in q]
         num_waypoints = len(waypoints)
@@ -64,25 +205,150 @@ class RouteService(AService):
                         break
         if errors:
             raise InputError(errors)
-        lookup_service = LookupService(self.session, **self.config)
-        results = []
+        return waypoints, points
+
+    def match_waypoints_locally(self, waypoints, points):
+        """Match waypoints locally.
+
+        Only those waypoints that can't be matched locally need to be
+        geocoded via Mapbox.
+
+        Returns:
+            tuple: Results (one per waypoint, ``None`` for pending
+                waypoints, a list of choices for waypoints with
+                multiple matches), indexes of pending waypoints, and
+                whether any waypoint had multiple matches
+
+        """
+        lookup_service = self.lookup_service
+        results = [None] * len(waypoints)
+        pending = []
         raise_multi = False
-        for w, point_hint in zip(waypoints, points):
+
+        for i, (w, point_hint) in enumerate(zip(waypoints, points)):
             try:
-                result = lookup_service.query(w, point_hint)
+                result = lookup_service.match_locally(w, point_hint)
             except MultipleLookupResultsError as exc:
                 raise_multi = True
-                results.append(exc.choices)
+                results[i] = exc.choices
             else:
-                results.append(result)
-        if raise_multi:
-            raise MultipleRouteLookupResultsError(choices=results)
-        return results
+                if result is None:
+                    pending.append(i)
+                else:
+                    results[i] = result
+
+        return results, pending, raise_multi
+
+    def add_geocoded_waypoints(self, results, waypoints, pending, all_features):
+        """Convert Mapbox features for pending waypoints to results.
+
+        Returns:
+            bool: Whether any waypoint had multiple matches
+
+        Raises:
+            NoResultError: If a waypoint couldn't be geocoded
+
+        """
+        lookup_service = self.lookup_service
+        raise_multi = False
+        for i, features in zip(pending, all_features):
+            w = waypoints[i]
+            try:
+                result = (
+                    None if features is None else
+                    lookup_service.mapbox_features_to_result(w, features))
+            except MultipleLookupResultsError as exc:
+                raise_multi = True
+                results[i] = exc.choices
+            else:
+                if result is None:
+                    raise NoResultError(w)
+                results[i] = result
+        return raise_multi
+
+    @cached_property
+    def edge_store(self):
+        """Edge store used to make directions.
+
+        Configured by passing an ``edge_store`` directly or an
+        ``edge_store_path`` to load from. If neither is configured,
+        edges are loaded from the database instead.
+
+        """
+        edge_store = self.config.get('edge_store')
+        if edge_store is None:
+            path = self.config.get('edge_store_path')
+            if path:
+                edge_store = EDGE_STORES.get(path)
+                if edge_store is None:
+                    edge_store = EDGE_STORES[path] = EdgeStore.load(path)
+        return edge_store
+
+    @cached_property
+    def lookup_service(self):
+        return LookupService(self.session, **self.config)
+
+    def geocode_waypoints(self, waypoints):
+        """Geocode ``waypoints`` via Mapbox concurrently.
+
+        Returns a list of Mapbox features for each waypoint (in the same
+        order as ``waypoints``).
+
+        """
+        lookup_service = self.lookup_service
+        num_waypoints = len(waypoints)
+        if num_waypoints == 1:
+            return [lookup_service.geocode_via_mapbox(waypoints[0])]
+        # Create the geocoder and cache up front so threads don't race
+        # to create them, and get the geocode cache binds here since
+        # the session can't be used from other threads
+        lookup_service.geocoder
+        lookup_service.geocode_cache
+        cache_binds = lookup_service.get_geocode_cache_binds()
+        hits = []
+        geocode = partial(lookup_service.geocode_via_mapbox, cache_binds=cache_binds, hits=hits)
+        max_workers = min(num_waypoints, self.config.get('mapbox_max_connections', 4))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            all_features = list(executor.map(geocode, waypoints))
+        if hits:
+            GeocodeCache.record_hits(cache_binds[1], hits)
+        return all_features
 
     def find_path(self, start_result: LookupResult, end_result: LookupResult,
                   cost_func: str = None, heuristic_func: str = None):
+        # The Dijkstar client pulls in requests, so it's imported on
+        # first use
+        from dijkstar.server.client import Client, ClientError
+
         client = Client()
+        start, end, annex_edges, split_ways = self.prepare_path(start_result, end_result)
 
+        try:
+            result = client.find_path(
+                start.id,
+                end.id,
+                annex_edges=annex_edges,
+                cost_func=cost_func,
+                heuristic_func=heuristic_func,
+                fields=('nodes', 'edges')
+            )
+        except ClientError as exc:
+            self.handle_client_error(exc, start_result, end_result)
+
+        return self.process_path(result, start, end, split_ways)
+
+    def prepare_path(self, start_result, end_result):
+        """Get start & end nodes and temporary edges for a route.
+
+        When the start and/or end of a route is within a street, the
+        street is split and the resulting temporary edges are annexed to
+        the graph for the path-finding request.
+
+        Returns:
+            tuple: Start node, end node, annex edges, and split edges
+                (ID => edge)
+
+        """
         start = start_result.closest_object
         end = end_result.closest_object
         annex_edges = []
@@ -102,7 +368,7 @@ class RouteService(AService):
 
         if add_between:
             obj = start_result.closest_object
-            geom = trim_line(obj.geom, start.geom, end.geom)
+            geom = trim_line(obj.geom, start.geom, end.geom, obj.cumulative_distances)
 
             d1 = obj.geom.project(start.geom)
             d2 = obj.geom.project(end.geom)
@@ -112,47 +378,47 @@ class RouteService(AService):
             else:
                 start_node, end_node = end, start
 
+            meters = length_in_meters(geom)
+
             if obj.base_cost is None:
                 base_cost = None
             else:
-                fraction = length_in_meters(geom) / obj.meters
+                fraction = meters / obj.meters
                 base_cost = obj.base_cost * fraction
 
-            way = obj.clone(
+            start_bearing, end_bearing = get_end_bearings(geom)
+
+            way = Edge.from_street(
+                obj,
                 id=-3,
                 geom=geom,
                 start_node_id=start_node.id,
-                start_node=start_node,
                 end_node_id=end_node.id,
-                end_node=end_node,
-                base_cost=base_cost)
+                base_cost=base_cost,
+                meters=meters,
+                start_bearing=start_bearing,
+                end_bearing=end_bearing)
 
-            way_attrs = (way.id, base_cost, way.name)
-            annex_edges.append((start_node.id, end_node.id, way_attrs))
+            annex_edges.append((start_node.id, end_node.id, self.get_edge_attrs(way)))
             if not way.oneway_bicycle:
-                annex_edges.append((end_node.id, start_node.id, way_attrs))
+                annex_edges.append(
+                    (end_node.id, start_node.id, self.get_edge_attrs(way, reverse=True)))
 
             split_ways[way.id] = way
 
-        try:
-            result = client.find_path(
-                start.id,
-                end.id,
-                annex_edges=annex_edges,
-                cost_func=cost_func,
-                heuristic_func=heuristic_func,
-                fields=('nodes', 'edges')
-            )
-        except ClientError as exc:
-            status_code = exc.response.status_code
-            data = exc.response.json()
-            detail = data['detail']
-            if status_code == 400:
-                raise InputError(detail)
-            if status_code == 404:
-                raise NoRouteError(start_result, end_result)
-            raise
+        return start, end, annex_edges, split_ways
+
+    def handle_client_error(self, exc, start_result, end_result):
+        """Convert routing server error to a byCycle error."""
+        status_code = exc.status_code
+        if status_code == 400:
+            raise InputError(exc.detail)
+        if status_code == 404:
+            raise NoRouteError(start_result, end_result)
+        raise exc
 
+    def process_path(self, result, start, end, split_ways):
+        """Get node & edge IDs from routing server result."""
         nodes = result['nodes']
         edges = [edge[0] for edge in result['edges']]
 
@@ -162,54 +428,71 @@ class RouteService(AService):
         return nodes, edges, split_ways
 
     def split_way(self, way, point, node_id, way1_id, way2_id):
-        start_node_id, end_node_id = way.start_node.id, way.end_node.id
+        start_node_id, end_node_id = way.start_node_id, way.end_node_id
 
-        way1_line, way2_line = split_line(way.geom, point)
+        way1_line, way2_line = split_line(way.geom, point, way.cumulative_distances)
         shared_node = Intersection(id=node_id, geom=point)
 
+        way1_meters = length_in_meters(way1_line)
+        way2_meters = length_in_meters(way2_line)
+
         if way.base_cost is None:
             way1_base_cost = None
             way2_base_cost = None
         else:
-            way1_fraction = length_in_meters(way1_line) / way.meters
-            way1_base_cost = way.base_cost * way1_fraction
-            way2_fraction = length_in_meters(way2_line) / way.meters
-            way2_base_cost = way.base_cost * way2_fraction
+            way1_base_cost = way.base_cost * (way1_meters / way.meters)
+            way2_base_cost = way.base_cost * (way2_meters / way.meters)
 
-        way1 = way.clone(
+        way1_start_bearing, way1_end_bearing = get_end_bearings(way1_line)
+        way2_start_bearing, way2_end_bearing = get_end_bearings(way2_line)
+
+        way1 = Edge.from_street(
+            way,
             id=way1_id,
             geom=way1_line,
             end_node_id=shared_node.id,
-            end_node=shared_node,
-            base_cost=way1_base_cost)
+            base_cost=way1_base_cost,
+            meters=way1_meters,
+            start_bearing=way1_start_bearing,
+            end_bearing=way1_end_bearing)
 
-        way2 = way.clone(
+        way2 = Edge.from_street(
+            way,
             id=way2_id,
             geom=way2_line,
             start_node_id=shared_node.id,
-            start_node=shared_node,
-            base_cost=way2_base_cost)
-
-        way1_attrs = (way1.id, way1.base_cost, way1.name)
-        way2_attrs = (way2.id, way2.base_cost, way2.name)
+            base_cost=way2_base_cost,
+            meters=way2_meters,
+            start_bearing=way2_start_bearing,
+            end_bearing=way2_end_bearing)
 
         # Add edge from start node to split node and from split node to
         # end node.
         annex_edges = [
-            (start_node_id, node_id, way1_attrs),
-            (node_id, end_node_id, way2_attrs),
+            (start_node_id, node_id, self.get_edge_attrs(way1)),
+            (node_id, end_node_id, self.get_edge_attrs(way2)),
         ]
 
         # If end node => start node, add edge from end node to split
         # node and from split node to start node.
         if not way.oneway_bicycle:
             annex_edges.extend([
-                (end_node_id, node_id, way2_attrs),
-                (node_id, start_node_id, way1_attrs),
+                (end_node_id, node_id, self.get_edge_attrs(way2, reverse=True)),
+                (node_id, start_node_id, self.get_edge_attrs(way1, reverse=True)),
             ])
 
         return shared_node, way1, way2, annex_edges
 
+    def get_edge_attrs(self, way, reverse=False):
+        """Get graph edge attributes for ``way``.
+
+        These have the same form as the edges in the graph created by
+        :class:`OSMGraphBuilder`: (ID, cost, name, start bearing, end
+        bearing), with the bearings oriented in the direction of travel.
+
+        """
+        return (way.id, way.base_cost, way.name, *way.get_bearings(reverse))
+
     def make_directions(self, node_ids, edge_ids, split_edges):
         """Process the shortest path into a nice list of directions.
 
@@ -257,113 +540,83 @@ class RouteService(AService):
               }
 
         """
-        edges = []
+        edges, edge_store = self.load_route_edges(edge_ids, split_edges)
+        directions, linestring_coords, total_distance = build_directions(edges, node_ids)
+        return self.finish_directions(directions, linestring_coords, total_distance, edge_store)
+
+    def load_route_edges(self, edge_ids, split_edges):
+        """Load the edges on a route (see :meth:`make_directions`).
+
+        Returns:
+            tuple: :class:`RouteEdges` and the edge store the edges were
+                loaded from (``None`` if they were loaded from the
+                database)
+
+        """
+        parts = []
 
         synthetic_start_edge = edge_ids[0] < 0
         synthetic_end_edge = len(edge_ids) > 1 and edge_ids[-1] < 0
 
         if synthetic_start_edge:
-            edges.append(split_edges[edge_ids[0]])
+            parts.append(RouteEdges.from_edges([split_edges[edge_ids[0]]]))
 
         i = 1 if synthetic_start_edge else None
         j = -1 if synthetic_end_edge else None
         filter_ids = edge_ids[i:j] if i or j else edge_ids
-        if filter_ids:
-            q = self.session.query(Street).filter(Street.id.in_(filter_ids))
-            q = q.options(joinedload(Street.start_node))
-            q = q.options(joinedload(Street.end_node))
-            edge_map = {edge.id: edge for edge in q}
-            edges.extend(edge_map[edge_id] for edge_id in filter_ids)
+        edge_store = self.edge_store
+        if filter_ids and edge_store is not None:
+            try:
+                parts.append(RouteEdges.from_store(edge_store, edge_store.index_of(filter_ids)))
+            except KeyError as exc:
+                # Store is out of sync with the database
+                log.warning('%s; loading edges from database instead', exc.args[0])
+                edge_store = None
+        if filter_ids and edge_store is None:
+            # Streets are loaded as Core rows rather than ORM instances
+            table = Street.__table__
+            q = lambda_stmt(lambda: (
+                select(eager_columns(table)).where(table.c.id.in_(filter_ids))))
+            edge_map = {row.id: Edge.from_street(row) for row in self.session.execute(q)}
+            parts.append(RouteEdges.from_edges([edge_map[edge_id] for edge_id in filter_ids]))
 
         if synthetic_end_edge:
-            edges.append(split_edges[edge_ids[-1]])
-
-        directions = []
-        stretches = []
-        prev_name = None
-        linestring_points = []
-        total_distance = 0
+            parts.append(RouteEdges.from_edges([split_edges[edge_ids[-1]]]))
 
-        for edge, next_edge, next_node_id in zip(edges, chain(edges[1:], [None]), node_ids[1:]):
-            name = edge.name
-            geom = edge.geom
-            length = edge.meters
+        return RouteEdges.concat(parts), edge_store
 
-            reverse_geom = edge.start_node_id == next_node_id
-            points = geom.coords[::-1] if reverse_geom else geom.coords
-
-            start_bearing = self.get_bearing(*points[:2])
-            end_bearing = self.get_bearing(*points[-2:])
-
-            if next_edge is None:
-                # Reached last edge
-                linestring_points.extend(points)
-            else:
-                linestring_points.extend(points[:-1])
+    def finish_directions(self, directions, linestring_coords, total_distance, edge_store):
+        """Add toward streets and distances to ``directions``.
 
-            total_distance += length
+        Takes the output of :func:`build_directions` and returns the
+        same values as :meth:`make_directions`.
 
-            if name and name == prev_name:
-                stretch = stretches[-1]
-                stretch['edges'].append(edge)
-                stretch['length'] += length
-                stretch['end_bearing'] = end_bearing
-            else:
-                # Start of a new stretch
-                stretches.append({
-                    'edges': [edge],
-                    'length': length,
-                    'toward_node_id': next_node_id if next_node_id > -1 else None,
-                    'point': Point(*points[0]),
-                    'start_bearing': start_bearing,
-                    'end_bearing': end_bearing,
-                })
-                prev_name = name
-
-        # Create directions from stretches.
-
-        for prev_stretch, stretch in zip([None] + stretches[:-1], stretches):
-            first_edge = stretch['edges'][0]
-            length = stretch['length']
-            start_bearing = stretch['start_bearing']
-            toward_node_id = stretch['toward_node_id']
-
-            if prev_stretch is None:
-                # First edge in stretch
-                turn = self.get_direction_from_bearing(start_bearing)
-            else:
-                # Remaining edges
-                prev_end_bearing = prev_stretch['end_bearing']
-                turn = self.calculate_way_to_turn(prev_end_bearing, start_bearing)
-
-            direction = {
-                'turn': turn,
-                'name': first_edge.display_name,
-                'type': first_edge.highway,
-                'toward': toward_node_id,
-                'distance': self.distance_dict(length),
-                'point': stretch['point'],
-                'edge_ids': [edge.id for edge in stretch['edges']]
+        """
+        for direction in directions:
+            direction['distance'] = self.distance_dict(direction['distance'])
+
+        # Get the toward street at the start of each stretch. All the
+        # toward nodes are fetched up front with their associated edges
+        # in a single query. This is much faster than processing each
+        # node individually--that causes up to 2*N additional queries
+        # being issued to the database (fetching of the inbound and
+        # outbound edges for the node).
+
+        filter_ids = [d['toward'] for d in directions if d['toward'] is not None]
+        if not filter_ids:
+            node_names = {}
+        elif edge_store is not None:
+            node_names = {
+                node_id: edge_store.get_street_names(node_id) for node_id in filter_ids
             }
-
-            directions.append(direction)
-
-        # Get the toward street at the start of each stretch found in
-        # the loop just above. This is deferred to here so that we can
-        # fetch all the toward nodes up front with their associated
-        # edges in a single query. This is much faster than processing
-        # each node individually inside the loop--that causes up to 2*N
-        # additional queries being issued to the database (fetching of
-        # the inbound and outbound edges for the node).
-
-        filter_ids = [direction['toward'] for direction in directions]
-        if filter_ids:
-            q = self.session.query(Intersection)
-            q = q.filter(Intersection.id.in_(filter_ids))
-            q = q.options(joinedload(Intersection.streets))
-            node_map = {node.id: node for node in q}
         else:
-            node_map = {}
+            # Only street names are needed, so full streets aren't
+            # loaded
+            node_streets = NodeEdge.get_streets(self.session, filter_ids)
+            node_names = {
+                node_id: [street.name for street in streets]
+                for node_id, streets in node_streets.items()
+            }
 
         for direction in directions:
             name = direction['name']
@@ -379,13 +632,13 @@ class RouteService(AService):
                 # above because it doesn't really exist.
                 toward = 'your destination'
             else:
-                node = node_map[toward_node_id]
-                toward = self.get_different_name_from_intersection(name, node)
+                names = node_names[toward_node_id]
+                toward = self.get_different_name(name, names)
             direction['toward'] = toward
 
         # TODO: Extract jogs?
 
-        linestring = LineString(linestring_points)
+        linestring = LineString(linestring_coords)
         distance = self.distance_dict(total_distance)
         return directions, linestring, distance
 
@@ -403,57 +656,35 @@ class RouteService(AService):
         If there is no such cross street, ``None`` is returned instead.
 
         """
-        for street in node.streets:
-            other_name = street.name
+        return self.get_different_name(name, (street.name for street in node.streets))
+
+    def get_different_name(self, name, names):
+        """Get first name from ``names`` that's not ``name``.
+
+        If there is no such name, ``None`` is returned instead.
+
+        """
+        for other_name in names:
             if other_name and other_name != name:
                 return other_name
 
     def get_bearing(self, p1, p2):
-        dx = p2[0] - p1[0]
-        dy = p2[1] - p1[1]
-        deg = degrees(atan2(dx, dy))
-        while deg < 0:
-            deg += 360
-        return deg
+        return get_bearing(p1, p2)
 
     def calculate_way_to_turn(self, old_bearing, new_bearing):
         """Given two bearings in [0, 360], return the associated turn.
 
-        Return a string such as "right" or "straight".
+        Return a string such as "right" or "straight". This is a scalar
+        version of :func:`calculate_ways_to_turn`.
 
         """
-        diff = new_bearing - old_bearing
-        while diff < 0:
-            diff += 360
-        while diff > 360:
-            diff -= 360
-        if 0 <= diff < 10:
-            way = 'straight'
-        elif 10 <= diff <= 170:
-            way = 'right'
-        elif 170 < diff < 190:
-            way = 'back'
-        elif 190 <= diff <= 350:
-            way = 'left'
-        elif 350 < diff <= 360:
-            way = 'straight'
-        else:
-            raise ValueError(
-                'Could not calculate way to turn from {} and {}'
-                .format(new_bearing, old_bearing))
-        return way
+        ways = calculate_ways_to_turn(np.array([old_bearing]), np.array([new_bearing]))
+        return str(ways[0])
 
     def get_direction_from_bearing(self, bearing):
-        """Translate ``bearing`` to a cardinal direction."""
-        buckets = {
-            0: 'north',
-            1: 'northeast',
-            2: 'east',
-            3: 'southeast',
-            4: 'south',
-            5: 'southwest',
-            6: 'west',
-            7: 'northwest',
-        }
-        bucket = int((bearing + 22.5) / 45) % 8
-        return buckets[bucket]
+        """Translate ``bearing`` to a cardinal direction.
+
+        This is a scalar version of :func:`get_directions_from_bearings`.
+
+        """
+        return str(get_directions_from_bearings(np.array([bearing]))[0])
@@ -0,0 +1,63 @@
+"""SQLite stand-in for PostGIS.
+
+Geometries are sent to the database as EWKB and selected as WKB (see
+:class:`bycycle.core.geometry.sqltypes.Geometry`), so the geometry
+functions used for that can pass values through as is. This makes it
+possible to test code that reads and writes geometry columns without
+a PostGIS database.
+
+A few other PostGIS functions are implemented with Shapely. Geography
+distances are approximated by converting degrees to meters at the
+equator, which is good enough for tests.
+
+"""
+from shapely import wkb, wkt
+from shapely.geometry import LineString
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql import text
+
+
+METERS_PER_DEGREE = 111_320
+
+
+def st_geom_from_text(value, srid):
+    return wkb.dumps(wkt.loads(value))
+
+
+def st_make_line(a, b):
+    return wkb.dumps(LineString([wkb.loads(a), wkb.loads(b)]))
+
+
+def st_dwithin(a, b, distance):
+    return wkb.loads(a).distance(wkb.loads(b)) * METERS_PER_DEGREE <= distance
+
+
+def add_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function('ST_GeomFromEWKB', 1, lambda value: value)
+    dbapi_connection.create_function('ST_AsBinary', 1, lambda value: value)
+    dbapi_connection.create_function('ST_GeogFromWKB', 1, lambda value: value)
+    dbapi_connection.create_function('ST_GeomFromText', 2, st_geom_from_text)
+    dbapi_connection.create_function('ST_MakeLine', 2, st_make_line)
+    dbapi_connection.create_function('ST_DWithin', 3, st_dwithin)
+
+
+def make_engine(*tables):
+    """Make in-memory SQLite engine with ``tables``.
+
+    Columns are untyped since SQLite doesn't support PostGIS column
+    types.
+
+    The engine uses a single connection so the database can be used
+    from multiple threads.
+
+    """
+    engine = create_engine(
+        'sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    event.listen(engine, 'connect', add_functions)
+    with engine.begin() as connection:
+        for table in tables:
+            columns = ', '.join(column.name for column in table.c)
+            connection.execute(text(f'create table {table.name} ({columns})'))
+    return engine
@@ -0,0 +1,132 @@
+import threading
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+
+from bycycle.core.app import App
+from bycycle.core.service import LookupService, RouteService
+from bycycle.core.service.autocomplete import AutocompleteIndex
+from bycycle.core.service.lookup.geocoder import MapboxGeocoder
+from bycycle.core.util import Snapshot
+
+
+STREET_TYPE_MAP = {'avenue': 'AVE', 'ave': 'AVE'}
+
+
+class TestApp(unittest.TestCase):
+
+    def setUp(self):
+        self.app = App(
+            create_engine('sqlite://'),
+            mapbox_access_token='pk.test',
+            street_type_map=STREET_TYPE_MAP,
+            autocomplete_index=AutocompleteIndex([], {}),
+        )
+
+    def tearDown(self):
+        self.app.dispose()
+
+    def test_pooled_engine(self):
+        app = App(pool_size=3, max_overflow=2, statement_timeout=5000,
+                  engine_args={'database': 'test'})
+        self.assertEqual(app.engine.url.database, 'test')
+        self.assertEqual(app.engine.pool.size(), 3)
+        self.assertTrue(app.engine.pool._pre_ping)
+        app.dispose()
+
+    def test_session_is_closed(self):
+        with self.app.session() as session:
+            self.assertEqual(session.execute(text('select 1')).scalar(), 1)
+            self.assertTrue(session.in_transaction())
+        self.assertFalse(session.in_transaction())
+
+    def test_session_is_rolled_back_on_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            with self.app.session() as session:
+                session.execute(text('create table t (a integer)'))
+                session.execute(text('insert into t values (1)'))
+                1 / 0
+        with self.app.session() as session:
+            self.assertEqual(session.execute(text('select count(*) from t')).scalar(), 0)
+
+    def test_session_is_scoped_to_thread(self):
+        sessions = []
+
+        def get_session():
+            with self.app.session() as session:
+                sessions.append(session)
+
+        with self.app.session() as session:
+            with self.app.session() as nested_session:
+                self.assertIs(nested_session, session)
+            thread = threading.Thread(target=get_session)
+            thread.start()
+            thread.join()
+            self.assertIsNot(sessions[0], session)
+        with self.app.session() as next_session:
+            self.assertIsNot(next_session, session)
+
+    def test_services_share_state(self):
+        with self.app.session() as session:
+            lookup_service = self.app.get_service('lookup', session)
+            route_service = self.app.get_service('route', session)
+        self.assertIsInstance(lookup_service, LookupService)
+        self.assertIsInstance(route_service, RouteService)
+        self.assertIsInstance(lookup_service.geocoder, MapboxGeocoder)
+        self.assertIs(lookup_service.geocoder, route_service.lookup_service.geocoder)
+        self.assertIs(lookup_service.street_type_map, STREET_TYPE_MAP)
+        self.assertIs(route_service.lookup_service.street_type_map, STREET_TYPE_MAP)
+        with self.app.session() as session:
+            other_lookup_service = self.app.get_service('lookup', session)
+        self.assertIs(other_lookup_service.geocoder, lookup_service.geocoder)
+        self.assertIs(other_lookup_service.geocode_cache, lookup_service.geocode_cache)
+
+    def test_warm(self):
+        self.app.warm()
+        config = self.app.get_service_config()
+        self.assertIs(config['autocomplete_index'], self.app.config['autocomplete_index'])
+        self.assertNotIn('edge_store', config)
+
+    def test_reload(self):
+        config = self.app.get_service_config()
+        with self.app.session() as session:
+            service = self.app.get_service('lookup', session)
+        self.app.reload()
+        new_config = self.app.get_service_config()
+        self.assertIsNot(new_config, config)
+        self.assertIsNot(new_config['geocoder'], config['geocoder'])
+        # Services created before the reload keep the old state
+        self.assertIs(service.geocoder, config['geocoder'])
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def test_load_once(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return {'calls': len(calls)}
+
+        snapshot = Snapshot(loader=loader)
+        threads = [threading.Thread(target=snapshot.get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(snapshot.get(), {'calls': 1})
+        self.assertEqual(snapshot.reload(), {'calls': 1})
+        self.assertEqual(snapshot.get(), {'calls': 2})
+
+    def test_swap(self):
+        snapshot = Snapshot('a')
+        value = snapshot.get()
+        self.assertEqual(snapshot.swap('b'), 'a')
+        self.assertEqual(value, 'a')
+        self.assertEqual(snapshot.get(), 'b')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,413 @@
+import pickle
+import random
+import unittest
+import warnings
+
+import numpy as np
+
+import shapely
+from shapely import wkb
+from shapely.geometry import box
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import Column, MetaData, Table
+from sqlalchemy.sql import select
+
+from bycycle.core.geometry import (
+    decode_polyline,
+    encode_polyline,
+    get_bearing,
+    get_cumulative_distances,
+    get_end_bearings,
+    length_in_meters,
+    lengths_in_meters,
+    pack_coords,
+    reverse_bearing,
+    simplify_line,
+    split_line,
+    trim_line,
+    unwrap,
+    LazyGeometry,
+    LineString,
+    Point,
+)
+from bycycle.core.geometry.base import geometry_mapping
+from bycycle.core.geometry.sqltypes import LINESTRING, POINT, eager, to_ewkb
+from bycycle.core.model import Street
+from bycycle.core.osm.importer import NODE_TABLE
+
+from .sqlite import make_engine
+
+
+class TestBearings(unittest.TestCase):
+
+    def test_get_bearing(self):
+        self.assertEqual(get_bearing((0, 0), (0, 1)), 0)
+        self.assertEqual(get_bearing((0, 0), (1, 0)), 90)
+        self.assertEqual(get_bearing((0, 0), (0, -1)), 180)
+        self.assertEqual(get_bearing((0, 0), (-1, 0)), 270)
+
+    def test_get_end_bearings(self):
+        line = LineString([(0, 0), (0, 1), (1, 1)])
+        self.assertEqual(get_end_bearings(line), (0, 90))
+
+    def test_reverse_bearing(self):
+        self.assertEqual(reverse_bearing(0), 180)
+        self.assertEqual(reverse_bearing(90), 270)
+        self.assertEqual(reverse_bearing(270), 90)
+        self.assertEqual(reverse_bearing(359.5), 179.5)
+
+    def test_reversed_end_bearings(self):
+        line = LineString([(0, 0), (0.001, 0.002), (0.003, 0.002)])
+        start, end = get_end_bearings(line)
+        reverse_start, reverse_end = get_end_bearings(LineString(line.coords[::-1]))
+        self.assertAlmostEqual(reverse_bearing(end), reverse_start)
+        self.assertAlmostEqual(reverse_bearing(start), reverse_end)
+
+
+class TestLengthsInMeters(unittest.TestCase):
+
+    lines = [
+        LineString([(-122.6, 45.5), (-122.6, 45.501)]),
+        LineString([(-122.6, 45.501), (-122.599, 45.501), (-122.599, 45.502)]),
+        LineString([(-122.7, 45.6), (-122.701, 45.6005), (-122.702, 45.6), (-122.703, 45.6)]),
+    ]
+
+    def test_same_as_length_in_meters(self):
+        coords, offsets = pack_coords(self.lines)
+        self.assertEqual(offsets.tolist(), [0, 2, 5, 9])
+        lengths = lengths_in_meters(coords, offsets)
+        self.assertEqual(len(lengths), 3)
+        for line, length in zip(self.lines, lengths):
+            self.assertAlmostEqual(length, length_in_meters(line), places=6)
+
+    def test_approximate(self):
+        coords, offsets = pack_coords(self.lines)
+        lengths = lengths_in_meters(coords, offsets, approximate=True)
+        for line, length in zip(self.lines, lengths):
+            expected = length_in_meters(line)
+            self.assertLess(abs(length - expected) / expected, 0.005)
+
+    def test_empty(self):
+        for approximate in (False, True):
+            lengths = lengths_in_meters(np.empty((0, 2)), [0], approximate=approximate)
+            self.assertEqual(lengths.tolist(), [])
+            lengths = lengths_in_meters(np.empty((0, 2)), [0, 0], approximate=approximate)
+            self.assertEqual(lengths.tolist(), [0])
+        self.assertEqual(lengths_in_meters([], []).tolist(), [])
+
+    def test_degenerate_linestrings(self):
+        # Empty and single coordinate linestrings at the start, middle,
+        # and end
+        coords, offsets = pack_coords(self.lines)
+        point = [(-122.65, 45.55)]
+        coords = np.concatenate((point, coords[:2], point, coords[2:5], coords[5:], point))
+        offsets = [0, 0, 1, 3, 3, 4, 7, 11, 11, 12]
+        for approximate in (False, True):
+            lengths = lengths_in_meters(coords, offsets, approximate=approximate)
+            expected = lengths_in_meters(*pack_coords(self.lines), approximate=approximate)
+            self.assertEqual(len(lengths), 9)
+            self.assertEqual(lengths[[0, 1, 3, 4, 7, 8]].tolist(), [0] * 6)
+            for length, expected_length in zip(lengths[[2, 5, 6]], expected):
+                self.assertAlmostEqual(length, expected_length, places=6)
+        lengths = lengths_in_meters(point, [0, 1])
+        self.assertEqual(lengths.tolist(), [0])
+
+
+def split_line_by_projecting(line, point):
+    """Split ``line`` by projecting every vertex (for comparison)."""
+    distance = line.project(point)
+    coords = line.coords
+    coords1 = [coords[0]]
+    coords2 = []
+    for c in coords[1:-1]:
+        p_distance = line.project(Point(c))
+        if p_distance < distance:
+            coords1.append(c)
+        elif p_distance > distance:
+            coords2.append(c)
+    coords2.append(coords[-1])
+    shared_coords = list(point.coords)
+    return LineString(coords1 + shared_coords), LineString(shared_coords + coords2)
+
+
+def trim_line_by_projecting(line, point1, point2):
+    """Trim ``line`` by projecting every vertex (for comparison)."""
+    distance1 = line.project(point1)
+    distance2 = line.project(point2)
+    if distance1 > distance2:
+        point1, point2 = point2, point1
+        distance1, distance2 = distance2, distance1
+    coords = [point1]
+    for c in line.coords:
+        if distance1 <= line.project(Point(c)) <= distance2:
+            coords.append(c)
+    coords.append(point2)
+    return LineString(coords)
+
+
+class TestSplitAndTrimLine(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(7)
+        self.lines = []
+        for _ in range(50):
+            x, y = -122.6, 45.5
+            coords = [(x, y)]
+            for _ in range(rand.randint(1, 12)):
+                x += rand.uniform(0.00001, 0.001)
+                y += rand.uniform(-0.001, 0.001)
+                coords.append((x, y))
+            self.lines.append(LineString(coords))
+        # Lines that aren't simple or are closed
+        self.lines.append(LineString([(0, 0), (2, 0), (2, 1), (1, 1), (1, -1)]))
+        self.lines.append(LineString([(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]))
+        # Line with a repeated vertex
+        self.lines.append(LineString([(0, 0), (1, 0), (1, 0), (2, 0)]))
+        self.rand = rand
+
+    def _points(self, line):
+        # Points on vertices and at random distances along the line
+        points = [Point(c) for c in line.coords]
+        points.extend(
+            line.interpolate(self.rand.uniform(0, line.length)) for _ in range(10))
+        return points
+
+    def test_split_line(self):
+        for line in self.lines:
+            distances = get_cumulative_distances(line)
+            for point in self._points(line):
+                expected = split_line_by_projecting(line, point)
+                self.assertEqual(split_line(line, point), expected)
+                if distances is not None:
+                    self.assertEqual(split_line(line, point, distances), expected)
+
+    def test_trim_line(self):
+        for line in self.lines:
+            points = self._points(line)
+            for point1, point2 in zip(points, reversed(points)):
+                expected = trim_line_by_projecting(line, point1, point2)
+                self.assertEqual(list(trim_line(line, point1, point2).coords), list(expected.coords))
+
+    def test_no_cumulative_distances_for_non_simple_lines(self):
+        self.assertIsNone(get_cumulative_distances(self.lines[-3]))
+        self.assertIsNone(get_cumulative_distances(self.lines[-2]))
+        self.assertEqual(get_cumulative_distances(self.lines[-1]).tolist(), [0, 1, 1, 2])
+
+
+class TestPolyline(unittest.TestCase):
+
+    coords = [(-120.2, 38.5), (-120.95, 40.7), (-126.453, 43.252)]
+
+    def test_encode(self):
+        # Example from Google's polyline algorithm docs
+        self.assertEqual(encode_polyline(self.coords), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+
+    def test_decode(self):
+        self.assertEqual(decode_polyline('_p~iF~ps|U_ulLnnqC_mqNvxq`@'), self.coords)
+
+    def test_precision(self):
+        coords = [(-122.6543219, 45.5123456), (-122.6543211, 45.5123459)]
+        decoded = decode_polyline(encode_polyline(coords, 6), 6)
+        for (x1, y1), (x2, y2) in zip(decoded, coords):
+            self.assertAlmostEqual(x1, x2, places=6)
+            self.assertAlmostEqual(y1, y2, places=6)
+
+    def test_empty(self):
+        self.assertEqual(encode_polyline([]), '')
+        self.assertEqual(decode_polyline(''), [])
+
+
+class TestSimplifyLine(unittest.TestCase):
+
+    def test_simplify_line(self):
+        # Second vertex is ~1m off the line between the first and last
+        line = LineString([(-122.6, 45.5), (-122.59999, 45.5005), (-122.6, 45.501)])
+        self.assertEqual(len(simplify_line(line, 0.5).coords), 3)
+        simplified = simplify_line(line, 2)
+        self.assertEqual(list(simplified.coords), [(-122.6, 45.5), (-122.6, 45.501)])
+
+
+class TestGeometryType(unittest.TestCase):
+
+    dialect = postgresql.dialect()
+    line = LineString([(-122.6, 45.5), (-122.59999, 45.5005)])
+
+    def setUp(self):
+        self.type = LINESTRING(4326)
+        self.table = Table('t', MetaData(), Column('geom', self.type))
+
+    def test_bind_ewkb(self):
+        value = self.type.bind_processor(self.dialect)(self.line)
+        self.assertIsInstance(value, bytes)
+        self.assertEqual(wkb.loads(value), self.line)
+        self.assertEqual(value, to_ewkb([self.line], 4326)[0])
+        sql = str(self.table.insert().compile(dialect=self.dialect))
+        self.assertIn('ST_GeomFromEWKB(%(geom)s)', sql)
+
+    def test_select_binary(self):
+        sql = str(select([self.table.c.geom]).compile(dialect=self.dialect))
+        self.assertIn('ST_AsBinary(t.geom)', sql)
+        process = self.type.result_processor(self.dialect, None)
+        self.assertEqual(process(memoryview(wkb.dumps(self.line))), self.line)
+        self.assertEqual(process(wkb.dumps(self.line, hex=True)), self.line)
+        self.assertIsNone(process(None))
+
+    def test_result_is_eager_by_default(self):
+        process = POINT(4326).result_processor(self.dialect, None)
+        point = process(wkb.dumps(Point(-122.6, 45.5)))
+        self.assertIs(type(point), shapely.geometry.Point)
+
+    def test_result_is_lazy(self):
+        process = POINT(4326, lazy=True).result_processor(self.dialect, None)
+        point = process(wkb.dumps(Point(-122.6, 45.5)))
+        self.assertIs(type(point), LazyGeometry)
+        self.assertFalse(point.is_loaded)
+        self.assertEqual(self.type.bind_processor(self.dialect)(point), wkb.dumps(point.load(), srid=4326))
+
+    def test_eager(self):
+        column = Street.__table__.c.geom
+        self.assertTrue(column.type.lazy)
+        eager_column = eager(column)
+        self.assertEqual(eager_column.name, 'geom')
+        self.assertFalse(eager_column.type.lazy)
+        self.assertEqual(eager_column.type.srid, column.type.srid)
+        sql = str(select([eager_column]).compile(dialect=self.dialect))
+        self.assertIn('ST_AsBinary(street.geom) AS geom', sql)
+
+
+    def test_cache_key(self):
+        table = Street.__table__
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            lazy_key = select([table.c.id, table.c.geom])._generate_cache_key()
+            eager_key = select([table.c.id, eager(table.c.geom)])._generate_cache_key()
+            other_key = select([table.c.id, eager(table.c.geom)])._generate_cache_key()
+        self.assertIsNotNone(lazy_key)
+        self.assertIsNotNone(eager_key)
+        self.assertNotEqual(lazy_key.key, eager_key.key)
+        self.assertEqual(eager_key.key, other_key.key)
+
+
+class TestGeometryRows(unittest.TestCase):
+
+    """Load geometries via a Core select."""
+
+    def setUp(self):
+        self.engine = make_engine(NODE_TABLE, Street.__table__)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_bounds_contains_node_row(self):
+        # Same as the bounds check in OSMImporter.process_ways
+        bounds = box(-123, 45, -122, 46)
+        with self.engine.begin() as connection:
+            connection.execute(NODE_TABLE.insert(), [
+                {'id': 1, 'is_intersection': True, 'geom': Point(-122.6, 45.5)},
+                {'id': 2, 'is_intersection': False, 'geom': Point(-121.6, 45.5)},
+            ])
+            rows = connection.execute(NODE_TABLE.select().order_by(NODE_TABLE.c.id)).fetchall()
+        self.assertEqual([bounds.contains(row.geom) for row in rows], [True, False])
+
+    def test_lazy_and_eager_street_rows(self):
+        line = LineString([(-122.6, 45.5), (-122.59, 45.5)])
+        table = Street.__table__
+        with self.engine.begin() as connection:
+            connection.execute(table.insert(), {'id': 1, 'geom': line})
+            lazy_geom = connection.execute(select([table.c.geom])).scalar()
+            geom = connection.execute(select([eager(table.c.geom)])).scalar()
+        self.assertIs(type(lazy_geom), LazyGeometry)
+        self.assertIs(type(geom), shapely.geometry.LineString)
+        self.assertEqual(shapely.get_coordinates(geom).tolist(), list(map(list, line.coords)))
+        self.assertTrue(box(-123, 45, -122, 46).contains(geom))
+
+
+class InterleavedLazyGeometry(LazyGeometry):
+
+    """Simulates another thread loading the geometry concurrently.
+
+    The other thread's load runs right after this thread has seen that
+    the geometry isn't loaded yet.
+
+    """
+
+    __slots__ = ('interleaved',)
+
+    def __init__(self, value, geometry_type):
+        self.interleaved = False
+        super().__init__(value, geometry_type)
+
+    @property
+    def _geom(self):
+        geom = LazyGeometry._geom.__get__(self)
+        if geom is None and not self.interleaved:
+            self.interleaved = True
+            LazyGeometry.load(self)
+        return geom
+
+    @_geom.setter
+    def _geom(self, geom):
+        LazyGeometry._geom.__set__(self, geom)
+
+
+class TestLazyGeometry(unittest.TestCase):
+
+    line = LineString([(-122.6, 45.5), (-122.59, 45.5), (-122.59, 45.51)])
+    point = Point(-122.595, 45.5001)
+
+    def lazy(self, geom, hex=False):
+        geometry_type = LineString if geom.geom_type == 'LineString' else Point
+        return LazyGeometry(wkb.dumps(geom, hex=hex), geometry_type)
+
+    def test_not_parsed_until_used(self):
+        lazy_line = self.lazy(self.line)
+        self.assertIsInstance(lazy_line, LineString)
+        self.assertNotIsInstance(lazy_line, Point)
+        self.assertFalse(lazy_line.is_loaded)
+        self.assertEqual(lazy_line.coords[:], self.line.coords[:])
+        self.assertTrue(lazy_line.is_loaded)
+
+    def test_hex(self):
+        self.assertEqual(self.lazy(self.line, hex=True), self.line)
+
+    def test_compatible(self):
+        lazy_line, lazy_point = self.lazy(self.line), self.lazy(self.point)
+        self.assertEqual(lazy_point.x, self.point.x)
+        self.assertEqual(lazy_line.length, self.line.length)
+        self.assertEqual(lazy_line.project(lazy_point), self.line.project(self.point))
+        self.assertEqual(lazy_line.interpolate(0.005), self.line.interpolate(0.005))
+        self.assertEqual(lazy_line.__json__(None), geometry_mapping(self.line))
+        self.assertEqual(lazy_line.wkt, self.line.wkt)
+        self.assertEqual(str(lazy_point), str(self.point))
+
+    def test_equality(self):
+        lazy_point = self.lazy(self.point)
+        self.assertEqual(lazy_point, self.point)
+        self.assertEqual(self.point, lazy_point)
+        self.assertEqual(hash(lazy_point), hash(self.point))
+        self.assertNotEqual(lazy_point, Point(0, 0))
+
+    def test_pickle(self):
+        self.assertEqual(pickle.loads(pickle.dumps(self.lazy(self.line))), self.line)
+
+    def test_concurrent_load(self):
+        lazy_line = InterleavedLazyGeometry(wkb.dumps(self.line), LineString)
+        self.assertEqual(lazy_line.load(), self.line)
+        self.assertTrue(lazy_line.interleaved)
+
+    def test_unwrap(self):
+        lazy_line = self.lazy(self.line)
+        self.assertIs(unwrap(lazy_line), lazy_line.load())
+        self.assertIs(unwrap(self.line), self.line)
+
+    def test_split_and_trim(self):
+        lazy_line, lazy_point = self.lazy(self.line), self.lazy(self.point)
+        self.assertEqual(split_line(lazy_line, lazy_point), split_line(self.line, self.point))
+        self.assertEqual(
+            trim_line(self.line, lazy_point, self.line.interpolate(0.01)),
+            trim_line(self.line, self.point, self.line.interpolate(0.01)))
+
+
+if __name__ == '__main__':
+    unittest.main()
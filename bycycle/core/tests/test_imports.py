@@ -0,0 +1,98 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+
+# Dependencies that should only be imported when they're used
+LAZY_MODULES = ('dijkstar', 'httpx', 'mapbox', 'pyproj', 'requests')
+
+# Modules that importing each module should *not* import; the CLI only
+# imports the database and services when a command needs them
+UNEXPECTED_IMPORTS = {
+    'bycycle.core.__main__': LAZY_MODULES + (
+        'bycycle.core.model',
+        'bycycle.core.service',
+        'numpy',
+        'shapely',
+        'sqlalchemy',
+        'sqlalchemy.orm',
+    ),
+    'bycycle.core.model': LAZY_MODULES,
+    'bycycle.core.service': LAZY_MODULES,
+}
+
+# Import time budgets in milliseconds (see test_import_time)
+IMPORT_TIME_BUDGETS = {
+    'bycycle.core.__main__': 250,
+    'bycycle.core.model': 1000,
+    'bycycle.core.service': 1500,
+}
+
+
+def run_python(*args):
+    return subprocess.run(
+        [sys.executable, '-W', 'ignore', *args],
+        capture_output=True,
+        check=True,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'),
+        text=True,
+    )
+
+
+def get_imported_modules(module):
+    """Import ``module`` in a fresh interpreter.
+
+    Returns:
+        set: Names of all the modules that were imported
+
+    """
+    output = run_python('-c', f'import json, sys, {module}; print(json.dumps(list(sys.modules)))')
+    return set(json.loads(output.stdout))
+
+
+def get_import_times(module):
+    """Import ``module`` in a fresh interpreter.
+
+    Returns:
+        dict: Cumulative import time in microseconds of each module
+            that was imported
+
+    """
+    output = run_python('-X', 'importtime', '-c', f'import {module}')
+    times = {}
+    for line in output.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImports(unittest.TestCase):
+
+    def test_unexpected_imports(self):
+        for module, unexpected in UNEXPECTED_IMPORTS.items():
+            modules = get_imported_modules(module)
+            self.assertIn(module, modules)
+            for name in unexpected:
+                self.assertNotIn(name, modules, f'{name} imported by {module}')
+
+    @unittest.skipUnless(
+        os.environ.get('BYCYCLE_TEST_IMPORT_TIME'),
+        'Set BYCYCLE_TEST_IMPORT_TIME=1 to check import times')
+    def test_import_time(self):
+        # Wall clock times depend on the machine and its load, so this
+        # is opt-in; BYCYCLE_IMPORT_TIME_BUDGET_SCALE scales the budgets
+        scale = float(os.environ.get('BYCYCLE_IMPORT_TIME_BUDGET_SCALE', 1))
+        for module, budget in IMPORT_TIME_BUDGETS.items():
+            # Best of three to smooth out noise
+            import_time = min(get_import_times(module)[module] for _ in range(3)) / 1000
+            self.assertLess(
+                import_time, budget * scale,
+                f'Importing {module} took {import_time:.0f}ms (budget: {budget * scale:.0f}ms)')
+
+
+if __name__ == '__main__':
+    unittest.main()
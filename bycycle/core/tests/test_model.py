@@ -0,0 +1,407 @@
+import json
+import os
+import threading
+import unittest
+from collections.abc import Sequence
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import column, func, lambda_stmt, select, table, text
+
+from bycycle.core.geometry import LineString, Point
+from bycycle.core.model import (
+    GeocodeCache,
+    Intersection,
+    NodeEdge,
+    ReplicaRouter,
+    Street,
+    get_engine,
+    get_replica_router,
+    get_session_factory,
+    get_statement_cache_stats,
+    set_replica_router,
+)
+from bycycle.core.model.base import Entity
+from bycycle.core.model.street import normalize_street_name
+
+from .sqlite import make_engine
+
+
+def to_json_data_without_plan(obj, request=None):
+    """Original implementation of :meth:`Entity.__json__`."""
+    data = {}
+    fields = obj.json_fields
+    default_include = (k for k in obj.__dict__ if not k.startswith('_'))
+    default_exclude = ('json_fields',)
+    if fields == '*':
+        include = default_include
+        exclude = default_exclude
+    elif isinstance(fields, Sequence) and not isinstance(fields, str):
+        include = fields
+        exclude = ()
+    else:
+        include = fields.get('include', default_include)
+        exclude = fields.get('exclude', default_exclude)
+    fields = set(include)
+    if '*' in fields:
+        fields.remove('*')
+        fields |= set(default_include)
+    fields -= set(exclude)
+    for field in fields:
+        v = obj
+        for name in field.split('.'):
+            v = getattr(v, name)
+        if isinstance(v, Entity):
+            v = to_json_data_without_plan(v, request)
+        elif hasattr(v, '__json__'):
+            v = v.__json__(request)
+        data[field] = v
+    return data
+
+
+class Thing(Entity):
+
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class Dotted(Thing):
+
+    json_fields = ['a', 'child.b', 'child.geom']
+
+
+class IncludeExclude(Thing):
+
+    json_fields = {'include': ['*', 'extra'], 'exclude': ['secret']}
+
+    extra = 'extra'
+
+
+class TestJSONPlans(unittest.TestCase):
+
+    def _check(self, obj):
+        expected = json.dumps(to_json_data_without_plan(obj), default=repr)
+        # Twice so the second call uses the cached plan
+        self.assertEqual(json.dumps(obj.__json__(), default=repr), expected)
+        self.assertEqual(json.dumps(obj.__json__(), default=repr), expected)
+
+    def test_all_attributes(self):
+        for i in range(3):
+            self._check(Thing(a=i, b='b', c=[1, 2], _private=True, json_fields='*'))
+        # Different attributes for the same class
+        self._check(Thing(x=1, y=2, z=3))
+
+    def test_dotted_fields(self):
+        child = SimpleNamespace(b=2, geom=LineString([(0, 0), (1, 1)]))
+        self._check(Dotted(a=1, child=child))
+
+    def test_include_exclude(self):
+        self._check(IncludeExclude(a=1, secret='shh', nested=Thing(d=4)))
+
+    def test_intersection(self):
+        street = Street(id=1, name='A St', geom=LineString([(0, 0), (0, 1)]))
+        intersection = Intersection(id=1, geom=Point(0, 0), _name='A St & B St')
+        intersection.streets = [street]
+        self._check(intersection)
+
+
+class TestStreetBearings(unittest.TestCase):
+
+    geom = LineString([(0, 0), (0, 1), (1, 1)])
+
+    def test_get_bearings(self):
+        street = Street(id=1, geom=self.geom, start_bearing=10, end_bearing=100)
+        self.assertEqual(street.get_bearings(), (10, 100))
+        self.assertEqual(street.get_bearings(reverse=True), (280, 190))
+
+    def test_get_bearings_from_geometry(self):
+        # Streets in databases that haven't been backfilled
+        street = Street(id=1, geom=self.geom)
+        self.assertEqual(street.get_bearings(), (0, 90))
+        self.assertEqual(street.get_bearings(reverse=True), (270, 180))
+
+    def test_update_bearings(self):
+        table = Street.__table__
+        engine = make_engine(table)
+        self.addCleanup(engine.dispose)
+        with engine.begin() as connection:
+            connection.execute(table.insert(), [
+                {'id': 1, 'geom': self.geom, 'start_bearing': None, 'end_bearing': None},
+                {'id': 2, 'geom': LineString([(0, 0), (1, 0)]), 'start_bearing': 90,
+                 'end_bearing': None},
+                {'id': 3, 'geom': self.geom, 'start_bearing': 1, 'end_bearing': 2},
+            ])
+            self.assertEqual(Street.update_bearings(connection, batch_size=1), 2)
+            q = select([table.c.id, table.c.start_bearing, table.c.end_bearing])
+            rows = connection.execute(q.order_by(table.c.id)).fetchall()
+            self.assertEqual([tuple(r) for r in rows], [(1, 0, 90), (2, 90, 90), (3, 1, 2)])
+            self.assertEqual(Street.update_bearings(connection), 0)
+
+
+class TestNodeEdges(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = make_engine(Intersection.__table__, Street.__table__, NodeEdge.__table__)
+        self.addCleanup(self.engine.dispose)
+        self.connection = self.engine.connect()
+        self.addCleanup(self.connection.close)
+        self.connection.execute(Intersection.__table__.insert(), [
+            {'id': i, 'geom': Point(i, 0), 'name': None} for i in range(1, 7)
+        ])
+        self.connection.execute(Street.__table__.insert(), [
+            self._street(1, 'N Alder St', 1, 2),
+            self._street(2, 'N Alder St', 2, 3),
+            self._street(3, 'SE Burnside St', 2, 4),
+            self._street(4, 'NE Couch St', 5, None),
+            self._street(5, None, 3, 4),
+        ])
+        # Stale rows are replaced
+        self.connection.execute(NodeEdge.__table__.insert(), {'node_id': 6, 'edge_id': 1})
+
+    def _street(self, id, name, start_node_id, end_node_id):
+        return {
+            'id': id, 'name': name, 'start_node_id': start_node_id, 'end_node_id': end_node_id,
+            'geom': LineString([(start_node_id, 0), (end_node_id or 0, 1)]),
+        }
+
+    def test_populate(self):
+        self.assertEqual(NodeEdge.populate(self.connection), 9)
+        table = NodeEdge.__table__
+        q = select([table.c.node_id, table.c.edge_id]).order_by(table.c.node_id, table.c.edge_id)
+        rows = [tuple(row) for row in self.connection.execute(q)]
+        self.assertEqual(rows, [
+            (1, 1),
+            (2, 1), (2, 2), (2, 3),
+            (3, 2), (3, 5),
+            (4, 3), (4, 5),
+            (5, 4),
+        ])
+        streets = NodeEdge.get_streets(self.connection, [2, 6])
+        self.assertEqual([street.id for street in streets[2]], [1, 2, 3])
+        self.assertEqual(streets[2][2].name, 'SE Burnside St')
+        self.assertEqual(streets[6], [])
+
+    def test_update_names(self):
+        NodeEdge.populate(self.connection)
+        Intersection.update_names(self.connection, batch_size=2)
+        table = Intersection.__table__
+        q = select([table.c.id, table.c.name]).order_by(table.c.id)
+        names = dict(tuple(row) for row in self.connection.execute(q))
+        self.assertEqual(names, {
+            1: 'N Alder St',
+            # Duplicate names are only included once
+            2: 'N Alder St & SE Burnside St',
+            # Unnamed streets are skipped
+            3: 'N Alder St',
+            4: 'SE Burnside St',
+            5: 'NE Couch St',
+            # No streets
+            6: '',
+        })
+
+
+class TestGeocodeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.table = GeocodeCache.__table__
+        self.engine = make_engine(self.table)
+        self.addCleanup(self.engine.dispose)
+        with self.engine.begin() as connection:
+            connection.execute(self.table.insert(), [
+                {'key': key, 'query': key, 'data': [{'id': key}], 'hits': 0}
+                for key in ('a', 'b', 'c')
+            ])
+
+    def get_hits(self):
+        q = select([self.table.c.key, self.table.c.hits]).order_by(self.table.c.key)
+        return dict(tuple(row) for row in self.engine.execute(q))
+
+    def test_get_data(self):
+        self.assertEqual(GeocodeCache.get_data(self.engine, 'a'), [{'id': 'a'}])
+        self.assertIsNone(GeocodeCache.get_data(self.engine, 'x'))
+        # Reads don't write
+        self.assertEqual(self.get_hits(), {'a': 0, 'b': 0, 'c': 0})
+
+    def test_record_hits(self):
+        GeocodeCache.record_hits(self.engine, ['a', 'b', 'a', 'x'])
+        self.assertEqual(self.get_hits(), {'a': 2, 'b': 1, 'c': 0})
+        GeocodeCache.record_hits(self.engine, [])
+        self.assertEqual(self.get_hits(), {'a': 2, 'b': 1, 'c': 0})
+        q = select([self.table.c.accessed_at]).where(self.table.c.key == 'a')
+        self.assertIsNotNone(self.engine.execute(q).scalar())
+
+
+class TestNormalizeStreetName(unittest.TestCase):
+
+    street_type_map = {'avenue': 'AVE', 'ave': 'AVE', 'street': 'ST', 'st': 'ST'}
+
+    def _check(self, name, expected):
+        self.assertEqual(normalize_street_name(name, self.street_type_map), expected)
+
+    def test_blank(self):
+        self._check('  ', None)
+
+    def test_single_word(self):
+        self._check(' Broadway ', 'Broadway')
+
+    def test_prefix(self):
+        self._check('North Main Street', 'N Main St')
+        self._check('northeast 10th avenue', 'NE 10th Ave')
+        self._check('SW Broadway', 'SW Broadway')
+        # The last word is the name when there's only a prefix
+        self._check('North Street', 'N Street')
+
+    def test_suffix(self):
+        self._check('Main Street North', 'Main St N')
+        self._check('Main St West', 'Main St W')
+
+    def test_unknown_street_type(self):
+        self._check('SE Foster Road', 'SE Foster Road')
+        self._check('Martin Luther King Jr Blvd', 'Martin Luther King Jr Blvd')
+
+
+class TestStatementCache(unittest.TestCase):
+
+    def test_hit_rate(self):
+        engine = create_engine('sqlite://')
+        stats = get_statement_cache_stats(engine)
+        self.assertIs(get_statement_cache_stats(engine), stats)
+        self.assertIsNone(stats.hit_rate)
+        with engine.connect() as connection:
+            for value in range(4):
+                q = lambda_stmt(lambda: (
+                    select(column('a'))
+                    .select_from(text('(select 1 as a)'))
+                    .where(column('a') < value)
+                ))
+                self.assertEqual(connection.execute(q).scalar(), None if value < 2 else 1)
+        self.assertEqual(stats.hits, 3)
+        self.assertEqual(stats.misses, 1)
+        self.assertEqual(stats.hit_rate, 0.75)
+
+    def test_get_streets_statement(self):
+        statements = []
+        bind = SimpleNamespace(execute=lambda q: statements.append(q) or [])
+        self.assertEqual(NodeEdge.get_streets(bind, [1, 2]), {1: [], 2: []})
+        self.assertEqual(NodeEdge.get_streets(bind, [3, 4, 5]), {3: [], 4: [], 5: []})
+        key1, key2 = (q._generate_cache_key() for q in statements)
+        self.assertEqual(key1.key, key2.key)
+        self.assertEqual([p.value for p in key2.bindparams], [[3, 4, 5]])
+
+
+class TestReadReplicas(unittest.TestCase):
+
+    def setUp(self):
+        self.primary = self.make_engine('primary')
+        self.replica = self.make_engine('replica')
+        self.router = ReplicaRouter(self.primary, [self.replica], max_lag=10, check_interval=0)
+        self.addCleanup(self.router.dispose)
+        set_replica_router(self.primary, self.router)
+        self.session_factory = get_session_factory(self.primary)
+        self.q = select(table('t', column('a')).c.a)
+
+    def make_engine(self, name):
+        engine = create_engine('sqlite://')
+        with engine.begin() as connection:
+            connection.execute(text('create table t (a text)'))
+            connection.execute(text('insert into t values (:a)'), {'a': name})
+        self.addCleanup(engine.dispose)
+        return engine
+
+    def read(self):
+        session = self.session_factory()
+        try:
+            return session.execute(self.q).scalar()
+        finally:
+            session.close()
+
+    def test_get_engine(self):
+        engine = get_engine(
+            host='primary', replicas=[{'host': 'replica'}, 'postgresql://u@other/db'],
+            max_replica_lag=1)
+        router = get_replica_router(engine)
+        self.assertEqual([r.url.host for r in router.replicas], ['replica', 'other'])
+        self.assertEqual(router.replicas[0].url.database, engine.url.database)
+        self.assertEqual(router.max_lag, 1)
+        self.assertIsNone(get_replica_router(get_engine()))
+        router.dispose()
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.read(), 'replica')
+
+    def test_reads_after_write_go_to_primary(self):
+        session = self.session_factory()
+        self.assertEqual(session.execute(self.q).scalar(), 'replica')
+        session.execute(text("insert into t values ('new')"))
+        self.assertEqual(session.execute(self.q).scalar(), 'primary')
+        self.assertIs(session.get_bind(), self.primary)
+        session.close()
+
+    def test_lagging_replica(self):
+        self.router.get_lag = lambda replica: 20
+        self.assertEqual(self.read(), 'primary')
+        self.router.get_lag = lambda replica: 5
+        # The previous status is used until the next check finishes
+        self.assertEqual(self.read(), 'primary')
+        self.router.checks[self.replica].result()
+        self.assertEqual(self.read(), 'replica')
+
+    def test_check_in_background(self):
+        self.assertEqual(self.read(), 'replica')
+        checking = threading.Event()
+        finish = threading.Event()
+        checks = []
+
+        def get_lag(replica):
+            checks.append(replica)
+            checking.set()
+            finish.wait(5)
+            return 20
+
+        self.router.get_lag = get_lag
+        self.assertEqual(self.read(), 'replica')
+        self.assertTrue(checking.wait(5))
+        # Reads aren't blocked by the check and only one check is run
+        # at a time
+        self.assertEqual(self.read(), 'replica')
+        self.assertEqual(checks, [self.replica])
+        finish.set()
+        self.router.checks[self.replica].result()
+        self.assertEqual(self.read(), 'primary')
+
+    def test_unavailable_replica(self):
+        def get_lag(replica):
+            raise OperationalError('select', {}, Exception('connection refused'))
+
+        self.router.get_lag = get_lag
+        self.assertEqual(self.read(), 'primary')
+
+
+@unittest.skipUnless(
+    os.environ.get('BYCYCLE_TEST_PRIMARY_URL') and os.environ.get('BYCYCLE_TEST_REPLICA_URL'),
+    'Set BYCYCLE_TEST_PRIMARY_URL and BYCYCLE_TEST_REPLICA_URL to test with PostgreSQL')
+class TestPostgreSQLReadReplicas(unittest.TestCase):
+
+    """Test with a primary PostgreSQL server and a streaming replica."""
+
+    def test_routing(self):
+        engine = create_engine(os.environ['BYCYCLE_TEST_PRIMARY_URL'])
+        replica = create_engine(os.environ['BYCYCLE_TEST_REPLICA_URL'])
+        router = ReplicaRouter(engine, [replica])
+        set_replica_router(engine, router)
+        self.assertGreaterEqual(router.get_lag(replica), 0)
+        self.assertEqual(router.get_lag(engine), 0)
+        session = get_session_factory(engine)()
+        try:
+            self.assertTrue(session.execute(select(func.pg_is_in_recovery())).scalar())
+            session.execute(text('select 1'))
+            self.assertFalse(session.execute(select(func.pg_is_in_recovery())).scalar())
+        finally:
+            session.close()
+            router.dispose()
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import dijkstar
+
+from shapely.geometry import Point
+
+from sqlalchemy.sql import select
+
+from bycycle.core.geometry import LineString
+from bycycle.core.geometry.sqltypes import eager_columns
+from bycycle.core.model import Address, Place, Street, get_session_factory
+from bycycle.core.osm import OSMGraphBuilder, OSMImporter
+
+from .sqlite import make_engine
+
+
+class TestOSMGraphBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = make_engine(Street.__table__)
+        self.addCleanup(self.engine.dispose)
+        self.session = get_session_factory(self.engine)()
+        self.addCleanup(self.session.close)
+        insert = Street.__table__.insert()
+        self.session.execute(insert, {
+            'id': 10, 'name': 'A St', 'start_node_id': 1, 'end_node_id': 2,
+            'base_cost': 5.0, 'geom': LineString([(0, 0), (0, 1), (1, 1)]),
+            'start_bearing': 0.0, 'end_bearing': 90.0, 'oneway_bicycle': False,
+        })
+        # Bearings not backfilled yet
+        self.session.execute(insert, {
+            'id': 11, 'name': None, 'description': 'Path', 'start_node_id': 2,
+            'end_node_id': 3, 'base_cost': 6.0, 'geom': LineString([(1, 1), (2, 1)]),
+            'oneway_bicycle': True,
+        })
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def test_edges(self):
+        path = os.path.join(self.dir.name, 'graph.marshal')
+        OSMGraphBuilder(path, session=self.session, quiet=True).run()
+        graph = dijkstar.Graph.unmarshal(path)
+        # Edges are (ID, cost, name, start bearing, end bearing) with
+        # bearings in the direction of travel
+        self.assertEqual(graph.get_edge(1, 2), (10, 5.0, 'A St', 0.0, 90.0))
+        self.assertEqual(graph.get_edge(2, 1), (10, 5.0, 'A St', 270.0, 180.0))
+        self.assertEqual(graph.get_edge(2, 3), (11, 6.0, 'Path', 90.0, 90.0))
+        self.assertEqual(graph[3], {})
+        self.assertTrue(os.path.exists(OSMGraphBuilder.get_edge_store_path(path)))
+
+
+STREET_TYPE_MAP = {'street': 'ST', 'st': 'ST', 'avenue': 'AVE', 'ave': 'AVE'}
+
+# Nodes 1-4 are used only by way 10 and node 5 is out of bounds
+PLACES = {'elements': [
+    {'type': 'node', 'id': 1, 'lat': 45.5, 'lon': -122.6},
+    {'type': 'node', 'id': 2, 'lat': 45.5, 'lon': -122.5},
+    {'type': 'node', 'id': 3, 'lat': 45.6, 'lon': -122.5},
+    {'type': 'node', 'id': 4, 'lat': 45.6, 'lon': -122.6},
+    {'type': 'node', 'id': 5, 'lat': 47.0, 'lon': -122.6, 'tags': {
+        'name': 'Far Away Cafe', 'amenity': 'cafe'}},
+    {'type': 'node', 'id': 6, 'lat': 45.55, 'lon': -122.65, 'tags': {
+        'name': ' Cafe  Uno ', 'amenity': 'cafe', 'addr:housenumber': '123',
+        'addr:street': 'North Main Street'}},
+    {'type': 'node', 'id': 7, 'lat': 45.55, 'lon': -122.65, 'tags': {'name': 'Not a Place'}},
+    {'type': 'way', 'id': 10, 'nodes': [1, 2, 3, 4, 1], 'tags': {
+        'name': 'Grocery', 'shop': 'supermarket', 'building': 'yes'}},
+    {'type': 'way', 'id': 11, 'nodes': [1, 2], 'tags': {'highway': 'residential'}},
+]}
+
+
+class TestOSMImporter(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.engine = make_engine(Address.__table__, Place.__table__)
+        self.addCleanup(self.engine.dispose)
+        self.importer = self.make_importer()
+        self.write_data_file('places.json', PLACES)
+
+    def make_importer(self):
+        # The importer's own engine is never connected to
+        connection_args = {'driver': 'sqlite', 'user': None, 'password': None, 'host': None,
+                           'database': None}
+        bbox = (-123, 45, -122, 46)
+        graph_path = os.path.join(self.dir.name, 'graph.marshal')
+        importer = OSMImporter(bbox, self.dir.name, graph_path, connection_args)
+        importer.session = get_session_factory(self.engine)()
+        self.addCleanup(importer.session.close)
+        importer.street_type_map = STREET_TYPE_MAP
+        return importer
+
+    def write_data_file(self, file_name, data):
+        Path(self.dir.name, file_name).write_text(json.dumps(data))
+
+    def test_action_numbers(self):
+        # Actions can be selected by number, so the numbers of existing
+        # actions shouldn't change when actions are added
+        names = [act.meth.__name__ for act in self.importer.all_actions]
+        self.assertEqual(names[:10], [
+            'drop_street_tables',
+            'create_street_tables',
+            'find_intersections',
+            'process_nodes',
+            'process_ways',
+            'drop_node_table',
+            'create_graph',
+            'drop_place_tables',
+            'create_place_tables',
+            'process_places',
+        ])
+        self.assertEqual(names[10:], [
+            'drop_address_tables',
+            'create_address_tables',
+            'process_addresses',
+            'process_node_edges',
+        ])
+        self.assertEqual([act.order for act in self.importer.all_actions],
+                         list(range(1, len(names) + 1)))
+
+    def test_iter_located_elements(self):
+        elements = list(self.importer.iter_located_elements(
+            'places.json', lambda tags: 'name' in tags))
+        self.assertEqual(len(elements), 3)
+        (type_1, id_1, tags_1, geom_1), (type_2, id_2, tags_2, geom_2) = elements[1:]
+        self.assertEqual((type_1, id_1, tags_1['name']), ('node', 7, 'Not a Place'))
+        self.assertEqual(geom_1, Point(-122.65, 45.55))
+        # Ways are located at their centroids
+        self.assertEqual((type_2, id_2, tags_2['name']), ('way', 10, 'Grocery'))
+        self.assertAlmostEqual(geom_2.x, -122.55)
+        self.assertAlmostEqual(geom_2.y, 45.55)
+
+    def test_process_places(self):
+        self.importer.process_places()
+        table = Place.__table__
+        q = select(eager_columns(table)).order_by(table.c.osm_id)
+        rows = self.importer.session.execute(q).fetchall()
+        self.assertEqual(len(rows), 2)
+        cafe, grocery = rows
+        self.assertEqual((cafe.osm_type, cafe.osm_id), ('node', 6))
+        self.assertEqual(cafe.name, 'Cafe Uno')
+        self.assertEqual((cafe.category, cafe.type), ('amenity', 'cafe'))
+        self.assertEqual(cafe.address, '123 N Main St')
+        self.assertEqual(cafe.geom, Point(-122.65, 45.55))
+        self.assertEqual((grocery.osm_type, grocery.osm_id), ('way', 10))
+        self.assertEqual((grocery.category, grocery.type), ('shop', 'supermarket'))
+        self.assertIsNone(grocery.address)
+        self.assertTrue(grocery.geom.within(self.importer.bounds))
+
+    def test_process_places_replaces_existing_places(self):
+        self.importer.process_places()
+        self.importer.process_places()
+        rows = self.importer.session.execute(select(Place.__table__.c.osm_id)).fetchall()
+        self.assertEqual(sorted(row.osm_id for row in rows), [6, 10])
+
+
+    def test_process_addresses(self):
+        address = {'addr:housenumber': ' 123A ', 'addr:street': 'North Main Street'}
+        self.write_data_file('addresses.json', {'elements': [
+            {'type': 'node', 'id': 1, 'lat': 45.5, 'lon': -122.6, 'tags': {
+                **address, 'addr:unit': '2', 'addr:postcode': '97217'}},
+            {'type': 'node', 'id': 2, 'lat': 45.5, 'lon': -122.6, 'tags': {
+                'addr:housenumber': '124'}},
+            {'type': 'node', 'id': 3, 'lat': 45.5, 'lon': -122.6, 'tags': {
+                'addr:housenumber': 'Unit B', 'addr:street': 'Main St'}},
+        ]})
+        self.write_data_file('buildings.json', {'elements': [
+            # Also in addresses file
+            {'type': 'node', 'id': 1, 'lat': 45.5, 'lon': -122.6, 'tags': address},
+            {'type': 'node', 'id': 4, 'lat': 45.5, 'lon': -122.5},
+            {'type': 'node', 'id': 5, 'lat': 45.6, 'lon': -122.5},
+            {'type': 'node', 'id': 6, 'lat': 45.6, 'lon': -122.6},
+            {'type': 'way', 'id': 1, 'nodes': [1, 4, 5, 6, 1], 'tags': {
+                'building': 'yes', 'addr:housenumber': '200', 'addr:street': 'Main Ave'}},
+        ]})
+        self.importer.process_addresses()
+        table = Address.__table__
+        q = select(eager_columns(table)).order_by(table.c.osm_type, table.c.osm_id)
+        rows = self.importer.session.execute(q).fetchall()
+        self.assertEqual(len(rows), 3)
+        node, unit, way = rows
+        self.assertEqual((node.osm_type, node.osm_id), ('node', 1))
+        self.assertEqual((node.house_number, node.number), ('123A', 123))
+        self.assertEqual(node.street, 'N Main St')
+        self.assertEqual((node.unit, node.postcode, node.city), ('2', '97217', None))
+        self.assertEqual(node.geom, Point(-122.6, 45.5))
+        # House numbers without a number can't be interpolated
+        self.assertEqual((unit.house_number, unit.number, unit.street), ('Unit B', None, 'Main St'))
+        self.assertEqual((way.osm_type, way.osm_id), ('way', 1))
+        self.assertEqual((way.house_number, way.number, way.street), ('200', 200, 'Main Ave'))
+        self.assertAlmostEqual(way.geom.x, -122.55)
+        self.assertAlmostEqual(way.geom.y, 45.55)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import asyncpg
+    import httpx
+except ImportError:
+    asyncpg = httpx = None
+
+from sqlalchemy.sql import select
+
+from bycycle.core.edgestore import EdgeStore
+from bycycle.core.model import GeocodeCache, get_async_engine, get_async_session_factory
+from bycycle.core.service.route import RouteService
+from bycycle.core.util import LRUCache
+
+from ..sqlite import make_engine
+from . import test_route
+from .test_lookup import StubMapboxHandler
+
+
+class StubDijkstarHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.server.requests.append(url)
+        *_, start, end = url.path.split('/')
+        if start == end:
+            status = 404
+            data = {'explanation': 'Not Found', 'detail': 'No path'}
+        else:
+            status = 200
+            data = {'nodes': [int(start), int(end)], 'edges': [[1, 2, 'A St']]}
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipUnless(httpx, 'async extra is not installed')
+class TestAsyncServices(unittest.TestCase):
+
+    def start_server(self, handler):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.lock = threading.Lock()
+        server.requests = []
+        server.in_flight = 0
+        server.max_in_flight = 0
+        server.delay = 0
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address
+        return server, f'http://{host}:{port}'
+
+    def test_geocode_concurrently(self):
+        from bycycle.core.service.lookup.aio import AsyncLookupService
+
+        server, base_url = self.start_server(StubMapboxHandler)
+        server.delay = 0.1
+        service = AsyncLookupService(
+            None,
+            mapbox_access_token='test-token',
+            mapbox_host=base_url,
+            geocode_cache=LRUCache(),
+            persistent_geocode_cache=False,
+        )
+        waypoints = ['123 Main St', '456 Main St', '789 Main St']
+
+        async def geocode():
+            try:
+                return await asyncio.gather(*map(service.geocode_via_mapbox, waypoints))
+            finally:
+                await service.aclose()
+
+        all_features = asyncio.run(geocode())
+        for w, features in zip(waypoints, all_features):
+            self.assertIn(w.replace(' ', '%20'), features[0]['place_name'])
+        self.assertEqual(server.max_in_flight, 3)
+        self.assertIn('access_token=test-token', server.requests[0][0])
+
+    def test_persistent_cache_uses_own_connections(self):
+        from bycycle.core.service.lookup.aio import AsyncLookupService
+
+        table = GeocodeCache.__table__
+        engine = make_engine(table)
+        self.addCleanup(engine.dispose)
+        waypoints = ['123 Main St', '456 Main St', '789 Main St']
+        options = {'bbox': None, 'center': None}
+        with engine.begin() as connection:
+            connection.execute(table.insert(), [
+                {'key': GeocodeCache.make_key(w, **options), 'query': w, 'data': [{'w': w}],
+                 'hits': 0}
+                for w in waypoints
+            ])
+        connections = []
+
+        class AsyncConnection:
+
+            async def __aenter__(self):
+                connections.append(self)
+                self.connection = engine.connect()
+                return self
+
+            async def __aexit__(self, *exc_info):
+                self.connection.close()
+
+            async def run_sync(self, fn, *args):
+                await asyncio.sleep(0)
+                return fn(self.connection, *args)
+
+        def run_sync(fn):
+            raise AssertionError('Geocode cache accessed via session')
+
+        engine_facade = SimpleNamespace(connect=AsyncConnection)
+        session = SimpleNamespace(bind=engine_facade, run_sync=run_sync)
+        service = AsyncLookupService(
+            session,
+            mapbox_access_token='test-token',
+            geocode_cache=LRUCache(),
+            geocode_cache_ttl=None,
+            record_geocode_cache_hits=True,
+        )
+
+        async def geocode():
+            try:
+                return await asyncio.gather(*map(service.geocode_via_mapbox, waypoints))
+            finally:
+                await service.aclose()
+
+        all_features = asyncio.run(geocode())
+        self.assertEqual(all_features, [[{'w': w}] for w in waypoints])
+        # One connection per read and one per hit
+        self.assertEqual(len(connections), 6)
+        hits = engine.execute(select([table.c.hits]))
+        self.assertEqual([row.hits for row in hits], [1, 1, 1])
+
+    def test_find_path(self):
+        from dijkstar.server.client import ClientError
+        from bycycle.core.service.route.aio import AsyncDijkstarClient
+
+        server, base_url = self.start_server(StubDijkstarHandler)
+
+        async def find_paths():
+            client = AsyncDijkstarClient(base_url)
+            try:
+                result = await client.find_path(1, 2, annex_edges=[(-1, 1, [1])])
+                with self.assertRaises(ClientError) as context:
+                    await client.find_path(3, 3)
+                return result, context.exception
+            finally:
+                await client.aclose()
+
+        result, exc = asyncio.run(find_paths())
+        self.assertEqual(result['nodes'], [1, 2])
+        self.assertEqual(exc.status_code, 404)
+        self.assertEqual(parse_qs(server.requests[0].query)['annex_edges'], ['-1:1:[1]'])
+
+    def test_make_directions(self):
+        from bycycle.core.service.route.aio import AsyncRouteService
+
+        edge_store = EdgeStore.build(test_route.TestMakeDirectionsWithEdgeStore.streets)
+        path = [1, 2, 3, 4], [10, 11, 12], {}
+
+        async def make_directions():
+            # Directions are made from the edge store, so the database
+            # isn't queried (and no connection is made)
+            engine = get_async_engine()
+            session = get_async_session_factory(engine)()
+            try:
+                service = AsyncRouteService(session, edge_store=edge_store)
+                return await service.make_directions(*path)
+            finally:
+                await session.close()
+                await engine.dispose()
+
+        directions, linestring, distance = asyncio.run(make_directions())
+        expected = RouteService(None, edge_store=edge_store).make_directions(*path)
+        self.assertEqual(directions, expected[0])
+        self.assertEqual(linestring, expected[1])
+        self.assertEqual(distance, expected[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
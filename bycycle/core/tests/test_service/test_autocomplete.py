@@ -0,0 +1,86 @@
+import unittest
+
+from bycycle.core.service import AutocompleteService
+from bycycle.core.service.autocomplete import AutocompleteIndex
+
+
+STREET_TYPE_MAP = {
+    'avenue': 'AVE',
+    'ave': 'AVE',
+    'av': 'AVE',
+    'street': 'ST',
+    'st': 'ST',
+}
+
+#     1      2      3
+#  ---*------*------*---  NE Holladay St
+#     |      |
+#  ---*------*----------  NE Halsey St
+#     4      5
+#     |
+#     6
+ROWS = [
+    ('NE Holladay St', 1, 2),
+    ('NE Holladay St', 2, 3),
+    ('NE Holladay St', 3, 7),
+    ('NE Halsey St', 4, 5),
+    ('NE Halsey St', 5, 8),
+    ('NE 9th Ave', 1, 4),
+    ('NE 9th Ave', 4, 6),
+    ('NE 10th Ave', 2, 5),
+    ('N Williams Ave', 9, 10),
+    ('N Atlantic St', 11, 12),
+    ('SE Andover Pl', 13, 14),
+]
+
+
+class TestAutocompleteService(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.index = AutocompleteIndex(ROWS, STREET_TYPE_MAP)
+
+    def _query(self, q, **kwargs):
+        service = AutocompleteService(None, autocomplete_index=self.index)
+        return service.query(q, **kwargs)
+
+    def test_complete_with_prefix(self):
+        self.assertEqual(self._query('NE H'), ['NE Holladay St', 'NE Halsey St'])
+
+    def test_complete_without_direction(self):
+        self.assertEqual(self._query('hals'), ['NE Halsey St'])
+
+    def test_complete_normalizes_input(self):
+        self.assertEqual(self._query('ne 9th avenue'), ['NE 9th Ave'])
+
+    def test_limit(self):
+        self.assertEqual(self._query('n', limit=1), ['NE Holladay St'])
+
+    def test_no_completions(self):
+        self.assertEqual(self._query('xyz'), [])
+
+    def test_cross_streets(self):
+        self.assertEqual(self._query('NE 9th Ave & '), [
+            'NE 9th Ave & NE Holladay St',
+            'NE 9th Ave & NE Halsey St',
+        ])
+
+    def test_cross_streets_with_prefix(self):
+        self.assertEqual(self._query('NE 10th and NE Hal'), ['NE 10th Ave & NE Halsey St'])
+
+    def test_cross_streets_without_trailing_space(self):
+        self.assertEqual(self._query('NE 10th &'), [
+            'NE 10th Ave & NE Holladay St',
+            'NE 10th Ave & NE Halsey St',
+        ])
+
+    def test_complete_street_starting_with_at(self):
+        self.assertEqual(self._query('N At'), ['N Atlantic St'])
+        self.assertEqual(self._query('atl'), ['N Atlantic St'])
+
+    def test_complete_street_starting_with_and(self):
+        self.assertEqual(self._query('SE And'), ['SE Andover Pl'])
+        self.assertEqual(self._query('se andov'), ['SE Andover Pl'])
+
+    def test_cross_streets_only_includes_intersecting_streets(self):
+        self.assertEqual(self._query('Williams & NE'), [])
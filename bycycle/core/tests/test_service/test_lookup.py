@@ -1,23 +1,47 @@
+import json
+import threading
+import time
 import unittest
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
 
-from bycycle.core.model import get_engine, get_session_factory, LookupResult
-from bycycle.core.service import LookupService
+from shapely import wkb
+
+from sqlalchemy.sql import select
+
+from bycycle.core.geometry import LineString, Point
+
+from bycycle.core.app import App
+from bycycle.core.model import (
+    Address,
+    GeocodeCache,
+    LookupResult,
+    ReplicaRouter,
+    Street,
+    get_session_factory,
+    set_replica_router,
+)
+from bycycle.core.service import LookupService, RouteService
+from bycycle.core.service.lookup import MultipleLookupResultsError
+from bycycle.core.util import LRUCache
+
+from ..sqlite import make_engine
 
 
 class TestLookupService(unittest.TestCase):
 
-    def setUp(self):
-        self.engine = get_engine()
-        self.session_factory = get_session_factory(self.engine)
-        self.session = self.session_factory()
+    @classmethod
+    def setUpClass(cls):
+        cls.app = App()
 
-    def tearDown(self):
-        self.engine.dispose()
-        self.session.close()
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.dispose()
 
     def _query(self, q, **kwargs):
-        service = LookupService(self.session)
-        return service.query(q, **kwargs)
+        return self.app.query('lookup', q, **kwargs)
 
     def test_lookup_point(self):
         result = self._query('45.548242, -122.672655')
@@ -28,3 +52,378 @@ class TestLookupService(unittest.TestCase):
         result = self._query('NE 9th and Holladay')
         self.assertIsInstance(result, LookupResult)
         self.assertEqual(result.name, 'NE 9th Ave & NE Holladay St')
+
+
+class RecordingSession:
+
+    """Records executed statements and returns canned results."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        value = self.results.pop(0)
+        return SimpleNamespace(first=lambda: value, scalar=lambda: value, scalars=lambda: value)
+
+
+class TestStatementCaching(unittest.TestCase):
+
+    def _check_statements(self, session1, session2):
+        self.assertEqual(len(session1.statements), len(session2.statements))
+        for statement1, statement2 in zip(session1.statements, session2.statements):
+            # Same cache key => compiled once
+            key1 = statement1._generate_cache_key()
+            key2 = statement2._generate_cache_key()
+            self.assertEqual(key1.key, key2.key)
+            # But with different values, which are extracted from each
+            # statement when it's executed
+            self.assertNotEqual(self._values(statement1), self._values(statement2))
+
+    def _values(self, statement):
+        return [param.value for param in statement._generate_cache_key().bindparams]
+
+    def _match_point(self, point):
+        street = SimpleNamespace(id=id(point), display_name='A St')
+        session = RecordingSession(None, street, wkb.dumps(point, hex=True))
+        result = LookupService(session).match_point(f'{point.y}, {point.x}')
+        self.assertEqual(result.geom, point)
+        self.assertIs(result.closest_object, street)
+        return session
+
+    def test_match_point(self):
+        session1 = self._match_point(Point(-122.6, 45.5))
+        session2 = self._match_point(Point(-122.7, 45.6))
+        self.assertEqual(len(session1.statements), 3)
+        self._check_statements(session1, session2)
+
+    def test_match_cross_streets(self):
+        session1 = RecordingSession([])
+        session2 = RecordingSession([])
+        self.assertIsNone(LookupService(session1).match_cross_streets('A St & B St'))
+        self.assertIsNone(LookupService(session2).match_cross_streets('C Ave & D Ave'))
+        self._check_statements(session1, session2)
+        values = self._values(session2.statements[0])
+        self.assertIn(r'\mC Ave\M', values)
+        self.assertIn(r'\mD Ave\M', values)
+
+
+class TestMatchLocally(unittest.TestCase):
+
+    def setUp(self):
+        self.service = LookupService(None)
+        street = SimpleNamespace(id=1, name='A St')
+        self.point_result = LookupResult(
+            '45.5,-122.6', 'A St', Point(-122.6, 45.5), street, 'A St', 'byCycle point')
+        self.place_result = LookupResult(
+            'Cafe', 'Cafe', Point(-122.7, 45.6), street, 'Cafe', 'byCycle place')
+        matchers = {
+            'match_id': None,
+            'match_cross_streets': None,
+            'match_address': None,
+            'match_place': self.place_result,
+        }
+        for name, result in matchers.items():
+            patcher = mock.patch.object(self.service, name, return_value=result)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(self.service, 'match_point', side_effect=self._match_point)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _match_point(self, s):
+        return self.point_result if s == '45.5,-122.6' else None
+
+    def test_point_hint_is_used_before_address_and_place(self):
+        result = self.service.match_locally('Cafe', point_hint='45.5,-122.6')
+        self.assertIs(result, self.point_result)
+        self.assertEqual(result.original_input, 'Cafe')
+        self.assertEqual(result.normalized_input, 'A St')
+        self.service.match_address.assert_not_called()
+        self.service.match_place.assert_not_called()
+
+    def test_place_is_matched_without_point_hint(self):
+        result = self.service.match_locally('Cafe')
+        self.assertIs(result, self.place_result)
+        self.service.match_address.assert_called_once_with('Cafe')
+        self.service.match_place.assert_called_once_with('Cafe')
+
+
+PlaceRow = namedtuple('PlaceRow', 'place similarity distance')
+
+
+class StubQuery:
+
+    """Returns canned rows regardless of filters, etc."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *args):
+        return self
+
+    order_by = limit = filter
+
+    def all(self):
+        return self.rows
+
+
+class TestMatchPlace(unittest.TestCase):
+
+    def setUp(self):
+        self.street = SimpleNamespace(id=1, name='A St')
+        self.rows = []
+        session = SimpleNamespace(query=lambda *args: StubQuery(self.rows))
+        self.service = LookupService(session)
+        point_result = SimpleNamespace(closest_object=self.street)
+        patcher = mock.patch.object(self.service, 'match_point', return_value=point_result)
+        self.match_point = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _add_place(self, name, similarity, x=-122.6, y=45.5):
+        place = SimpleNamespace(
+            name=name, geom=Point(x, y), category='amenity', type='cafe', address=None)
+        self.rows.append(PlaceRow(place, similarity, 0))
+
+    def test_address_is_skipped(self):
+        self._add_place('123 Main St Cafe', 1.0)
+        self.assertIsNone(self.service.match_place('123 Main St'))
+
+    def test_no_match(self):
+        self.assertIsNone(self.service.match_place('Nowhere'))
+
+    def test_single_match(self):
+        self._add_place('Cafe Uno', 0.6)
+        result = self.service.match_place(' Cafe  Uno ')
+        self.assertEqual(result.name, 'Cafe Uno')
+        self.assertEqual(result.geom, Point(-122.6, 45.5))
+        self.assertIs(result.closest_object, self.street)
+        self.assertEqual(result.attribution, 'byCycle place')
+        self.assertEqual(result.data['category'], 'amenity')
+        self.assertEqual(result.data['similarity'], 0.6)
+        self.match_point.assert_called_once_with('45.5,-122.6')
+
+    def test_exact_match_is_preferred(self):
+        self._add_place('Cafe Uno', 1.0)
+        self._add_place('Cafe Dos', 0.6)
+        result = self.service.match_place('Cafe Uno')
+        self.assertEqual(result.name, 'Cafe Uno')
+
+    def test_multiple_matches(self):
+        self._add_place('Cafe Uno', 0.7)
+        self._add_place('Cafe Dos', 0.6)
+        with self.assertRaises(MultipleLookupResultsError) as context:
+            self.service.match_place('Cafe')
+        names = [choice.name for choice in context.exception.choices]
+        self.assertEqual(names, ['Cafe Uno', 'Cafe Dos'])
+
+
+STREET_TYPE_MAP = {'street': 'ST', 'st': 'ST'}
+
+
+class TestMatchAddress(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = make_engine(Address.__table__, Street.__table__)
+        self.addCleanup(self.engine.dispose)
+        self.session = get_session_factory(self.engine)()
+        self.addCleanup(self.session.close)
+        # N Main St runs north from 45.5 to 45.51
+        self.session.execute(Street.__table__.insert(), [
+            {'id': 1, 'name': 'N Main St', 'geom': LineString([(-122.6, 45.5), (-122.6, 45.505)])},
+            {'id': 2, 'name': 'N Main St', 'geom': LineString([(-122.6, 45.505), (-122.6, 45.51)])},
+            {'id': 3, 'name': 'N Main St', 'geom': LineString([(-122.0, 45.5), (-122.0, 45.51)])},
+        ])
+        # Even addresses are on the east side of the street and odd
+        # addresses on the west side
+        self.session.execute(Address.__table__.insert(), [
+            self._address(1, '100', 100, -122.5999, 45.501),
+            self._address(2, '200', 200, -122.5999, 45.509),
+            self._address(3, '149', 149, -122.6001, 45.5011),
+            self._address(4, '301', 301, -122.6001, 45.5095),
+        ])
+        self.street = SimpleNamespace(id=1, name='N Main St')
+        self.service = LookupService(self.session, street_type_map=STREET_TYPE_MAP)
+        point_result = SimpleNamespace(closest_object=self.street)
+        patcher = mock.patch.object(self.service, 'match_point', return_value=point_result)
+        self.match_point = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _address(self, id, house_number, number, x, y):
+        return {
+            'id': id, 'house_number': house_number, 'number': number, 'street': 'N Main St',
+            'geom': Point(x, y),
+        }
+
+    def test_non_address_is_skipped(self):
+        self.assertIsNone(self.service.match_address('N Main St'))
+
+    def test_exact_match(self):
+        result = self.service.match_address('100 North Main Street')
+        self.assertEqual(result.name, '100 N Main St')
+        self.assertEqual(result.geom, Point(-122.5999, 45.501))
+        self.assertIs(result.closest_object, self.street)
+        self.assertEqual(result.attribution, 'byCycle address')
+
+    def test_exact_match_prefers_same_house_number(self):
+        self.session.execute(
+            Address.__table__.insert(), self._address(5, '200A', 200, -122.5999, 45.5091))
+        result = self.service.match_address('200a North Main St, Portland')
+        self.assertEqual(result.name, '200A N Main St')
+        self.assertEqual(result.geom, Point(-122.5999, 45.5091))
+        result = self.service.match_address('200 North Main St')
+        self.assertEqual(result.geom, Point(-122.5999, 45.509))
+
+    def test_interpolation_between_neighbors(self):
+        # Interpolated between 100 and 200 since they're on the same
+        # side of the street; 149 is closer but on the other side
+        result = self.service.match_address('150 n main st')
+        self.assertEqual(result.name, '150 n main St')
+        self.assertAlmostEqual(result.geom.x, -122.6)
+        self.assertAlmostEqual(result.geom.y, 45.505)
+        self.assertIn(result.closest_object.id, (1, 2))
+        self.match_point.assert_not_called()
+
+    def test_interpolation_falls_back_to_other_side(self):
+        # There's no even address above 250, so the nearest addresses
+        # on either side of the street (200 and 301) are used
+        result = self.service.match_address('250 N Main St')
+        self.assertAlmostEqual(result.geom.y, 45.509 + (45.5095 - 45.509) * 50 / 101)
+
+    def test_no_neighbor_above(self):
+        self.assertIsNone(self.service.match_address('401 N Main St'))
+
+    def test_unknown_street(self):
+        self.assertIsNone(self.service.match_address('150 S Main St'))
+
+    def test_street_too_far_from_neighbors(self):
+        self.service.config['address_interpolation_max_distance'] = 1
+        self.assertIsNone(self.service.match_address('150 N Main St'))
+
+    def test_neighbor_parity(self):
+        lower, upper = self.service._find_address_neighbors(
+            self.session.query(Address), 151)
+        self.assertEqual((lower.house_number, upper.house_number), ('149', '301'))
+        lower, upper = self.service._find_address_neighbors(
+            self.session.query(Address), 150)
+        self.assertEqual((lower.house_number, upper.house_number), ('100', '200'))
+
+
+class StubMapboxHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.client_address))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+        body = json.dumps({'features': [{'relevance': 1, 'place_name': self.path}]})
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestMapboxGeocoding(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubMapboxHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self.server.delay = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.server.server_address
+        self.config = {
+            'mapbox_access_token': 'test-token',
+            'mapbox_host': f'http://{host}:{port}',
+            'geocode_cache': LRUCache(),
+            'persistent_geocode_cache': False,
+        }
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_geocoder_is_reused(self):
+        service = LookupService(None, **self.config)
+        features = service.geocode_via_mapbox('123 Main St')
+        self.assertEqual(len(features), 1)
+        service.geocode_via_mapbox('456 Main St')
+        requests = self.server.requests
+        self.assertEqual(len(requests), 2)
+        self.assertIn('access_token=test-token', requests[0][0])
+        # Same client address => connection was kept alive
+        self.assertEqual(requests[0][1], requests[1][1])
+
+    def test_geocoder_results_are_cached(self):
+        service = LookupService(None, **self.config)
+        features = service.geocode_via_mapbox('123 Main St')
+        cached_features = service.geocode_via_mapbox(' 123  main st')
+        self.assertEqual(features, cached_features)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_persistent_cache(self):
+        table = GeocodeCache.__table__
+        engine = make_engine(table)
+        self.addCleanup(engine.dispose)
+        waypoints = ['123 Main St', '456 Main St']
+        options = {'bbox': None, 'center': None}
+        with engine.begin() as connection:
+            connection.execute(table.insert(), [
+                {'key': GeocodeCache.make_key(w, **options), 'query': w, 'data': [{'w': w}],
+                 'hits': 0}
+                for w in waypoints
+            ])
+        bind_threads = []
+
+        def get_bind():
+            bind_threads.append(threading.get_ident())
+            return engine
+
+        session = SimpleNamespace(get_bind=get_bind)
+        config = dict(
+            self.config, persistent_geocode_cache=True, record_geocode_cache_hits=True,
+            geocode_cache_ttl=None)
+        service = RouteService(session, **config)
+        all_features = service.geocode_waypoints(waypoints)
+        self.assertEqual(all_features, [[{'w': w}] for w in waypoints])
+        self.assertEqual(self.server.requests, [])
+        # The session is only used in this thread
+        self.assertEqual(bind_threads, [threading.get_ident()])
+        hits = engine.execute(select([table.c.query, table.c.hits]).order_by(table.c.query))
+        self.assertEqual([tuple(row) for row in hits], [('123 Main St', 1), ('456 Main St', 1)])
+
+    def test_persistent_cache_reads_from_replica(self):
+        primary, replica = make_engine(), make_engine()
+        self.addCleanup(primary.dispose)
+        self.addCleanup(replica.dispose)
+        set_replica_router(primary, ReplicaRouter(primary, [replica]))
+        session = SimpleNamespace(get_bind=lambda: primary)
+        service = LookupService(session, persistent_geocode_cache=True)
+        self.assertEqual(service.get_geocode_cache_binds(), (replica, primary))
+        service = LookupService(session, persistent_geocode_cache=False)
+        self.assertIsNone(service.get_geocode_cache_binds())
+
+    def test_waypoints_are_geocoded_concurrently(self):
+        self.server.delay = 0.1
+        service = RouteService(None, **self.config)
+        waypoints = ['123 Main St', '456 Main St', '789 Main St']
+        all_features = service.geocode_waypoints(waypoints)
+        self.assertEqual(len(all_features), 3)
+        for w, features in zip(waypoints, all_features):
+            self.assertIn(w.replace(' ', '%20'), features[0]['place_name'])
+        self.assertEqual(self.server.max_in_flight, 3)
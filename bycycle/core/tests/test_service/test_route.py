@@ -1,23 +1,55 @@
+import json
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
 import unittest
+from types import SimpleNamespace
 
-from bycycle.core.model import get_engine, get_session_factory, Route
+import numpy as np
+
+import shapely
+from shapely import wkb
+
+from bycycle.core.edgestore import EdgeStore
+from bycycle.core.geometry import (
+    LazyGeometry,
+    LineString,
+    Point,
+    decode_polyline,
+    length_in_meters,
+)
+from bycycle.core.geometry.base import geometry_mapping
+from bycycle.core.app import App
+from bycycle.core.model import Edge, Intersection, LookupResult, NodeEdge, Route, Street
+from bycycle.core.model.lookup import DetachedObject
 from bycycle.core.service.route import RouteService
+from bycycle.core.service.route.directions import (
+    RouteEdges,
+    build_directions,
+    calculate_ways_to_turn,
+    get_directions_from_bearings,
+)
+from bycycle.core.service.route.exc import MultipleRouteLookupResultsError, NoRouteError
+from bycycle.core.util import SingleFlight
+
+from ..sqlite import make_engine
 
 
 class Test_A_Route(unittest.TestCase):
 
-    def setUp(self):
-        self.engine = get_engine()
-        self.session_factory = get_session_factory(self.engine)
-        self.session = self.session_factory()
+    @classmethod
+    def setUpClass(cls):
+        cls.app = App()
 
-    def tearDown(self):
-        self.engine.dispose()
-        self.session.close()
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.dispose()
 
     def _query(self, q, **kwargs):
-        service = RouteService(self.session)
-        return service.query(q, **kwargs)
+        return self.app.query('route', q, **kwargs)
 
     def test_should_have_specific_turns(self):
         q = 'NE 7th Ave & NE Schuyler St', '45.53649, -122.65827'
@@ -78,5 +110,449 @@ class Test_A_Route(unittest.TestCase):
         self.assertEqual(route.start.id, route.end.id)
 
 
+def make_street(id, name, start_node_id, end_node_id, coords, highway='residential'):
+    return SimpleNamespace(
+        id=id,
+        name=name,
+        description=None,
+        highway=highway,
+        start_node_id=start_node_id,
+        end_node_id=end_node_id,
+        geom=LineString(coords),
+    )
+
+
+class TestMakeDirectionsWithEdgeStore(unittest.TestCase):
+
+    """Make directions without touching the database.
+
+    The route goes north on A St from node 1 to node 3 then turns right
+    onto B Ave. Edge 11 is traversed in reverse.
+
+                    15 (E St)
+                    |
+          3 ---12---4
+          |
+          11
+          |
+     14 --2
+          |
+          10
+          |
+          1
+
+    """
+
+    streets = [
+        make_street(10, 'A St', 1, 2, [(0, 0), (0, 0.001)]),
+        make_street(11, 'A St', 3, 2, [(0, 0.002), (0, 0.001)]),
+        make_street(12, 'B Ave', 3, 4, [(0, 0.002), (0.001, 0.002)]),
+        make_street(14, 'D St', 5, 2, [(-0.001, 0.001), (0, 0.001)]),
+        make_street(15, 'E St', 4, 6, [(0.001, 0.002), (0.001, 0.003)]),
+    ]
+
+    def setUp(self):
+        self.edge_store = EdgeStore.build(self.streets)
+
+    def _make_directions(self, edge_store):
+        service = RouteService(None, edge_store=edge_store)
+        return service.make_directions([1, 2, 3, 4], [10, 11, 12], {})
+
+    def test_directions(self):
+        directions, linestring, distance = self._make_directions(self.edge_store)
+        self.assertEqual([d['turn'] for d in directions], ['north', 'right'])
+        self.assertEqual([d['name'] for d in directions], ['A St', 'B Ave'])
+        self.assertEqual([d['toward'] for d in directions], ['D St', 'E St'])
+        self.assertEqual([d['edge_ids'] for d in directions], [[10, 11], [12]])
+        self.assertEqual(
+            list(linestring.coords), [(0, 0), (0, 0.001), (0, 0.002), (0.001, 0.002)])
+        expected_distance = sum(length_in_meters(s.geom) for s in self.streets[:3])
+        self.assertAlmostEqual(distance['meters'], expected_distance)
+
+    def test_toward_streets_match_database(self):
+        # Node 4 has C St ending at it in addition to B Ave ending at it
+        # and E St starting at it
+        streets = self.streets + [make_street(13, 'C St', 7, 4, [(0.002, 0.001), (0.001, 0.002)])]
+        edge_store = EdgeStore.build(streets)
+        engine = make_engine(Street.__table__, NodeEdge.__table__)
+        self.addCleanup(engine.dispose)
+        with engine.begin() as connection:
+            connection.execute(Street.__table__.insert(), [{
+                'id': s.id, 'name': s.name, 'start_node_id': s.start_node_id,
+                'end_node_id': s.end_node_id, 'geom': s.geom,
+            } for s in streets])
+            NodeEdge.populate(connection)
+
+        def make_directions(edge_store):
+            service = RouteService(engine, edge_store=edge_store)
+            indexes = self.edge_store.index_of(np.array([10, 11, 12]))
+            edges = RouteEdges.from_store(self.edge_store, indexes)
+            directions, coords, distance = build_directions(edges, [1, 2, 3, 4])
+            return service.finish_directions(directions, coords, distance, edge_store)[0]
+
+        directions = make_directions(None)
+        self.assertEqual([d['toward'] for d in directions], ['D St', 'C St'])
+        self.assertEqual(make_directions(edge_store), directions)
+
+    def test_street_names_of_loop(self):
+        streets = self.streets + [
+            make_street(16, 'F Loop', 6, 6, [(0.001, 0.003), (0.002, 0.003), (0.001, 0.003)]),
+        ]
+        edge_store = EdgeStore.build(streets)
+        self.assertEqual(edge_store.get_street_names(6), ['E St', 'F Loop'])
+
+    def test_save_and_load(self):
+        fd, path = tempfile.mkstemp(suffix='.npz')
+        os.close(fd)
+        try:
+            self.edge_store.save(path)
+            edge_store = EdgeStore.load(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(
+            self._make_directions(edge_store)[0],
+            self._make_directions(self.edge_store)[0])
+
+    def test_read_only(self):
+        with self.assertRaises(ValueError):
+            self.edge_store.ids[0] = 0
+
+
+class TestSplitWay(unittest.TestCase):
+
+    def test_split_ways(self):
+        start_node = Intersection(id=1, geom=Point(0, 0))
+        end_node = Intersection(id=2, geom=Point(0, 0.002))
+        way = Street(
+            id=10, name='A St', highway='residential', geom=LineString([(0, 0), (0, 0.002)]),
+            start_node_id=1, start_node=start_node, end_node_id=2, end_node=end_node,
+            base_cost=300.0, _meters=200.0)
+        service = RouteService(None)
+        *_, way1, way2, annex_edges = service.split_way(way, Point(0, 0.0005), -1, -2, -3)
+        self.assertIsInstance(way1, Edge)
+        self.assertIsInstance(way2, Edge)
+        self.assertEqual((way1.start_node_id, way1.end_node_id), (1, -1))
+        self.assertEqual((way2.start_node_id, way2.end_node_id), (-1, 2))
+        self.assertEqual(way.meters, 200.0)
+        self.assertAlmostEqual(way1.meters, length_in_meters(way1.geom))
+        self.assertAlmostEqual(way2.meters, length_in_meters(way2.geom))
+        self.assertAlmostEqual(way1.base_cost, 300.0 * way1.meters / 200.0)
+        self.assertAlmostEqual(way2.base_cost, 300.0 * way2.meters / 200.0)
+
+
+class TestRouteGeometryOptions(unittest.TestCase):
+
+    def _make_route(self, **kwargs):
+        start = SimpleNamespace(id='1', name='A')
+        end = SimpleNamespace(id='2', name='B')
+        linestring = LineString([(-122.6, 45.5), (-122.59999, 45.5005), (-122.6, 45.501)])
+        service = RouteService(None)
+        return Route(start, end, [], linestring, service.distance_dict(0), **kwargs)
+
+    def test_default(self):
+        route = self._make_route()
+        data = route.__json__()
+        self.assertIn('linestring', data)
+        self.assertNotIn('polyline', data)
+
+    def test_polyline(self):
+        route = self._make_route(polyline_precision=6)
+        data = route.__json__()
+        self.assertNotIn('linestring', data)
+        self.assertEqual(data['polyline_precision'], 6)
+        self.assertEqual(
+            decode_polyline(data['polyline'], 6), list(route.linestring.coords))
+
+    def test_bounds(self):
+        bounds = (-122.7, 45.4, -122.5, 45.6)
+        route = self._make_route(bounds=bounds)
+        self.assertEqual(route.bounds, bounds)
+
+
+def to_json(obj):
+    return json.dumps(obj.__json__(), default=geometry_mapping, sort_keys=True)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def make_route(self, *args):
+        self.calls.append(args)
+        self.release.wait(5)
+        start = self.make_result(1, 'A St & B St', (0, 0))
+        end = self.make_result(2, 'C St & D St', (0, 1))
+        return Route(start, end, [], LineString([(0, 0), (0, 1)]), {'meters': 1})
+
+    def make_result(self, id, name, coords):
+        geom = LazyGeometry(wkb.dumps(Point(coords)), Point)
+        intersection = Intersection(id=id, geom=geom, _name=name)
+        return LookupResult(name, name, geom, intersection, name)
+
+    def run_concurrently(self, *funcs):
+        results = [None] * len(funcs)
+
+        def run(i, func):
+            try:
+                results[i] = func()
+            except Exception as exc:
+                results[i] = exc
+
+        threads = [threading.Thread(target=run, args=item) for item in enumerate(funcs)]
+        for thread in threads:
+            thread.start()
+            # Wait for the first call to start
+            time.sleep(0.05)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_coalesce_queries(self):
+        service = RouteService(None, single_flight=SingleFlight())
+        service.find_routes = self.make_route
+        results = self.run_concurrently(
+            lambda: service.query(['A St and B St', 'C St and D St']),
+            lambda: service.query([' a st  and b st', 'C ST and D St ']),
+            lambda: service.query(['A St and B St', 'C St and D St'], simplify=1),
+        )
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.calls[0][0], ['A St and B St', 'C St and D St'])
+        self.assertIs(results[1], results[0])
+        self.assertIsNot(results[2], results[0])
+        # Later queries aren't coalesced with completed queries
+        service.query(['A St and B St', 'C St and D St'])
+        self.assertEqual(len(self.calls), 3)
+
+    def test_shared_routes_are_detached(self):
+        self.release.set()
+        route = self.make_route()
+        service = RouteService(None, single_flight=SingleFlight())
+        service.find_routes = lambda *args: route
+        shared_route = service.query(['A St and B St', 'C St and D St'])
+        self.assertIsNot(shared_route, route)
+        for result in (shared_route.start, shared_route.end):
+            self.assertIsInstance(result.closest_object, DetachedObject)
+            self.assertIs(type(result.geom), shapely.geometry.Point)
+        self.assertEqual(to_json(shared_route), to_json(route))
+        self.assertEqual(shared_route.start.closest_object.name, 'A St & B St')
+        # Original route still references the database objects
+        self.assertIsInstance(route.start.closest_object, Intersection)
+        self.assertEqual(to_json(pickle.loads(pickle.dumps(shared_route))), to_json(shared_route))
+
+    def test_shared_errors_are_detached(self):
+        self.release.set()
+        route = self.make_route()
+        service = RouteService(None, single_flight=SingleFlight())
+
+        def find_routes(*args):
+            raise MultipleRouteLookupResultsError(choices=[route.start, [route.end, route.end]])
+
+        service.find_routes = find_routes
+        with self.assertRaises(MultipleRouteLookupResultsError) as context:
+            service.query(['A St and B St', 'C St and D St'])
+        start, (end, _) = context.exception.choices
+        self.assertIsInstance(start.closest_object, DetachedObject)
+        self.assertIsInstance(end.closest_object, DetachedObject)
+
+        def find_routes(*args):
+            raise NoRouteError(route.start, route.end)
+
+        service.find_routes = find_routes
+        with self.assertRaises(NoRouteError) as context:
+            service.query(['A St and B St', 'C St and D St'])
+        self.assertIsInstance(context.exception.start.closest_object, DetachedObject)
+        self.assertIsInstance(context.exception.end.closest_object, DetachedObject)
+
+    def test_share_exception(self):
+        def find_routes(*args):
+            route = self.make_route(*args)
+            raise NoRouteError(route.start, route.end)
+
+        single_flight = SingleFlight()
+        results = self.run_concurrently(
+            lambda: single_flight.do('key', find_routes),
+            lambda: single_flight.do('key', find_routes),
+        )
+        self.assertEqual(len(self.calls), 1)
+        self.assertIsInstance(results[0], NoRouteError)
+        self.assertIs(results[1], results[0])
+
+    def test_coalesce_across_processes(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            # Separate instances don't share in-process state, like
+            # instances in different processes
+            single_flights = SingleFlight(lock_dir), SingleFlight(lock_dir)
+            results = self.run_concurrently(
+                lambda: single_flights[0].do(('route', 'A', 'B'), self.make_route),
+                lambda: single_flights[1].do(('route', 'A', 'B'), self.make_route),
+            )
+            self.assertEqual(len(self.calls), 1)
+            self.assertIsNot(results[1], results[0])
+            self.assertEqual(to_json(results[1]), to_json(results[0]))
+            single_flights[1].do(('route', 'A', 'B'), self.make_route)
+            self.assertEqual(len(self.calls), 2)
+
+
+def calculate_way_to_turn(old_bearing, new_bearing):
+    """Get turn between two bearings (for comparison)."""
+    diff = new_bearing - old_bearing
+    while diff < 0:
+        diff += 360
+    while diff > 360:
+        diff -= 360
+    if 0 <= diff < 10:
+        return 'straight'
+    elif 10 <= diff <= 170:
+        return 'right'
+    elif 170 < diff < 190:
+        return 'back'
+    elif 190 <= diff <= 350:
+        return 'left'
+    return 'straight'
+
+
+def get_direction_from_bearing(bearing):
+    """Translate bearing to cardinal direction (for comparison)."""
+    directions = (
+        'north', 'northeast', 'east', 'southeast', 'south', 'southwest', 'west', 'northwest')
+    return directions[int((bearing + 22.5) / 45) % 8]
+
+
+def make_directions_in_loop(edges, node_ids):
+    """Build directions one edge at a time (for comparison)."""
+    stretches = []
+    prev_name = None
+    points = []
+    total_distance = 0
+    for edge, next_node_id in zip(edges, node_ids[1:]):
+        reverse = edge.start_node_id == next_node_id
+        edge_points = edge.geom.coords[::-1] if reverse else edge.geom.coords
+        start_bearing, end_bearing = edge.get_bearings(reverse)
+        points.extend(edge_points[:-1])
+        total_distance += edge.meters
+        if edge.name and edge.name == prev_name:
+            stretch = stretches[-1]
+            stretch['edge_ids'].append(edge.id)
+            stretch['distance'] += edge.meters
+            stretch['end_bearing'] = end_bearing
+        else:
+            stretches.append({
+                'name': edge.display_name,
+                'type': edge.highway,
+                'toward': next_node_id if next_node_id > -1 else None,
+                'distance': edge.meters,
+                'point': Point(*edge_points[0]),
+                'edge_ids': [edge.id],
+                'start_bearing': start_bearing,
+                'end_bearing': end_bearing,
+            })
+            prev_name = edge.name
+    points.append(edge_points[-1])
+    turns = []
+    for prev_stretch, stretch in zip([None] + stretches[:-1], stretches):
+        if prev_stretch is None:
+            turns.append(get_direction_from_bearing(stretch['start_bearing']))
+        else:
+            turns.append(calculate_way_to_turn(
+                prev_stretch['end_bearing'], stretch['start_bearing']))
+    directions = []
+    for stretch, turn in zip(stretches, turns):
+        del stretch['start_bearing'], stretch['end_bearing']
+        directions.append(dict(stretch, turn=turn))
+    return directions, points, total_distance
+
+
+class TestTurns(unittest.TestCase):
+
+    bearings = np.arange(0, 360, 2.5)
+
+    def test_calculate_ways_to_turn(self):
+        old_bearings = np.repeat(self.bearings, len(self.bearings))
+        new_bearings = np.tile(self.bearings, len(self.bearings))
+        ways = calculate_ways_to_turn(old_bearings, new_bearings)
+        expected = [calculate_way_to_turn(*b) for b in zip(old_bearings, new_bearings)]
+        self.assertEqual(ways.tolist(), expected)
+        ways = calculate_ways_to_turn(np.array([90, 90, 90, 90, 350]), np.array([95, 180, 270, 0, 5]))
+        self.assertEqual(ways.tolist(), ['straight', 'right', 'back', 'left', 'right'])
+
+    def test_calculate_ways_to_turn_with_invalid_bearing(self):
+        with self.assertRaises(ValueError):
+            calculate_ways_to_turn(np.array([0, 0]), np.array([90, 400]))
+
+    def test_get_directions_from_bearings(self):
+        directions = get_directions_from_bearings(self.bearings)
+        self.assertEqual(directions.tolist(), [get_direction_from_bearing(b) for b in self.bearings])
+        directions = get_directions_from_bearings(np.array([0, 22.5, 90, 200, 337.4, 359]))
+        self.assertEqual(
+            directions.tolist(), ['north', 'northeast', 'east', 'south', 'northwest', 'north'])
+
+    def test_route_service_methods(self):
+        service = RouteService(None)
+        for old_bearing, new_bearing in ((90, 95), (90, 180), (90, 270), (90, 0), (350, 5)):
+            self.assertEqual(
+                service.calculate_way_to_turn(old_bearing, new_bearing),
+                calculate_way_to_turn(old_bearing, new_bearing))
+        for bearing in self.bearings:
+            self.assertEqual(
+                service.get_direction_from_bearing(bearing), get_direction_from_bearing(bearing))
+        self.assertEqual(service.get_bearing((0, 0), (1, 0)), 90)
+
+
+class TestBuildDirections(unittest.TestCase):
+
+    """Compare vectorized directions to directions built in a loop."""
+
+    def setUp(self):
+        rand = random.Random(42)
+        names = ['A St', 'A St', None, 'B Ave', 'B Ave', 'B Ave', 'A St', None, None, 'C St']
+        x, y = -122.6, 45.5
+        streets = []
+        for i in range(60):
+            coords = [(x, y)]
+            for _ in range(rand.randint(1, 3)):
+                x += rand.uniform(-0.001, 0.001)
+                y += rand.uniform(-0.001, 0.001)
+                coords.append((x, y))
+            start_node_id, end_node_id = i + 1, i + 2
+            if i % 3 == 1:
+                # Traversed in reverse
+                start_node_id, end_node_id = end_node_id, start_node_id
+                coords.reverse()
+            streets.append(Street(
+                id=100 + i, name=names[i % len(names)], highway='residential',
+                start_node_id=start_node_id, end_node_id=end_node_id,
+                geom=LineString(coords)))
+        self.streets = streets
+        self.node_ids = list(range(1, len(streets) + 2))
+        self.node_ids[-1] = -2
+
+    def _check(self, route_edges):
+        expected = make_directions_in_loop(self.streets, self.node_ids)
+        directions, coords, total_distance = build_directions(route_edges, self.node_ids)
+        self.assertEqual(directions, expected[0])
+        self.assertEqual([tuple(c) for c in coords.tolist()], expected[1])
+        self.assertEqual(total_distance, expected[2])
+
+    def test_from_edges(self):
+        self._check(RouteEdges.from_edges(self.streets))
+
+    def test_from_store(self):
+        edge_store = EdgeStore.build(self.streets)
+        indexes = edge_store.index_of([s.id for s in self.streets])
+        self._check(RouteEdges.from_store(edge_store, indexes))
+
+    def test_concat(self):
+        edge_store = EdgeStore.build(self.streets[1:-1])
+        indexes = edge_store.index_of([s.id for s in self.streets[1:-1]])
+        self._check(RouteEdges.concat([
+            RouteEdges.from_edges(self.streets[:1]),
+            RouteEdges.from_store(edge_store, indexes),
+            RouteEdges.from_edges(self.streets[-1:]),
+        ]))
+
+
 if __name__ == '__main__':
     unittest.main()
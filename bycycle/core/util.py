@@ -1,5 +1,14 @@
+import hashlib
+import logging
+import os
+import pickle
 import time
-from threading import Event, Thread
+from collections import OrderedDict
+from pathlib import Path
+from threading import Event, Lock, Thread
+
+
+log = logging.getLogger(__name__)
 
 
 class TimerError(Exception):
@@ -108,3 +117,206 @@ class PeriodicRunner(Thread):
 
     def stop(self):
         self._stopped.set()
+
+
+class LRUCache:
+
+    """A simple, thread safe, least-recently-used cache.
+
+    Items are evicted when the cache grows beyond ``max_size`` or, if a
+    ``ttl`` (in seconds) is specified, when they become too old.
+
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._items[key]
+                return default
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Snapshot:
+
+    """Holds a shared, read-only value that can be swapped atomically.
+
+    This is for process-wide structures that are read by many threads
+    and replaced only occasionally (e.g., on reload). Reading is a
+    single attribute lookup, so readers never take a lock. To replace
+    the value, a new value is built completely and then swapped in;
+    threads that got the old value keep using it until they're done.
+
+    Values must not be modified after they're published.
+
+    If a ``loader`` is specified, it's called to create the value on
+    first access and by :meth:`reload`. Loading is serialized by a lock
+    (only writers take it), so the value is created only once.
+
+    """
+
+    def __init__(self, value=None, loader=None):
+        self.value = value
+        self.loader = loader
+        self._lock = Lock()
+
+    def get(self):
+        value = self.value
+        if value is None and self.loader is not None:
+            with self._lock:
+                value = self.value
+                if value is None:
+                    value = self.value = self.loader()
+        return value
+
+    def swap(self, value):
+        """Publish new ``value`` and return the previous value."""
+        with self._lock:
+            old_value, self.value = self.value, value
+        return old_value
+
+    def reload(self):
+        """Create a new value with the loader and publish it.
+
+        Returns:
+            The previous value
+
+        """
+        with self._lock:
+            value = self.loader()
+            old_value, self.value = self.value, value
+        return old_value
+
+
+class SingleFlight:
+
+    """Coalesces concurrent calls that have the same key.
+
+    The first caller for a key (the leader) runs the function; callers
+    that arrive while it's running wait for it and get the same result
+    (or exception) instead of running the function again. Once the call
+    completes, the next caller for the key runs the function again, so
+    results aren't cached.
+
+    If a ``lock_dir`` is specified, calls are also coalesced across
+    processes on the same host: the leader holds an exclusive lock on a
+    file in ``lock_dir`` while running the function and then writes
+    its pickled result to that file. Callers in other processes block
+    on the lock and use the result if it was written while they were
+    waiting. Exceptions aren't shared across processes; a waiting
+    process runs the function itself instead. Lock files are reused;
+    ``lock_dir`` can be cleaned periodically. This requires
+    :func:`fcntl.flock` (i.e., it's not supported on Windows).
+
+    Args:
+        lock_dir: Directory for lock files
+
+    """
+
+    def __init__(self, lock_dir=None):
+        self.lock_dir = Path(lock_dir) if lock_dir else None
+        self._calls = {}
+        self._lock = Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """Call ``func(*args, **kwargs)`` unless a call for ``key`` is
+        already in flight.
+
+        ``key`` must be hashable. When a ``lock_dir`` is used, its
+        ``repr`` must be stable across processes, and results must be
+        picklable.
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            call.done.wait()
+            if call.exc is not None:
+                raise call.exc
+            return call.result
+
+        try:
+            if self.lock_dir is None:
+                call.result = func(*args, **kwargs)
+            else:
+                call.result = self._do_with_lock_file(key, func, args, kwargs)
+        except BaseException as exc:
+            call.exc = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def _do_with_lock_file(self, key, func, args, kwargs):
+        import fcntl
+
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        path = self.lock_dir / f'{digest}.lock'
+        started_at = time.time_ns()
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+
+        with path.open('a+b') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                # Use the result if another process finished the call
+                # while this one was waiting for the lock
+                stat = os.fstat(fp.fileno())
+                if stat.st_size and stat.st_mtime_ns >= started_at:
+                    fp.seek(0)
+                    try:
+                        return pickle.load(fp)
+                    except Exception as exc:
+                        log.warning('Could not load result from %s: %s', path, exc)
+                result = func(*args, **kwargs)
+                fp.seek(0)
+                fp.truncate()
+                pickle.dump(result, fp, pickle.HIGHEST_PROTOCOL)
+                fp.flush()
+                return result
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+class _Call:
+
+    __slots__ = ('done', 'result', 'exc')
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.exc = None